@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_assessment.settings')
 
 application = get_asgi_application()
+
+# event streams stay open for minutes, they are served without a thread each
+from tasks.events import with_event_streams  # noqa: E402
+
+application = with_event_streams(application)
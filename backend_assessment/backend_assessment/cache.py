@@ -0,0 +1,40 @@
+"""
+Cache backends for CACHES. Django's LocMemCache already evicts the least
+recently used entries once it holds MAX_ENTRIES, FileBasedCache drops random
+ones instead, which LRUFileBasedCache fixes for caches shared by processes
+on one host.
+"""
+import os
+from django.core.cache.backends.filebased import FileBasedCache
+
+_missing = object()
+
+class LRUFileBasedCache(FileBasedCache):
+    """FileBasedCache that culls the least recently read or written entries"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            return default
+        # expiry is stored inside the file, the modification time only tracks use
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def last_used(fname):
+            try:
+                return os.stat(fname).st_mtime_ns
+            except FileNotFoundError:
+                return 0
+        for fname in sorted(filelist, key=last_used)[:num_entries // self._cull_frequency]:
+            self._delete(fname)
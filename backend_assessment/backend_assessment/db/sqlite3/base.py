@@ -0,0 +1,45 @@
+"""
+SQLite backend with the init_command and transaction_mode OPTIONS from Django
+5.1, for Django 5.0. On 5.1 and later settings use the stock backend, which
+reads the same OPTIONS.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.init_command = options.get('init_command')
+        self.transaction_mode = options.get('transaction_mode')
+        if self.transaction_mode is not None and self.transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'settings.DATABASES[...]["OPTIONS"]["transaction_mode"] must be one of {", ".join(TRANSACTION_MODES)}.'
+            )
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # ours, sqlite3.connect() doesn't know them
+        kwargs.pop('init_command', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            for statement in self.init_command.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            # IMMEDIATE takes the write lock up front, a deferred transaction that
+            # reads before writing fails right away with "database is locked"
+            # when another connection got there first, busy_timeout or not
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .db.profiles import database_profile
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -75,12 +78,27 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # takes the user from the token claims instead of loading it on every request
+        'tasks.authentication.CachedStatelessJWTAuthentication',
+    ),
+    # DRF's JSON renderer and parser, with orjson when it is installed, see tasks/renderers.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'tasks.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'tasks.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
 
 MIDDLEWARE = [
+    # first, so its timings cover the other middleware too
+    'tasks.performance.PerformanceMiddleware',
+    # second, so the sizes PerformanceMiddleware records are the compressed ones
+    'tasks.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -114,12 +132,75 @@ WSGI_APPLICATION = 'backend_assessment.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# DATABASE_PROFILE picks sqlite (default), sqlite-plain or postgresql, see
+# backend_assessment/db/profiles.py for what each sets and reads
 DATABASES = {
+    'default': database_profile(os.environ, BASE_DIR),
+}
+
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # list responses, see tasks/response_cache.py. Entries are keyed by the
+    # collection versions in the database, so a per-process cache is never
+    # stale, only colder. LocMemCache evicts the least recently used entries
+    # past MAX_ENTRIES; to share the entries between processes use
+    # backend_assessment.cache.LRUFileBasedCache with a directory LOCATION, or
+    # django.core.cache.backends.redis.RedisCache with maxmemory-policy
+    # allkeys-lru on the server
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
+RESPONSE_CACHE_ALIAS = 'responses'
+
+# Home page counters are recounted at most this often (seconds), see tasks/statistics.py
+HOME_STATISTICS_TIMEOUT = 60
+
+# /api/sync/ returns at most this many change log entries per call, and its
+# tokens expire after SYNC_TOKEN_MAX_AGE seconds (run `manage.py prune_changes`
+# to drop log entries no token can reach anymore)
+SYNC_PAGE_SIZE = 500
+SYNC_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
+# /api/events/ streams, see tasks/events.py. Idle streams send a heartbeat every
+# EVENTS_HEARTBEAT seconds and end after EVENTS_STREAM_TIMEOUT seconds, clients
+# reconnect with Last-Event-ID. EVENTS_BROKER wakes up the streams of a user
+# after their changes commit: tasks.events.LocalBroker when a single process
+# serves the app, tasks.events.PollingBroker (polls the change log every
+# EVENTS_POLL_INTERVAL seconds) when several do
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_TIMEOUT = 60 * 30
+EVENTS_BROKER = 'tasks.events.LocalBroker'
+EVENTS_POLL_INTERVAL = 1
+
+# /api/tasks/export/ reads and writes tasks in chunks of this many rows
+EXPORT_CHUNK_SIZE = 2000
+
+# Seconds an account's active/password state is trusted by
+# tasks.authentication.CachedStatelessJWTAuthentication, other processes notice
+# a deactivated account at most this late
+AUTH_USER_STATE_TIMEOUT = 30
+AUTH_USER_STATE_MAX_ENTRIES = 10000
+
+# Request timings, see tasks/performance.py. Queries slower than
+# PERFORMANCE_SLOW_QUERY_MS (milliseconds) are logged with their SQL, and the
+# last PERFORMANCE_SAMPLES requests per route are kept for /api/performance/
+PERFORMANCE_SLOW_QUERY_MS = 100
+PERFORMANCE_SAMPLES = 1000
+
+# Responses of the task and label API smaller than this many bytes aren't
+# compressed, see tasks/compression.py
+COMPRESSION_MIN_SIZE = 1024
+
+# /tasks/stats/ reads per-label task counts from the Label.task_count counters
+# instead of counting the through table (`manage.py recount_labels` rebuilds them)
+TASK_STATS_LABEL_COUNTERS = True
 
 
 # Password validation
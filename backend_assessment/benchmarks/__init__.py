@@ -0,0 +1,7 @@
+"""
+Local benchmarks. Run them from backend_assessment/, e.g.
+
+    python -m benchmarks.serializers --tasks 10000
+
+Each script works on a throwaway test database, never on db.sqlite3.
+"""
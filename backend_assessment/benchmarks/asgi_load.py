@@ -0,0 +1,112 @@
+"""
+Load test the sync and async task list routes through the ASGI application,
+in process with simulated clients. Each client keeps one request in flight;
+slow clients take --client-delay seconds to send their request and again to
+read the response.
+
+    python -m benchmarks.asgi_load --clients 10 100 500 --client-delay 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import seed, setup, test_database
+
+
+class Client:
+    """Just enough of an ASGI server connection to send one request and read the response"""
+
+    def __init__(self, path, token, delay):
+        self.path, self.token, self.delay = path, token, delay
+        self.status = None
+        self.done = asyncio.Event()
+        self.received = False
+
+    def scope(self):
+        path, _, query = self.path.partition('?')
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {self.token}'.encode())],
+        }
+
+    async def receive(self):
+        if not self.received:
+            self.received = True
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect while the view runs
+        await self.done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif not message.get('more_body'):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            self.done.set()
+
+
+async def run_clients(application, path, token, clients, requests, delay):
+    latencies = []
+    errors = 0
+
+    async def worker(count):
+        nonlocal errors
+        for _ in range(count):
+            client = Client(path, token, delay)
+            start = time.perf_counter()
+            await application(client.scope(), client.receive, client.send)
+            latencies.append(time.perf_counter() - start)
+            errors += client.status != 200
+
+    start = time.perf_counter()
+    per_client, extra = divmod(requests, clients)
+    await asyncio.gather(*(worker(per_client + (i < extra)) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': quantiles[49] * 1000,
+        'p95_ms': quantiles[94] * 1000,
+        'p99_ms': quantiles[98] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--client-delay', type=float, default=0.05)
+    parser.add_argument('--tasks', type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.asgi import get_asgi_application
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database():
+        user, = seed(tasks_per_user=args.tasks)
+        token = str(RefreshToken.for_user(user).access_token)
+        application = get_asgi_application()
+
+        print(f'{args.requests} requests per run, page of 50 tasks, client delay {args.client_delay * 1000:.0f} ms')
+        for clients in args.clients:
+            for name, path in (('sync', '/api/tasks/?page_size=50'), ('async', '/api/async/tasks/?page_size=50')):
+                result = asyncio.run(run_clients(application, path, token, clients, args.requests, args.client_delay))
+                print(f'{clients:>5} clients  {name:<6} {result["rps"]:8.0f} req/s   '
+                      f'p50 {result["p50_ms"]:8.1f} ms   p95 {result["p95_ms"]:8.1f} ms   '
+                      f'p99 {result["p99_ms"]:8.1f} ms   errors {result["errors"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare requests per second with simplejwt's JWTAuthentication, which loads
+the User on every request, and tasks.authentication.CachedStatelessJWTAuthentication.
+
+    python -m benchmarks.auth --requests 2000
+"""
+import argparse
+
+from benchmarks.common import measure, seed, setup, summarize, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, setup_test_environment
+    from django.urls import resolve, reverse
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from tasks.authentication import CachedStatelessJWTAuthentication
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database():
+        user, = seed(labels_per_user=10, tasks_per_user=0)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        url = reverse('label-list')
+        # @api_view fixes the authentication classes when the view is defined
+        view = resolve(url).func.cls
+
+        def run():
+            for _ in range(args.requests):
+                client.get(url)
+
+        results = {}
+        for name, authentication in (('JWTAuthentication', JWTAuthentication),
+                                     ('stateless, cached', CachedStatelessJWTAuthentication)):
+            view.authentication_classes = [authentication]
+            client.get(url)
+            # steady state, the cached variant has loaded the account state by now
+            with CaptureQueriesContext(connection) as context:
+                client.get(url)
+            queries = len(context)
+            result = summarize(measure(run, repeat=args.repeat))
+            result['queries'] = queries
+            result['rps'] = args.requests / (result['median_ms'] / 1000)
+            results[name] = result
+
+    print(f'GET {url} x {args.requests}, in process')
+    for name, result in results.items():
+        print(f'{name:<20} {result["rps"]:8.0f} req/s   {result["queries"]} queries per request')
+    speedup = results['stateless, cached']['rps'] / results['JWTAuthentication']['rps']
+    print(f'speedup: {speedup:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_assessment.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database(name=None):
+    """
+    Create and migrate a throwaway database the way the test runner does.
+    SQLite test databases live in memory unless given a file name.
+    """
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed(users=1, labels_per_user=10, tasks_per_user=1000, labels_per_task=2,
+         description_length=200, batch_size=5000, password='benchmark'):
+    """Bulk insert users, labels and tasks, returns the users"""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from tasks.models import Label, Task, recount_label_tasks
+
+    through = Task.labels.through
+    rng = random.Random(1)
+    hashed = make_password(password)
+    created = User.objects.bulk_create([
+        User(username=f'bench{i}', password=hashed) for i in range(users)
+    ])
+    for user in created:
+        labels = Label.objects.bulk_create([
+            Label(name=f'Label {i}', owner=user) for i in range(labels_per_user)
+        ])
+        for start in range(0, tasks_per_user, batch_size):
+            count = min(batch_size, tasks_per_user - start)
+            tasks = Task.objects.bulk_create([
+                Task(
+                    title=f'Task {start + i}',
+                    description='x' * description_length,
+                    is_completed=rng.random() < 0.3,
+                    owner=user,
+                )
+                for i in range(count)
+            ])
+            through.objects.bulk_create([
+                through(task_id=task.pk, label_id=label.pk)
+                for task in tasks
+                for label in rng.sample(labels, min(labels_per_task, len(labels)))
+            ])
+        # bulk_create skips m2m_changed, which keeps Label.task_count
+        recount_label_tasks(Label.objects.filter(owner=user))
+    return created
+
+
+def measure(func, repeat=5, warmup=1):
+    """Run func repeatedly and return the wall times in seconds"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'min_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'max_ms': max(timings) * 1000,
+    }
@@ -0,0 +1,95 @@
+"""
+Stress concurrent writers: threads POST tasks to /api/tasks/ at the same time
+against a SQLite file, once per database profile (see
+backend_assessment/db/profiles.py). Reports writes per second and how many
+requests failed, e.g. with "database is locked".
+
+    python -m benchmarks.db_writers --writers 16 --requests 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import seed, setup, test_database
+
+
+def run_profile(args, path):
+    """Run the writers in this process, the profile comes from DATABASE_PROFILE"""
+    setup()
+    from django.db import connection, connections
+    from django.test.utils import setup_test_environment
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database(path):
+        users = seed(users=args.writers, tasks_per_user=args.tasks, labels_per_task=2)
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+        labels = [list(user.label_set.values_list('id', flat=True)[:2]) for user in users]
+        journal_mode = connection.cursor().execute('PRAGMA journal_mode').fetchone()[0]
+        start_line = threading.Barrier(args.writers + 1)
+        counts = {'ok': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def writer(token, label_ids):
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            start_line.wait()
+            ok = failed = 0
+            for i in range(args.requests):
+                response = client.post('/api/tasks/', {'title': f'Task {i}', 'labels': label_ids}, format='json')
+                if response.status_code == 201:
+                    ok += 1
+                else:
+                    failed += 1
+            connections.close_all()
+            with lock:
+                counts['ok'] += ok
+                counts['failed'] += failed
+
+        threads = [threading.Thread(target=writer, args=pair) for pair in zip(tokens, labels)]
+        for thread in threads:
+            thread.start()
+        start_line.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    return {'journal_mode': journal_mode, 'writes_per_second': counts['ok'] / elapsed, **counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='POSTs per writer')
+    parser.add_argument('--tasks', type=int, default=1000, help='existing tasks per writer')
+    parser.add_argument('--profiles', nargs='+', default=['sqlite-plain', 'sqlite', 'sqlite-wal'])
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args, args.worker)))
+        return
+
+    # settings are read once per process, so every profile gets its own
+    print(f'{args.writers} writers x {args.requests} POST /api/tasks/')
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            command = [sys.executable, '-m', 'benchmarks.db_writers', '--worker', os.path.join(directory, 'bench.sqlite3'),
+                       '--writers', str(args.writers), '--requests', str(args.requests), '--tasks', str(args.tasks)]
+            output = subprocess.run(command, env={**os.environ, 'DATABASE_PROFILE': profile},
+                                    capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile:<14} journal {result["journal_mode"]:<8} {result["writes_per_second"]:8.1f} writes/s   '
+              f'{result["ok"]} ok   {result["failed"]} failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Open many idle /api/events/ streams through the ASGI application, in process,
+and report what they cost while idle (memory, threads) and how long a change
+takes to reach every stream of its owner.
+
+    python -m benchmarks.events --connections 5000 --users 500 --changes 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import seed, setup, test_database
+
+
+class Stream:
+    """Just enough of an ASGI server connection to hold an event stream open"""
+
+    def __init__(self, token):
+        self.token = token
+        self.status = None
+        self.opened = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.received = False
+        self.events = 0
+        self.changed = asyncio.Event()
+
+    def scope(self):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/events/', 'raw_path': b'/api/events/', 'query_string': b'',
+            'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [
+                (b'host', b'testserver'), (b'accept', b'text/event-stream'),
+                (b'authorization', f'Bearer {self.token}'.encode()),
+            ],
+        }
+
+    async def receive(self):
+        if not self.received:
+            self.received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message.get('body', b'').startswith(b'retry:'):
+            self.opened.set()
+        elif b'\nevent: ' in b'\n' + message.get('body', b''):
+            self.events += 1
+            self.changed.set()
+
+
+async def run(application, users, tokens, args):
+    from asgiref.sync import sync_to_async
+    from tasks.events import get_broker
+    from tasks.models import Task
+
+    threads = threading.active_count()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = {user.id: [] for user in users}
+    tasks = []
+    start = time.perf_counter()
+    for i in range(args.connections):
+        user = users[i % len(users)]
+        stream = Stream(tokens[user.id])
+        streams[user.id].append(stream)
+        tasks.append(asyncio.create_task(application(stream.scope(), stream.receive, stream.send)))
+    everyone = [stream for owned in streams.values() for stream in owned]
+    await asyncio.gather(*(stream.opened.wait() for stream in everyone))
+    opened = time.perf_counter() - start
+    # let the streams settle into waiting
+    await asyncio.sleep(0.5)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f'{args.connections} streams for {len(users)} users open in {opened:.2f} s, '
+          f'{memory / args.connections / 1024:.1f} KiB each, '
+          f'{threading.active_count() - threads} more threads, {sum(s.status != 200 for s in everyone)} errors')
+
+    rng = random.Random(1)
+    latencies = []
+    for i in range(args.changes):
+        user = rng.choice(users)
+        owned = streams[user.id]
+        for stream in owned:
+            stream.changed.clear()
+        start = time.perf_counter()
+        # autocommit, the broker is woken as soon as the row is in
+        await sync_to_async(Task.objects.create)(title=f'Pushed {i}', owner=user)
+        await asyncio.gather(*(stream.changed.wait() for stream in owned))
+        latencies.append(time.perf_counter() - start)
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f'{args.changes} changes to {len(everyone) // len(users)} streams each: '
+          f'p50 {quantiles[49] * 1000:.1f} ms   p95 {quantiles[94] * 1000:.1f} ms   max {max(latencies) * 1000:.1f} ms '
+          f'from create to every stream')
+
+    for stream in everyone:
+        stream.closed.set()
+    await asyncio.gather(*tasks)
+    print(f'closed, {len(get_broker()._streams)} users still subscribed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--changes', type=int, default=50, help='tasks created while the streams are open')
+    args = parser.parse_args()
+
+    setup()
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database():
+        users = seed(users=args.users, labels_per_user=2, tasks_per_user=10)
+        tokens = {user.id: str(RefreshToken.for_user(user).access_token) for user in users}
+        # the app as backend_assessment/asgi.py serves it, streams included
+        from backend_assessment.asgi import application
+        asyncio.run(run(application, users, tokens, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Render CPU and bytes on the wire for large task lists: DRF's JSONRenderer
+against tasks.renderers.FastJSONRenderer (orjson when installed), stdlib
+against orjson parsing of a bulk create body, the size and compression time
+of each list with no coding, gzip and Brotli, and GET /tasks/?page_size=500
+end to end with and without Accept-Encoding. Tasks get titles and
+descriptions from the Zipf distributed vocabulary of benchmarks.search, so
+they compress like real text rather than repeated characters.
+
+    python -m benchmarks.json_rendering --tasks 10000
+"""
+import argparse
+import io
+import random
+
+from benchmarks.common import measure, seed, setup, summarize, test_database
+from benchmarks.search import seed_tasks, vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--labels-per-task', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import reverse
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from tasks import compression, renderers
+    from tasks.models import Label, Task
+    from tasks.serializers import TASK_VALUES, represent_tasks
+
+    print(f'orjson {"installed" if renderers.orjson else "missing"}, '
+          f'brotli {"installed" if compression.brotli else "missing"}')
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database():
+        user, = seed(labels_per_user=10, tasks_per_user=0)
+        seed_tasks([user], args.tasks, vocabulary(random.Random(1)))
+        rng = random.Random(1)
+        labels = list(Label.objects.filter(owner=user))
+        through = Task.labels.through
+        through.objects.bulk_create([
+            through(task_id=pk, label_id=label.pk)
+            for pk in Task.objects.filter(owner=user).values_list('id', flat=True)
+            for label in rng.sample(labels, args.labels_per_task)
+        ])
+        rows = Task.objects.filter(owner=user).order_by('id').values(*TASK_VALUES)
+
+        print(f'\nrender, {args.tasks} tasks')
+        lists = {
+            'plain': represent_tasks(list(rows)),
+            'expanded': represent_tasks(list(rows), expand=True),
+        }
+        for name, data in lists.items():
+            medians = {}
+            for label, renderer in (('JSONRenderer', JSONRenderer()),
+                                    ('FastJSONRenderer', renderers.FastJSONRenderer())):
+                medians[label] = summarize(measure(
+                    lambda: renderer.render(data, 'application/json', {}), repeat=args.repeat,
+                ))['median_ms']
+            print(f'{name:<9} JSONRenderer {medians["JSONRenderer"]:8.1f} ms   '
+                  f'FastJSONRenderer {medians["FastJSONRenderer"]:8.1f} ms   '
+                  f'{medians["JSONRenderer"] / medians["FastJSONRenderer"]:.1f}x')
+
+        body = JSONRenderer().render([{'title': row['title'], 'description': row['description']} for row in rows])
+        medians = {
+            label: summarize(measure(lambda: parser.parse(io.BytesIO(body)), repeat=args.repeat))['median_ms']
+            for label, parser in (('JSONParser', JSONParser()), ('FastJSONParser', renderers.FastJSONParser()))
+        }
+        print(f'parse {len(body) / 1024:.0f} KiB bulk body   JSONParser {medians["JSONParser"]:8.1f} ms   '
+              f'FastJSONParser {medians["FastJSONParser"]:8.1f} ms   '
+              f'{medians["JSONParser"] / medians["FastJSONParser"]:.1f}x')
+
+        print('\nbytes on the wire, compression time')
+        codings = compression.supported_codings()
+        for size in (50, 500, args.tasks):
+            content = renderers.FastJSONRenderer().render(lists['plain'][:size], 'application/json', {})
+            line = f'{size:>6} tasks   identity {len(content) / 1024:9.1f} KiB'
+            for coding in codings:
+                compressed = compression.compress(coding, content)
+                elapsed = summarize(measure(lambda: compression.compress(coding, content), repeat=args.repeat))
+                line += (f'   {coding} {len(compressed) / 1024:8.1f} KiB ({len(content) / len(compressed):4.1f}x, '
+                         f'{elapsed["median_ms"]:6.2f} ms)')
+            print(line)
+
+        print('\nGET /tasks/?page_size=500')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        url = reverse('task-list') + '?page_size=500'
+        # the response cache would serve the stored page, every request here serializes and renders
+        dummy = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        caches = {**settings.CACHES, settings.RESPONSE_CACHE_ALIAS: dummy}
+        with override_settings(CACHES=caches):
+            for accept_encoding in ('', 'gzip', 'gzip, br'):
+                response = client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+                timings = summarize(measure(
+                    lambda: client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding), repeat=args.repeat,
+                ))
+                coding = response.get('Content-Encoding', 'identity')
+                print(f'Accept-Encoding {accept_encoding or "(none)":<9} {coding:<9}'
+                      f'{len(response.content) / 1024:8.1f} KiB   median {timings["median_ms"]:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Replay a read-heavy mix of task list GETs and task POSTs with the list
+response cache on and off, and report requests per second and the hit ratio.
+
+    python -m benchmarks.response_cache --requests 2000 --reads-per-write 50
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import seed, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--reads-per-write', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test.utils import override_settings, setup_test_environment
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from tasks import response_cache
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database():
+        user, = seed(tasks_per_user=args.tasks)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        # a handful of popular pages, as clients tend to ask for the same ones
+        urls = ['/api/tasks/', '/api/tasks/?expand=labels', '/api/tasks/?is_completed=false',
+                '/api/labels/', '/api/tasks/?ordering=title']
+
+        disabled = {**settings.CACHES, 'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        for name, caches in (('no cache', disabled), ('response cache', settings.CACHES)):
+            with override_settings(CACHES=caches):
+                response_cache.reset_metrics()
+                rng = random.Random(1)
+                start = time.perf_counter()
+                for i in range(args.requests):
+                    if i % (args.reads_per_write + 1) == args.reads_per_write:
+                        client.post('/api/tasks/', {'title': f'Task {i}'}, format='json')
+                    else:
+                        client.get(rng.choice(urls))
+                elapsed = time.perf_counter() - start
+                metrics = response_cache.metrics()
+
+            ratio = f'{metrics["hit_ratio"]:.0%}' if metrics['hits'] else '-'
+            print(f'{name:<16} {args.requests / elapsed:8.0f} req/s   hit ratio {ratio}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Benchmark every route in tasks/urls.py, token issuance included, against a
+seeded database and store the results as JSON. Given a baseline from an
+earlier run it exits with status 1 when a route got slower than the
+tolerance allows, runs more queries than it used to, answers with other
+statuses than it used to or with any status of 400 and up.
+
+    python -m benchmarks.routes --scale 1k --output baseline.json
+    python -m benchmarks.routes --scale 1k --baseline baseline.json --output latest.json
+
+Requests go through the test client in this process, so the numbers leave
+out the network and the server, and the query counts come from the
+Server-Timing header of tasks.performance.PerformanceMiddleware.
+"""
+import argparse
+import json
+import platform
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import seed, setup, test_database
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def scenario(method, route, url, data=None, name='', requests=None):
+    """One benchmarked request, url and data are called with the iteration number"""
+    return {
+        'name': f'{method} {route}{" " + name if name else ""}',
+        'method': method, 'route': route, 'url': url, 'data': data, 'requests': requests,
+    }
+
+
+def read_stream(response):
+    """Read a streamed body to the end, the /events/ stream is an async iterator"""
+    from asgiref.sync import async_to_sync
+
+    if response.is_async:
+        async def collect():
+            return b''.join([chunk async for chunk in response])
+        return async_to_sync(collect)()
+    return b''.join(response.streaming_content)
+
+
+def build_scenarios(args, user, password):
+    """Every route with the fixtures it needs, reads first, then writes, then deletes"""
+    from django.urls import reverse
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from tasks import sync
+    from tasks.models import Label, Task
+
+    count = args.warmup + args.requests
+    labels = list(Label.objects.filter(owner=user).order_by('id').values_list('id', flat=True))
+    tasks = list(Task.objects.filter(owner=user).order_by('id').values_list('id', flat=True))
+    # rows the DELETE scenarios use up: one per request for the sync and the
+    # async detail routes, a batch per request for the bulk route
+    doomed_labels = [label.id for label in Label.objects.bulk_create([
+        Label(name=f'Doomed {i}', owner=user) for i in range(count * 2)
+    ])]
+    doomed_tasks = [task.id for task in Task.objects.bulk_create([
+        Task(title=f'Doomed {i}', owner=user) for i in range(count * (2 + args.batch))
+    ])]
+    # changes made by the write scenarios are what the sync scenario reads back
+    token = sync.current_token(user.id)
+    refresh = str(RefreshToken.for_user(user))
+
+    def fixed(name, **kwargs):
+        url = reverse(name, kwargs=kwargs)
+        return lambda i: url
+
+    def window(ids, i):
+        return ids[(i * args.batch) % len(ids):][:args.batch]
+
+    slow = args.slow_requests
+    return [
+        scenario('POST', 'token_obtain_pair', fixed('token_obtain_pair'),
+                 lambda i: {'username': user.username, 'password': password}, requests=slow),
+        scenario('POST', 'token_refresh', fixed('token_refresh'), lambda i: {'refresh': refresh}),
+
+        scenario('GET', 'label-list', fixed('label-list')),
+        scenario('GET', 'label-detail', fixed('label-detail', pk=labels[0])),
+        scenario('GET', 'task-list', fixed('task-list')),
+        scenario('GET', 'task-list', lambda i: reverse('task-list') + '?expand=labels', name='?expand=labels'),
+        scenario('GET', 'task-list', lambda i: f'{reverse("task-list")}?is_completed=false&labels={labels[0]}',
+                 name='?is_completed&labels'),
+        scenario('GET', 'task-list', lambda i: reverse('task-list') + '?search=Task%201', name='?search'),
+        scenario('GET', 'task-list', lambda i: reverse('task-list') + '?ordering=title', name='?ordering=title'),
+        scenario('GET', 'task-search', lambda i: reverse('task-search') + '?q=task%201', name='?q'),
+        scenario('GET', 'task-stats', fixed('task-stats')),
+        scenario('GET', 'task-detail', fixed('task-detail', pk=tasks[0])),
+        scenario('GET', 'task-detail', lambda i: reverse('task-detail', kwargs={'pk': tasks[0]}) + '?expand=labels',
+                 name='?expand=labels'),
+        scenario('GET', 'task-export', fixed('task-export'), requests=slow),
+        scenario('GET', 'sync', fixed('sync'), name='bootstrap'),
+        scenario('GET', 'performance', fixed('performance')),
+        scenario('GET', 'async-label-list', fixed('async-label-list')),
+        scenario('GET', 'async-label-detail', fixed('async-label-detail', pk=labels[0])),
+        scenario('GET', 'async-task-list', fixed('async-task-list')),
+        scenario('GET', 'async-task-detail', fixed('async-task-detail', pk=tasks[0])),
+
+        scenario('POST', 'label-list', fixed('label-list'), lambda i: {'name': f'New {i}'}),
+        scenario('PUT', 'label-detail', fixed('label-detail', pk=labels[0]), lambda i: {'name': f'Renamed {i}'}),
+        scenario('PATCH', 'label-detail', fixed('label-detail', pk=labels[0]), lambda i: {'name': f'Patched {i}'}),
+        scenario('POST', 'label-tasks', fixed('label-tasks', pk=labels[1]), lambda i: {'ids': window(tasks, i)}),
+        scenario('DELETE', 'label-tasks', fixed('label-tasks', pk=labels[1]), lambda i: {'ids': window(tasks, i)}),
+        scenario('POST', 'task-list', fixed('task-list'), lambda i: {'title': f'New {i}', 'labels': labels[:2]}),
+        scenario('PUT', 'task-detail', fixed('task-detail', pk=tasks[1]),
+                 lambda i: {'title': f'Renamed {i}', 'description': '', 'is_completed': False, 'labels': labels[:2]}),
+        scenario('PATCH', 'task-detail', fixed('task-detail', pk=tasks[1]), lambda i: {'is_completed': i % 2 == 0}),
+        scenario('POST', 'task-bulk', fixed('task-bulk'),
+                 lambda i: [{'title': f'Bulk {i}.{j}', 'labels': labels[:2]} for j in range(args.batch)]),
+        scenario('PATCH', 'task-bulk', fixed('task-bulk'),
+                 lambda i: [{'id': pk, 'is_completed': i % 2 == 0} for pk in window(tasks, i)]),
+        scenario('POST', 'async-label-list', fixed('async-label-list'), lambda i: {'name': f'Async {i}'}),
+        scenario('PUT', 'async-label-detail', fixed('async-label-detail', pk=labels[0]),
+                 lambda i: {'name': f'Async renamed {i}'}),
+        scenario('POST', 'async-task-list', fixed('async-task-list'), lambda i: {'title': f'Async {i}'}),
+        scenario('PATCH', 'async-task-detail', fixed('async-task-detail', pk=tasks[1]),
+                 lambda i: {'is_completed': i % 2 == 0}),
+        scenario('POST', 'batch', fixed('batch'), lambda i: {'requests': [
+            {'method': 'POST', 'path': reverse('label-list'), 'body': {'name': f'Batch {i}'}},
+            {'method': 'POST', 'path': reverse('task-list'), 'body': {'title': f'Batch {i}', 'labels': ['$0.id']}},
+            {'method': 'PATCH', 'path': '/api/tasks/$1.id/', 'body': {'is_completed': True}},
+        ]}),
+        scenario('GET', 'sync', lambda i: f'{reverse("sync")}?since={token}', name='?since'),
+        # streams end after replaying the log, see EVENTS_STREAM_TIMEOUT in main()
+        scenario('GET', 'events', lambda i: f'{reverse("events")}?since={token}', name='?since'),
+
+        scenario('DELETE', 'label-detail', lambda i: reverse('label-detail', kwargs={'pk': doomed_labels[i]})),
+        scenario('DELETE', 'task-detail', lambda i: reverse('task-detail', kwargs={'pk': doomed_tasks[i]})),
+        scenario('DELETE', 'async-label-detail',
+                 lambda i: reverse('async-label-detail', kwargs={'pk': doomed_labels[count + i]})),
+        scenario('DELETE', 'async-task-detail',
+                 lambda i: reverse('async-task-detail', kwargs={'pk': doomed_tasks[count + i]})),
+        scenario('DELETE', 'task-bulk', fixed('task-bulk'), lambda i: window(doomed_tasks[count * 2:], i)),
+    ]
+
+
+def run_scenario(client, item, args):
+    """Time the scenario's requests one by one"""
+    from tasks.performance import percentiles
+
+    call = getattr(client, item['method'].lower())
+    requests = item['requests'] or args.requests
+    latencies, queries, statuses = [], [], set()
+    for i in range(args.warmup + requests):
+        url = item['url'](i)
+        start = time.perf_counter()
+        if item['data'] is None:
+            response = call(url)
+        else:
+            response = call(url, item['data'](i), format='json')
+        if response.streaming:
+            read_stream(response)
+        elapsed = time.perf_counter() - start
+        if i < args.warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        statuses.add(response.status_code)
+        match = QUERIES.search(response.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+
+    result = {
+        'requests': requests,
+        'rps': requests / (sum(latencies) / 1000),
+        **{f'{name}_ms': value for name, value in percentiles(latencies).items()},
+        'queries': percentiles(queries)['p50'] if queries else None,
+        'statuses': sorted(statuses),
+    }
+    return result
+
+
+def compare(baseline, results, tolerance, min_delta_ms):
+    """Regressions of results against baseline, as printable lines"""
+    regressions = []
+    for name, result in results.items():
+        # a failing request is fast and runs few queries, it would pass the checks below
+        errors = [code for code in result['statuses'] if code >= 400]
+        if errors:
+            regressions.append(f'{name}: answered {", ".join(map(str, errors))}')
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['statuses'] != base['statuses']:
+            regressions.append(f'{name}: statuses {base["statuses"]} -> {result["statuses"]}')
+        slower = result['p50_ms'] - base['p50_ms']
+        if slower > min_delta_ms and result['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p50 {base["p50_ms"]:.2f} -> {result["p50_ms"]:.2f} ms')
+        if base['queries'] is not None and result['queries'] is not None and result['queries'] > base['queries']:
+            regressions.append(f'{name}: {base["queries"]} -> {result["queries"]} queries')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='1k', help='tasks in the database, over all users')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--labels', type=int, default=10, help='labels per user')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--slow-requests', type=int, default=5,
+                        help='timed requests for token issuance (password hashing) and the full export')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--batch', type=int, default=100, help='tasks per bulk and relabel request')
+    parser.add_argument('--database', help='SQLite file to seed instead of an in-memory database')
+    parser.add_argument('--no-response-cache', action='store_true', help='time list GETs without the response cache')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed p50 slowdown, 0.5 is 50%%')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore p50 slowdowns smaller than this')
+    args = parser.parse_args()
+
+    setup()
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from tasks.urls import urlpatterns
+
+    caches = settings.CACHES
+    if args.no_response_cache:
+        caches = {**caches, settings.RESPONSE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    # allows the test client's host name
+    setup_test_environment()
+    with test_database(args.database), override_settings(CACHES=caches, EVENTS_STREAM_TIMEOUT=0):
+        start = time.perf_counter()
+        users = seed(users=args.users, labels_per_user=args.labels, tasks_per_user=SCALES[args.scale] // args.users)
+        print(f'seeded {SCALES[args.scale]} tasks for {args.users} users in {time.perf_counter() - start:.1f} s')
+        user = users[0]
+        user.is_staff = True
+        user.save(update_fields=['is_staff'])
+
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        scenarios = build_scenarios(args, user, 'benchmark')
+        missing = {pattern.name for pattern in urlpatterns} - {item['route'] for item in scenarios}
+        if missing:
+            print(f'not benchmarked: {", ".join(sorted(missing))}')
+
+        results = {}
+        for item in scenarios:
+            results[item['name']] = result = run_scenario(client, item, args)
+            queries = '-' if result['queries'] is None else result['queries']
+            print(f'{item["name"]:<42} {result["rps"]:8.1f} req/s   p50 {result["p50_ms"]:7.2f}   '
+                  f'p95 {result["p95_ms"]:7.2f}   p99 {result["p99_ms"]:7.2f} ms   '
+                  f'{queries:>3} queries   {",".join(map(str, result["statuses"]))}')
+        vendor = connection.vendor
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'scale': args.scale, 'users': args.users, 'requests': args.requests,
+            'response_cache': not args.no_response_cache, 'database': vendor,
+            'python': platform.python_version(), 'django': django.get_version(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['meta']['scale'] != args.scale:
+            print(f'warning: the baseline was taken at scale {baseline["meta"]["scale"]}')
+        regressions = compare(baseline['results'], results, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f'{len(regressions)} regressions against {args.baseline}:')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print(f'no regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
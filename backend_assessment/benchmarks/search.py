@@ -0,0 +1,87 @@
+"""
+Time the first page of /tasks/search/ against the ?search= substring filter
+of the task list, for common, rare, multi-word and prefix queries. Tasks get
+titles and descriptions drawn from a Zipf distributed vocabulary, so, as with
+"the" in English, the most common word is in nearly every task.
+
+    python -m benchmarks.search --tasks 1000000 --users 100 --database search.sqlite3
+"""
+import argparse
+import itertools
+import random
+import string
+
+from benchmarks.common import measure, seed, setup, summarize, test_database
+
+VOCABULARY_SIZE = 20000
+
+
+def vocabulary(rng):
+    """VOCABULARY_SIZE distinct made up words, most common first"""
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))))
+    return sorted(words)
+
+
+def seed_tasks(users, tasks, vocabulary, batch_size=5000):
+    from tasks.models import Task
+
+    rng = random.Random(1)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    text = lambda count: ' '.join(rng.choices(vocabulary, cum_weights=weights, k=count))
+    for start in range(0, tasks, batch_size):
+        Task.objects.bulk_create([
+            Task(title=text(4), description=text(30), owner=users[(start + i) % len(users)])
+            for i in range(min(batch_size, tasks - start))
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database', help='file for the SQLite database, in memory by default')
+    args = parser.parse_args()
+
+    setup()
+    from django.http import QueryDict
+    from tasks.filters import filter_tasks
+    from tasks.models import Task
+    from tasks.search import search_tasks
+    from tasks.serializers import TASK_VALUES
+
+    with test_database(args.database):
+        words = vocabulary(random.Random(1))
+        users = seed(users=args.users, tasks_per_user=0)
+        seed_tasks(users, args.tasks, words)
+        owner = users[0]
+        print(f'{args.tasks} tasks, {Task.objects.filter(owner=owner).count()} for the searching owner')
+
+        queries = {
+            'most common': words[0],
+            '100th word': words[99],
+            'rare word': words[10000],
+            'two words': f'{words[20]} {words[50]}',
+            'prefix': words[200][:3],
+        }
+        for name, text in queries.items():
+            params = QueryDict(mutable=True)
+            params['q'] = params['search'] = text
+            search = lambda: list(
+                search_tasks(owner.id, params).order_by('rank', 'id').values(*TASK_VALUES, 'rank')[:51]
+            )
+            # the list filter only takes the query as one substring, the first word is the fair comparison
+            params['search'] = text.split()[0]
+            scan = lambda: list(filter_tasks(Task.objects.filter(owner_id=owner.id), params).values(*TASK_VALUES)[:51])
+
+            matches = search_tasks(owner.id, params).count()
+            for label, func in (('search', search), ('?search=', scan)):
+                timings = summarize(measure(func, repeat=args.repeat))
+                print(f'{name:<12} {label:<9} {matches:>8} matches   median {timings["median_ms"]:8.2f} ms   '
+                      f'max {timings["max_ms"]:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
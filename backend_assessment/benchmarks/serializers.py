@@ -0,0 +1,45 @@
+"""
+Compare DRF serializers with the .values() fast path used by the list views.
+
+    python -m benchmarks.serializers --tasks 10000
+"""
+import argparse
+
+from benchmarks.common import measure, seed, setup, summarize, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--labels-per-task', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from tasks.models import Task
+    from tasks.serializers import (
+        ExpandedTaskSerializer, TaskSerializer, TASK_VALUES, represent_tasks,
+    )
+
+    with test_database():
+        user, = seed(tasks_per_user=args.tasks, labels_per_task=args.labels_per_task)
+        tasks = Task.objects.filter(owner=user).order_by('id')
+
+        cases = {
+            'serializer': lambda: TaskSerializer(tasks.with_labels(), many=True).data,
+            'fast path': lambda: represent_tasks(list(tasks.values(*TASK_VALUES))),
+            'serializer, expanded': lambda: ExpandedTaskSerializer(tasks.with_labels(expanded=True), many=True).data,
+            'fast path, expanded': lambda: represent_tasks(list(tasks.values(*TASK_VALUES)), expand=True),
+        }
+        results = {name: summarize(measure(case, repeat=args.repeat)) for name, case in cases.items()}
+
+    print(f'{args.tasks} tasks, {args.labels_per_task} labels each, including the queries')
+    for name, result in results.items():
+        print(f'{name:<22} median {result["median_ms"]:9.1f} ms   min {result["min_ms"]:9.1f} ms')
+    for plain in ('', ', expanded'):
+        speedup = results[f'serializer{plain}']['median_ms'] / results[f'fast path{plain}']['median_ms']
+        print(f'speedup{plain}: {speedup:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
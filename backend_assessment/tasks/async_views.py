@@ -0,0 +1,231 @@
+"""
+Async versions of the label and task routes, served under /api/async/. They
+answer like the views in tasks/views.py but await the ORM instead of holding
+one of the worker threads sync views run in under ASGI, see
+backend_assessment/asgi.py.
+
+DRF has no async views, so async_api_view does the parts of APIView these
+routes use: JWT authentication, IsAuthenticated, content negotiation, method
+checks and exception handling. Responses always render as JSON, there is no
+browsable API here. Serializer validation still runs in a thread, DRF fields
+and validators are sync only. So do writes: a transaction can't span awaits,
+and a write has to commit together with what its signals write.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from . import conditional, events, performance
+from .renderers import FastJSONRenderer
+from .authentication import CachedStatelessJWTAuthentication
+from .filters import filter_tasks
+from .models import Task, Label
+from .pagination import KeysetPagination, TaskPagination
+from .signals import batched_changes
+from .serializers import (
+    TaskSerializer, LabelSerializer, TASK_VALUES, LABEL_VALUES, represent_labels, arepresent_tasks,
+    apply_changes, changed_update_fields,
+)
+from .views import expands_labels
+
+def async_api_view(methods, renderer_classes=(FastJSONRenderer,)):
+    """@api_view with @permission_classes([IsAuthenticated]) for async view functions"""
+    allowed = ', '.join(methods)
+
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[CachedStatelessJWTAuthentication()],
+                negotiator=DefaultContentNegotiation(),
+            )
+            try:
+                await initial(request, renderer_classes)
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                response = await func(request, *args, **kwargs)
+            except Exception as exc:
+                response = handle_exception(request, exc, {'args': args, 'kwargs': kwargs})
+            return finalize_response(request, response, allowed)
+        return csrf_exempt(view)
+    return decorator
+
+async def initial(request, renderer_classes):
+    renderers = [renderer() for renderer in renderer_classes]
+    # errors raised by the negotiation itself still need a renderer
+    request.accepted_renderer, request.accepted_media_type = renderers[0], renderers[0].media_type
+    request.accepted_renderer, request.accepted_media_type = request.negotiator.select_renderer(request, renderers)
+
+    try:
+        user_auth = await request.authenticators[0].aauthenticate(request)
+    except exceptions.APIException:
+        request._not_authenticated()
+        raise
+    if user_auth is None:
+        request._not_authenticated()
+        raise exceptions.NotAuthenticated()
+    request.user, request.auth = user_auth
+
+def handle_exception(request, exc, context):
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # WWW-Authenticate makes these a 401, as APIView does
+        exc.auth_header = request.authenticators[0].authenticate_header(request)
+    response = exception_handler(exc, {'request': request, **context})
+    if response is None:
+        raise exc
+    return response
+
+def finalize_response(request, response, allowed):
+    """Render DRF responses in the event loop, Django would render them in a thread"""
+    if isinstance(response, Response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = {'request': request, 'response': response}
+        with performance.measure_render(request):
+            response.render()
+        response = HttpResponse(response.content, status=response.status_code, headers=response.headers)
+    response['Allow'] = allowed
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+def preload(loader):
+    """Await loader(request, ...) first, so condition()'s sync callables only read what it cached"""
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            await loader(request, *args, **kwargs)
+            return await func(request, *args, **kwargs)
+        return view
+    return decorator
+
+async def is_valid(serializer):
+    return await sync_to_async(serializer.is_valid)()
+
+@sync_to_async
+def save(instance, validated_data):
+    """ModelSerializer.save() in one transaction with its signals, as tasks/views.py does"""
+    many_to_many = {}
+    for field in instance._meta.many_to_many:
+        if field.name in validated_data:
+            many_to_many[field.name] = validated_data.pop(field.name)
+    changed = apply_changes(instance, validated_data)
+    with transaction.atomic(savepoint=False), batched_changes():
+        if instance.pk is None:
+            instance.save()
+        elif changed:
+            # only the changed columns, like ChangedFieldsMixin
+            instance.save(update_fields=changed_update_fields(changed))
+        for attr, value in many_to_many.items():
+            getattr(instance, attr).set(value)
+    return instance
+
+@sync_to_async
+def delete(instance):
+    with transaction.atomic(savepoint=False), batched_changes():
+        instance.delete()
+
+async def represent_task(task, expand=False):
+    row = {name: task.serializable_value(name) for name in TASK_VALUES}
+    data, = await arepresent_tasks([row], expand=expand)
+    return data
+
+@async_api_view(['GET', 'POST'])
+@preload(conditional.label_list_preload)
+@condition(**conditional.label_list_conditions)
+async def label_list(request):
+    """GET or POST to the /async/labels/ route"""
+    if request.method == 'GET':
+        labels = Label.objects.filter(owner_id=request.user.id).values(*LABEL_VALUES)
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(labels, request)
+        return paginator.get_paginated_response(represent_labels(page))
+    elif request.method == 'POST':
+        serializer = LabelSerializer(data=request.data, context={'request': request})
+        if await is_valid(serializer):
+            serializer.instance = await save(Label(owner_id=request.user.id), serializer.validated_data)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@async_api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
+@preload(conditional.label_detail_preload)
+@condition(**conditional.label_detail_conditions)
+async def label_detail(request, pk):
+    """GET, PUT, PATCH, or DELETE to the /async/labels/<label_id> route"""
+    try:
+        label = await Label.objects.aget(pk=pk, owner_id=request.user.id)
+    except Label.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        serializer = LabelSerializer(label)
+        return Response(serializer.data)
+    elif request.method in ('PUT', 'PATCH'):
+        serializer = LabelSerializer(label, data=request.data, partial=request.method == 'PATCH',
+                                     context={'request': request})
+        if await is_valid(serializer):
+            await save(label, serializer.validated_data)
+            return Response(serializer.data, headers={'ETag': conditional.object_etag(label)})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    elif request.method == 'DELETE':
+        await delete(label)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+@async_api_view(['GET', 'POST'])
+@preload(conditional.task_list_preload)
+@condition(**conditional.task_list_conditions)
+async def task_list(request):
+    """GET or POST to the /async/tasks/ route"""
+    if request.method == 'GET':
+        tasks = filter_tasks(Task.objects.filter(owner_id=request.user.id), request.query_params)
+        paginator = TaskPagination()
+        page = await paginator.apaginate_queryset(tasks.values(*TASK_VALUES), request)
+        return paginator.get_paginated_response(await arepresent_tasks(page, expand=expands_labels(request)))
+    elif request.method == 'POST':
+        serializer = TaskSerializer(data=request.data, context={'request': request})
+        if await is_valid(serializer):
+            task = await save(Task(owner_id=request.user.id), serializer.validated_data)
+            return Response(await represent_task(task), status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@async_api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
+@preload(conditional.task_detail_preload)
+@condition(**conditional.task_detail_conditions)
+async def task_detail(request, pk):
+    """GET, PUT, PATCH, or DELETE to the /async/tasks/<task_id> route"""
+    expand = request.method == 'GET' and expands_labels(request)
+    try:
+        task = await Task.objects.aget(pk=pk, owner_id=request.user.id)
+    except Task.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        return Response(await represent_task(task, expand=expand))
+    elif request.method in ('PUT', 'PATCH'):
+        serializer = TaskSerializer(task, data=request.data, partial=request.method == 'PATCH',
+                                    context={'request': request})
+        if await is_valid(serializer):
+            await save(task, serializer.validated_data)
+            return Response(await represent_task(task), headers={'ETag': conditional.object_etag(task)})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    elif request.method == 'DELETE':
+        await delete(task)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+@async_api_view(['GET'], renderer_classes=(FastJSONRenderer, events.EventStreamRenderer))
+async def task_events(request):
+    """GET to the /events/ route, streams changes to the user's tasks and labels"""
+    # EventSource resends the id of the last event it got when it reconnects
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('since')
+    position = events.start_position(request.user.id, last_event_id)
+    return events.events_response(request.user.id, position)
@@ -0,0 +1,101 @@
+"""
+JWT authentication without the per-request User query. The views only need
+request.user.id to scope their queries, so the user comes from the token
+claims as a TokenUser. Whether the account is still active, and for
+CHECK_REVOKE_TOKEN whether the password changed since the token was issued,
+is kept in a small in-process cache that lives AUTH_USER_STATE_TIMEOUT
+seconds and is dropped whenever the User row is saved or deleted.
+"""
+import time
+from threading import Lock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+_user_states = {}
+_lock = Lock()
+
+def cached_user_state(user_id, now):
+    entry = _user_states.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry
+    return None
+
+def remember_user_state(user_id, state, now):
+    with _lock:
+        if len(_user_states) >= settings.AUTH_USER_STATE_MAX_ENTRIES:
+            # drop expired entries first, then the oldest ones
+            for key in [key for key, (expires, _) in _user_states.items() if expires <= now]:
+                del _user_states[key]
+            while len(_user_states) >= settings.AUTH_USER_STATE_MAX_ENTRIES:
+                del _user_states[next(iter(_user_states))]
+        _user_states[user_id] = (now + settings.AUTH_USER_STATE_TIMEOUT, state)
+    return state
+
+def user_state_query(user_id):
+    User = get_user_model()
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list('is_active', 'password')
+
+def get_user_state(user_id):
+    """(is_active, password hash) for user_id, None if there is no such user"""
+    now = time.monotonic()
+    entry = cached_user_state(user_id, now)
+    if entry is not None:
+        return entry[1]
+    return remember_user_state(user_id, user_state_query(user_id).first(), now)
+
+async def aget_user_state(user_id):
+    now = time.monotonic()
+    entry = cached_user_state(user_id, now)
+    if entry is not None:
+        return entry[1]
+    return remember_user_state(user_id, await user_state_query(user_id).afirst(), now)
+
+def forget_user_state(user_id):
+    with _lock:
+        _user_states.pop(user_id, None)
+
+def clear_user_states():
+    with _lock:
+        _user_states.clear()
+
+class CachedStatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWTAuthentication that returns a TokenUser and checks account state against a short-lived cache"""
+
+    def get_user(self, validated_token):
+        state = get_user_state(self.get_user_id(validated_token))
+        return self.check_user_state(validated_token, state)
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, the account state is read with the async ORM"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        state = await aget_user_state(self.get_user_id(validated_token))
+        return self.check_user_state(validated_token, state), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def check_user_state(self, validated_token, state):
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, password = state
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(password):
+                raise AuthenticationFailed('The user\'s password has been changed.', code='password_changed')
+
+        return super().get_user(validated_token)
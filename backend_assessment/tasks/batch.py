@@ -0,0 +1,156 @@
+"""
+Batched requests for /batch/. An ordered list of sub-requests against the
+routes in tasks/urls.py runs in-process, inside one transaction, as the user
+who authenticated the batch. The first sub-request that fails stops the
+batch and rolls back everything before it.
+
+A sub-request can use the response bodies of the ones before it. A body
+value that is a whole reference, such as "$0.id", is replaced by the value
+it points at, and references inside the path are replaced by their text,
+e.g. "/api/tasks/$1.id/". $<n> is the n-th response of the batch, counted
+from 0, followed by dotted keys or list indexes ("$2.results.0.id").
+"""
+import re
+from io import BytesIO
+from urllib.parse import urlsplit
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from . import compression
+from .renderers import dumps
+
+MAX_BATCH_REQUESTS = 25
+# nested batches, streamed bodies and token routes that authenticate on their own
+UNBATCHED_ROUTES = {'batch', 'task-export', 'token_obtain_pair', 'token_refresh'}
+# conditional headers a sub-request may send, e.g. If-Match for lost update checks
+FORWARDED_HEADERS = ('If-Match', 'If-None-Match', 'If-Modified-Since', 'If-Unmodified-Since')
+RETURNED_HEADERS = ('ETag', 'Last-Modified')
+
+REFERENCE = re.compile(r'\$(\d+)((?:\.[\w-]+)*)')
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'))
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+    headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate_headers(self, value):
+        allowed = {name.lower(): name for name in FORWARDED_HEADERS}
+        unknown = [name for name in value if name.lower() not in allowed]
+        if unknown:
+            raise serializers.ValidationError(f'Only {", ".join(FORWARDED_HEADERS)} can be sent.')
+        return {allowed[name.lower()]: header for name, header in value.items()}
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_REQUESTS)
+
+class InvalidReference(Exception):
+    pass
+
+def run_batch(request):
+    """Run the sub-requests in request.data, returns their responses and whether all of them succeeded"""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    responses = []
+    with transaction.atomic():
+        for item in serializer.validated_data['requests']:
+            responses.append(run_sub_request(request, item, responses))
+            if responses[-1]['status'] >= 400:
+                transaction.set_rollback(True)
+                break
+    # lists cached by a rolled back batch are keyed by versions the rollback undid, nothing reads them
+    return responses, responses[-1]['status'] < 400
+
+def run_sub_request(request, item, responses):
+    try:
+        path = REFERENCE.sub(lambda match: str(lookup(match, responses)), item['path'])
+        body = substitute(item.get('body'), responses)
+    except InvalidReference as error:
+        return reply(400, {'detail': str(error)})
+
+    url = urlsplit(path)
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        return reply(404, {'detail': 'Not found.'})
+    if not is_batchable(match):
+        return reply(400, {'detail': f'{url.path} can\'t be part of a batch.'})
+
+    sub_request = build_request(request, item['method'], url, body, item.get('headers', {}))
+    sub_request.resolver_match = match
+    response = match.func(sub_request, *match.args, **match.kwargs)
+    headers = {name: response[name] for name in RETURNED_HEADERS if response.has_header(name)}
+    # DRF responses aren't rendered yet, their data goes out with the batch
+    return reply(response.status_code, getattr(response, 'data', None), headers)
+
+def is_batchable(match):
+    from .urls import urlpatterns
+
+    routes = {pattern.name for pattern in urlpatterns}
+    # the async routes serve the same data, batches run in the request's thread
+    return (
+        match.url_name in routes - UNBATCHED_ROUTES
+        and not iscoroutinefunction(match.func)
+    )
+
+def build_request(request, method, url, body, headers):
+    """A request for one sub-request, authenticated as the user of the batch"""
+    content = b'' if body is None else dumps(body)
+    environ = {
+        key: value for key, value in request.META.items()
+        # the batch's own body, conditions and credentials don't carry over
+        if not key.startswith(('HTTP_IF_', 'CONTENT_', 'wsgi.')) and key != 'HTTP_AUTHORIZATION'
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': BytesIO(content),
+        'wsgi.url_scheme': request.scheme,
+    })
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    # a tag may come from a compressed GET outside the batch
+    compression.strip_codings(environ)
+
+    sub_request = WSGIRequest(environ)
+    # what rest_framework.test.force_authenticate() does, the batch was authenticated already
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+def substitute(value, responses):
+    """Replace whole-value references anywhere in a JSON body"""
+    if isinstance(value, dict):
+        return {key: substitute(item, responses) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, responses) for item in value]
+    if isinstance(value, str):
+        match = REFERENCE.fullmatch(value)
+        if match:
+            return lookup(match, responses)
+    return value
+
+def lookup(match, responses):
+    index = int(match.group(1))
+    if index >= len(responses):
+        raise InvalidReference(f'{match.group(0)} refers to a request that hasn\'t run yet.')
+    value = responses[index]['body']
+    for key in filter(None, match.group(2).split('.')):
+        try:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise InvalidReference(f'{match.group(0)} is not in the response of request {index}.')
+    return value
+
+def reply(status, body, headers=None):
+    response = {'status': status, 'body': body}
+    if headers:
+        response['headers'] = headers
+    return response
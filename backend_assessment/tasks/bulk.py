@@ -0,0 +1,133 @@
+"""
+Batch writes for /tasks/bulk/. A whole batch is validated up front, label ids
+are resolved with a single owner-scoped query and rows are written with
+bulk_create/bulk_update inside one transaction, so a batch either fully
+applies or leaves nothing behind.
+"""
+from functools import partial
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from . import statistics
+from .models import Task, Label, count_label_links
+from .signals import batched_changes, notify
+from .serializers import TaskSerializer, BulkTaskSerializer, BulkTaskUpdateSerializer
+
+MAX_BULK_ITEMS = 1000
+
+TaskLabel = Task.labels.through
+
+def create_tasks(owner_id, data):
+    """Create every task in data and return their representations in input order"""
+    serializer = BulkTaskSerializer(data=data, many=True, max_length=MAX_BULK_ITEMS)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data
+    check_labels(owner_id, items)
+
+    with transaction.atomic():
+        tasks = Task.objects.bulk_create([
+            Task(owner_id=owner_id, **task_fields(item)) for item in items
+        ])
+        link_labels((task.pk, item['labels']) for task, item in zip(tasks, items) if 'labels' in item)
+        # bulk_create skips post_save, so counters and listeners are told here
+        transaction.on_commit(partial(statistics.adjust, Task, len(tasks)))
+        notify(Task, owner_id, created=[task.pk for task in tasks])
+
+    return serialize_in_order([task.pk for task in tasks])
+
+def update_tasks(owner_id, data):
+    """Apply partial updates to existing tasks and return them in input order"""
+    serializer = BulkTaskUpdateSerializer(data=data, many=True, partial=True, max_length=MAX_BULK_ITEMS)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data
+
+    ids = [item['id'] for item in items]
+    tasks = Task.objects.filter(owner_id=owner_id).in_bulk(ids)
+    errors = []
+    seen = set()
+    for item in items:
+        if item['id'] not in tasks:
+            errors.append({'id': ['Not found.']})
+        elif item['id'] in seen:
+            errors.append({'id': ['Duplicate task in batch.']})
+        else:
+            errors.append({})
+        seen.add(item['id'])
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    check_labels(owner_id, items)
+
+    # bulk_update skips auto_now, relabelling counts as a change too
+    changed_fields = {'updated_at'}
+    now = timezone.now()
+    for item in items:
+        fields = task_fields(item)
+        fields['updated_at'] = now
+        for name, value in fields.items():
+            setattr(tasks[item['id']], name, value)
+        changed_fields.update(fields)
+
+    with transaction.atomic():
+        Task.objects.bulk_update([tasks[pk] for pk in ids], sorted(changed_fields))
+        relabelled = [(item['id'], item['labels']) for item in items if 'labels' in item]
+        if relabelled:
+            links = TaskLabel.objects.filter(task_id__in=[pk for pk, _ in relabelled])
+            count_label_links(links, -1)
+            links.delete()
+            link_labels(relabelled)
+        notify(Task, owner_id, updated=ids)
+
+    return serialize_in_order(ids)
+
+def delete_tasks(owner_id, data):
+    """Delete the listed tasks and report which of them existed"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_ITEMS,
+    ).run_validation(data)
+
+    # one notification for the batch instead of one per deleted row
+    with transaction.atomic(), batched_changes():
+        owned = Task.objects.filter(owner_id=owner_id, pk__in=ids)
+        existing = set(owned.values_list('pk', flat=True))
+        owned.delete()
+
+    return [{'id': pk, 'deleted': pk in existing} for pk in ids]
+
+def task_fields(item):
+    return {name: value for name, value in item.items() if name not in ('id', 'labels')}
+
+def check_labels(owner_id, items):
+    """Resolve every label id in the batch with one query scoped to the owner"""
+    requested = {pk for item in items for pk in item.get('labels', ())}
+    owned = set(
+        Label.objects.filter(owner_id=owner_id, pk__in=requested).values_list('pk', flat=True)
+    ) if requested else set()
+
+    errors = []
+    for item in items:
+        missing = [pk for pk in item.get('labels', ()) if pk not in owned]
+        if missing:
+            errors.append({'labels': [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]})
+        else:
+            errors.append({})
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+def link_labels(pairs):
+    """Insert the through rows for (task_id, label_ids) pairs of tasks without labels yet"""
+    pairs = list(pairs)
+    rows = [
+        TaskLabel(task_id=task_id, label_id=label_id)
+        for task_id, label_ids in pairs
+        for label_id in dict.fromkeys(label_ids)
+    ]
+    if rows:
+        TaskLabel.objects.bulk_create(rows)
+        # bulk_create skips m2m_changed, count what the signal would have
+        count_label_links(TaskLabel.objects.filter(task_id__in=[task_id for task_id, _ in pairs]), 1)
+
+def serialize_in_order(ids):
+    tasks = Task.objects.with_labels().in_bulk(ids)
+    return TaskSerializer([tasks[pk] for pk in ids], many=True).data
@@ -0,0 +1,133 @@
+"""
+ETag and Last-Modified callables for django.views.decorators.http.condition.
+List tags come from the per-user CollectionVersion stamp, detail tags from
+the row's updated_at, so a matching If-None-Match is answered with a 304
+after one indexed lookup and without serializing anything.
+"""
+import hashlib
+from .models import Task, Label, CollectionVersion
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def collection_state(request, collection):
+    """(version, updated_at) for the user's collection, looked up once per request"""
+    cached = collection_states(request)
+    if collection not in cached:
+        cached[collection] = collection_state_query(request, collection).first() or (0, None)
+    return cached[collection]
+
+async def acollection_state(request, collection):
+    cached = collection_states(request)
+    if collection not in cached:
+        cached[collection] = await collection_state_query(request, collection).afirst() or (0, None)
+    return cached[collection]
+
+def collection_states(request):
+    cached = getattr(request, '_collection_states', None)
+    if cached is None:
+        cached = request._collection_states = {}
+    return cached
+
+def collection_state_query(request, collection):
+    return CollectionVersion.objects.filter(
+        owner_id=request.user.id, collection=collection
+    ).values_list('version', 'updated_at')
+
+def representation(request):
+    # the same data renders differently per format and query string
+    return request.accepted_renderer.format, request.get_full_path()
+
+def collection_etag(collection):
+    def etag_func(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        version, _ = collection_state(request, collection)
+        return make_etag(collection, request.user.id, version, *representation(request))
+    return etag_func
+
+def collection_last_modified(collection):
+    def last_modified_func(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        return collection_state(request, collection)[1]
+    return last_modified_func
+
+def object_etag(instance, request=None):
+    """
+    Tag for a single task or label as it is stored right now. It doesn't
+    depend on the query string so a tag read with GET can be sent back in
+    If-Match on PUT or DELETE.
+    """
+    parts = [instance._meta.model_name, instance.pk, instance.updated_at.isoformat()]
+    if request is not None and request.method in ('GET', 'HEAD') and 'expand' in request.query_params:
+        # expanded labels can change without the task changing
+        parts.append(collection_state(request, CollectionVersion.LABELS)[0])
+    return make_etag(*parts)
+
+def object_state(request, model, pk):
+    try:
+        return request._object_state
+    except AttributeError:
+        # a missing object is cached too, as None
+        request._object_state = object_state_query(request, model, pk).first()
+        return request._object_state
+
+async def aobject_state(request, model, pk):
+    try:
+        return request._object_state
+    except AttributeError:
+        request._object_state = await object_state_query(request, model, pk).afirst()
+        return request._object_state
+
+def object_state_query(request, model, pk):
+    return model.objects.filter(pk=pk, owner_id=request.user.id).only('pk', 'updated_at')
+
+def detail_etag(model):
+    def etag_func(request, pk):
+        instance = object_state(request, model, pk)
+        return object_etag(instance, request) if instance is not None else None
+    return etag_func
+
+def detail_last_modified(model):
+    def last_modified_func(request, pk):
+        instance = object_state(request, model, pk)
+        return instance.updated_at if instance is not None else None
+    return last_modified_func
+
+# async views load the state condition() needs up front, its callables are sync
+
+def collection_preload(collection):
+    async def preload(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            await acollection_state(request, collection)
+    return preload
+
+def detail_preload(model):
+    async def preload(request, pk):
+        instance = await aobject_state(request, model, pk)
+        if instance is not None and request.method in ('GET', 'HEAD') and 'expand' in request.query_params:
+            await acollection_state(request, CollectionVersion.LABELS)
+    return preload
+
+task_list_preload = collection_preload(CollectionVersion.TASKS)
+label_list_preload = collection_preload(CollectionVersion.LABELS)
+task_detail_preload = detail_preload(Task)
+label_detail_preload = detail_preload(Label)
+
+task_list_conditions = {
+    'etag_func': collection_etag(CollectionVersion.TASKS),
+    'last_modified_func': collection_last_modified(CollectionVersion.TASKS),
+}
+label_list_conditions = {
+    'etag_func': collection_etag(CollectionVersion.LABELS),
+    'last_modified_func': collection_last_modified(CollectionVersion.LABELS),
+}
+task_detail_conditions = {
+    'etag_func': detail_etag(Task),
+    'last_modified_func': detail_last_modified(Task),
+}
+label_detail_conditions = {
+    'etag_func': detail_etag(Label),
+    'last_modified_func': detail_last_modified(Label),
+}
@@ -0,0 +1,28 @@
+"""
+Per-user aggregates for /tasks/stats/. Task totals come from one aggregate
+query over the owner's tasks, covered by the (owner, is_completed, id) index.
+Per-label task counts are read from the denormalized Label.task_count column
+when TASK_STATS_LABEL_COUNTERS is on, so they cost the same however many
+tasks a label has, or counted with one GROUP BY over the through table when
+it is off.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Q
+from .models import Label, Task
+
+def owner_stats(owner_id):
+    """Task totals and per-label task counts for owner_id"""
+    totals = Task.objects.filter(owner_id=owner_id).aggregate(
+        total=Count('pk'),
+        completed=Count('pk', filter=Q(is_completed=True)),
+    )
+    labels = Label.objects.filter(owner_id=owner_id).order_by('id')
+    if settings.TASK_STATS_LABEL_COUNTERS:
+        labels = labels.values('id', 'name', tasks=F('task_count'))
+    else:
+        labels = labels.values('id', 'name').annotate(tasks=Count('task'))
+
+    return {
+        'tasks': {**totals, 'open': totals['total'] - totals['completed']},
+        'labels': list(labels),
+    }
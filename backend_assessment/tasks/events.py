@@ -0,0 +1,265 @@
+"""
+Server-sent events for /events/. A stream pushes the user's task and label
+changes as they are committed, one event per entry of the Change log:
+
+    id: <sync token>
+    event: task.created | task.updated | task.deleted | label.created | ...
+    data: {"id": 1, "title": ...}
+
+Event ids are /sync/ tokens, so a client that reconnects with Last-Event-ID
+(or opens the stream with ?since=<sync token>) gets every change it missed.
+Only the last event of each batch carries one, a client cut off halfway
+through a batch gets its first events again. Created and updated events
+carry the current state of the row, as /sync/ does, deleted events only
+its id.
+
+The change log is what streams read. A broker only wakes up the streams of
+a user after a commit: LocalBroker within this process, PollingBroker across
+processes. Each stream is a coroutine waiting on an asyncio.Event, and a
+comment line goes out every EVENTS_HEARTBEAT seconds to keep proxies from
+closing it. Streams end after EVENTS_STREAM_TIMEOUT seconds and clients
+reconnect where they left off.
+
+Under ASGI Django gives every request a thread of its own as soon as it
+makes a sync call, which the middleware always does, and keeps it until the
+response is sent. backend_assessment/asgi.py serves /api/events/ with
+EventStreamHandler instead, so idle streams cost a coroutine each and their
+queries share one thread and one database connection.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer
+from . import sync
+from .models import Change, CollectionVersion, Label, Task
+from .renderers import dumps
+from .serializers import LABEL_VALUES, TASK_VALUES, arepresent_tasks, represent_labels
+
+logger = logging.getLogger(__name__)
+
+# how long EventSource clients wait before reconnecting (milliseconds)
+RETRY_MS = 2000
+EVENT_NAMES = {CollectionVersion.TASKS: 'task', CollectionVersion.LABELS: 'label'}
+
+class EventStreamRenderer(BaseRenderer):
+    """Accepts EventSource's Accept: text/event-stream, errors before the stream starts go out as an error event"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b'event: error\ndata: ' + dumps(data) + b'\n\n'
+
+class LocalBroker:
+    """Wakes up the streams of this process, for a single process deployment"""
+
+    def __init__(self):
+        self._streams = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, owner_id, wake):
+        with self._lock:
+            self._streams[owner_id].add(wake)
+
+    def unsubscribe(self, owner_id, wake):
+        with self._lock:
+            streams = self._streams.get(owner_id)
+            if streams is not None:
+                streams.discard(wake)
+                if not streams:
+                    del self._streams[owner_id]
+
+    def publish(self, owner_id):
+        """Called after a commit that changed owner_id's tasks or labels"""
+        self.wake(owner_id)
+
+    def wake(self, owner_id):
+        with self._lock:
+            streams = list(self._streams.get(owner_id, ()))
+        for wake in streams:
+            wake()
+
+class PollingBroker(LocalBroker):
+    """
+    Also wakes streams for changes committed by other processes. One thread
+    per process reads the latest change of every user with an open stream
+    every EVENTS_POLL_INTERVAL seconds, a single query on the (owner, id) index.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._positions = {}
+        self._thread = None
+
+    def subscribe(self, owner_id, wake):
+        super().subscribe(owner_id, wake)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='events-poller', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(settings.EVENTS_POLL_INTERVAL)
+            try:
+                self.poll()
+            except DatabaseError:
+                logger.exception('Polling the change log failed')
+            finally:
+                close_old_connections()
+
+    def poll(self):
+        with self._lock:
+            owners = list(self._streams)
+        latest = {}
+        if owners:
+            latest = dict(
+                Change.objects.filter(owner_id__in=owners).order_by()
+                .values('owner_id').annotate(last=Max('id')).values_list('owner_id', 'last')
+            )
+        previous, self._positions = self._positions, {owner_id: latest.get(owner_id, 0) for owner_id in owners}
+        for owner_id, last in self._positions.items():
+            # users seen for the first time are woken too, their streams may have
+            # read the log just before a change this poll is the first to see
+            if previous.get(owner_id) != last:
+                self.wake(owner_id)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    """The EVENTS_BROKER of this process"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)()
+        return _broker
+
+def start_position(owner_id, last_event_id):
+    """The change log position to stream from, Last-Event-ID and ?since= are sync tokens"""
+    if not last_event_id:
+        return None
+    try:
+        return sync.read_token(owner_id, last_event_id)
+    except ValidationError:
+        raise ValidationError({'Last-Event-ID': ['Invalid event id.']})
+
+async def latest_position(owner_id):
+    latest = await Change.objects.filter(owner_id=owner_id).order_by('-id').values_list('id', flat=True).afirst()
+    return latest or 0
+
+async def read_events(owner_id, position):
+    """Encoded events for the next page of the change log after position, the new position and whether there is more"""
+    entries = [
+        entry async for entry in Change.objects.filter(owner_id=owner_id, id__gt=position)
+        .order_by('id').values_list('id', 'collection', 'object_id', 'action')[:settings.SYNC_PAGE_SIZE]
+    ]
+    touched = {CollectionVersion.TASKS: set(), CollectionVersion.LABELS: set()}
+    for _, collection, object_id, action in entries:
+        if action != Change.DELETED:
+            touched[collection].add(object_id)
+
+    rows = {CollectionVersion.TASKS: {}, CollectionVersion.LABELS: {}}
+    if touched[CollectionVersion.TASKS]:
+        tasks = Task.objects.filter(owner_id=owner_id, pk__in=touched[CollectionVersion.TASKS]).values(*TASK_VALUES)
+        tasks = await arepresent_tasks([row async for row in tasks])
+        rows[CollectionVersion.TASKS] = {row['id']: row for row in tasks}
+    if touched[CollectionVersion.LABELS]:
+        labels = Label.objects.filter(owner_id=owner_id, pk__in=touched[CollectionVersion.LABELS]).values(*LABEL_VALUES)
+        labels = represent_labels([row async for row in labels])
+        rows[CollectionVersion.LABELS] = {row['id']: row for row in labels}
+
+    events = []
+    for change_id, collection, object_id, action in entries:
+        if action == Change.DELETED:
+            data = {'id': object_id}
+        else:
+            data = rows[collection].get(object_id)
+            if data is None:
+                # deleted since, its deleted event comes later in the log
+                continue
+        events.append(f'event: {EVENT_NAMES[collection]}.{action}\ndata: {dumps(data).decode()}\n')
+    if entries:
+        position = entries[-1][0]
+    if events:
+        # clients keep the last id they got, so only the end of a page needs
+        # one and the page is signed once
+        events[-1] = f'id: {sync.make_token(owner_id, position)}\n{events[-1]}'
+    return ''.join(event + '\n' for event in events), position, len(entries) == settings.SYNC_PAGE_SIZE
+
+async def stream_events(owner_id, position=None):
+    """Yield the events after position, or from now on, until EVENTS_STREAM_TIMEOUT"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENTS_STREAM_TIMEOUT
+    changed = asyncio.Event()
+    # brokers wake streams from whichever thread committed
+    wake = lambda: loop.call_soon_threadsafe(changed.set)
+
+    broker = get_broker()
+    # subscribe before the first read, a change committed in between still wakes the stream
+    broker.subscribe(owner_id, wake)
+    try:
+        if position is None:
+            position = await latest_position(owner_id)
+        yield f'retry: {RETRY_MS}\n\n'
+        while True:
+            changed.clear()
+            more = True
+            while more:
+                events, position, more = await read_events(owner_id, position)
+                if events:
+                    yield events
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), min(settings.EVENTS_HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+    finally:
+        broker.unsubscribe(owner_id, wake)
+
+def events_response(owner_id, position=None):
+    response = StreamingHttpResponse(stream_events(owner_id, position), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class EventStreamHandler(ASGIHandler):
+    """ASGIHandler without the middleware and the per-request thread, for /api/events/"""
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        self._middleware_chain = convert_exception_to_response(self._get_response_async)
+
+    async def __call__(self, scope, receive, send):
+        # ASGIHandler runs handle() in a ThreadSensitiveContext, the thread it
+        # starts would stay with the stream for as long as it is open
+        await self.handle(scope, receive, send)
+
+def with_event_streams(application):
+    """Wrap the ASGI application so /api/events/ requests go to EventStreamHandler"""
+    handler = EventStreamHandler()
+    path = reverse('events')
+
+    async def route(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].removeprefix(scope.get('root_path', '')) == path:
+            await handler(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+    return route
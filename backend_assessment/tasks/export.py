@@ -0,0 +1,86 @@
+"""
+Streaming export of every task a user owns. Rows are read with a server-side
+iterator in chunks of EXPORT_CHUNK_SIZE with labels prefetched per chunk, and
+written out chunk by chunk, so memory stays flat however many tasks there are.
+
+Django's ASGI handler buffers a streaming response whose content is a plain
+iterator, it reads it to the end in a worker thread before sending anything.
+Requests that came in over ASGI get an async iterator instead, reading rows
+with aiterator(), which is sent chunk by chunk as it is read.
+"""
+from itertools import islice
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .models import Task
+from .renderers import dumps
+from .serializers import TaskSerializer, ExpandedTaskSerializer
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+def export_queryset(owner_id, expand=False):
+    return Task.objects.filter(owner_id=owner_id).with_labels(expanded=expand).order_by('id')
+
+def export_rows(owner_id, expand=False):
+    # one serializer for every row, building a new one per task adds up
+    serializer = (ExpandedTaskSerializer if expand else TaskSerializer)()
+    for task in export_queryset(owner_id, expand).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield serializer.to_representation(task)
+
+async def aexport_rows(owner_id, expand=False):
+    """export_rows() for async streams, labels are prefetched per chunk as well"""
+    serializer = (ExpandedTaskSerializer if expand else TaskSerializer)()
+    async for task in export_queryset(owner_id, expand).aiterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield serializer.to_representation(task)
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+async def achunked(rows, size):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def encode_chunk(chunk, output, first):
+    """A chunk of rows as NDJSON lines, or as the next part of a JSON array"""
+    if output == 'ndjson':
+        return b''.join(dumps(row) + b'\n' for row in chunk)
+    return (b'' if first else b',') + b','.join(dumps(row) for row in chunk)
+
+def encode_chunks(rows, output):
+    """Serialize rows as a JSON array or as NDJSON, one yield per chunk"""
+    if output == 'json':
+        yield b'['
+    for index, chunk in enumerate(chunked(rows, settings.EXPORT_CHUNK_SIZE)):
+        yield encode_chunk(chunk, output, first=index == 0)
+    if output == 'json':
+        yield b']\n'
+
+async def aencode_chunks(rows, output):
+    """encode_chunks() of an async iterator of rows"""
+    if output == 'json':
+        yield b'['
+    first = True
+    async for chunk in achunked(rows, settings.EXPORT_CHUNK_SIZE):
+        yield encode_chunk(chunk, output, first)
+        first = False
+    if output == 'json':
+        yield b']\n'
+
+def export_response(owner_id, output, expand=False, asynchronous=False):
+    if asynchronous:
+        content = aencode_chunks(aexport_rows(owner_id, expand), output)
+    else:
+        content = encode_chunks(export_rows(owner_id, expand), output)
+    response = StreamingHttpResponse(content, content_type=f'{CONTENT_TYPES[output]}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="tasks.{output}"'
+    return response
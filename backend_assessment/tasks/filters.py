@@ -0,0 +1,57 @@
+from django.db.models import Q
+from rest_framework import serializers
+from .models import Task
+
+TaskLabel = Task.labels.through
+
+MAX_FILTER_LABELS = 20
+
+class TaskFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the task list"""
+    is_completed = serializers.BooleanField(required=False)
+    labels = serializers.CharField(required=False)
+    labels_match = serializers.ChoiceField(choices=('any', 'all'), default='any')
+    search = serializers.CharField(required=False, max_length=200)
+
+    def validate_labels(self, value):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in value.split(',') if pk.strip()))
+        except ValueError:
+            raise serializers.ValidationError('Expected a comma separated list of label ids.')
+        if len(ids) > MAX_FILTER_LABELS:
+            raise serializers.ValidationError(f'Filter on at most {MAX_FILTER_LABELS} labels.')
+        return ids
+
+def filter_tasks(queryset, query_params):
+    """Narrow a task queryset with the list filters, invalid params raise a 400"""
+    # a plain dict so missing booleans stay missing instead of reading as False
+    serializer = TaskFilterSerializer(data=query_params.dict())
+    serializer.is_valid(raise_exception=True)
+    return apply_filters(queryset, serializer.validated_data)
+
+def apply_filters(queryset, params):
+    """Narrow a task queryset with already validated TaskFilterSerializer data"""
+    if 'is_completed' in params:
+        # exact=True compiles to a bare column test which can't use the
+        # (owner, is_completed, id) index, IN (...) can
+        queryset = queryset.filter(is_completed__in=[params['is_completed']])
+
+    label_ids = params.get('labels')
+    if label_ids:
+        # pk IN (through rows by label) starts from the (label_id, task_id)
+        # index instead of walking every task the owner has
+        if params['labels_match'] == 'all':
+            for label_id in label_ids:
+                queryset = queryset.filter(
+                    pk__in=TaskLabel.objects.filter(label_id=label_id).values('task_id')
+                )
+        else:
+            queryset = queryset.filter(
+                pk__in=TaskLabel.objects.filter(label_id__in=label_ids).values('task_id')
+            )
+
+    search = params.get('search')
+    if search:
+        queryset = queryset.filter(Q(title__icontains=search) | Q(description__icontains=search))
+
+    return queryset
@@ -0,0 +1,17 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tasks.models import Change
+
+
+class Command(BaseCommand):
+    help = 'Delete sync change log entries older than SYNC_TOKEN_MAX_AGE, no live token can reach them.'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.SYNC_TOKEN_MAX_AGE)
+        # ids grow with time, so everything below the first recent entry is old
+        boundary = Change.objects.filter(created_at__gte=cutoff).order_by('id').values_list('id', flat=True).first()
+        stale = Change.objects.all() if boundary is None else Change.objects.filter(id__lt=boundary)
+        deleted, _ = stale.delete()
+        self.stdout.write(f'Deleted {deleted} change log entries.')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from tasks.models import Label, recount_label_tasks
+
+
+class Command(BaseCommand):
+    help = 'Recount Label.task_count from the task/label links, after writes that bypassed the ORM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', type=int, help='only recount the labels of this user id')
+
+    def handle(self, *args, **options):
+        labels = Label.objects.all()
+        if options['owner'] is not None:
+            labels = labels.filter(owner_id=options['owner'])
+        updated = recount_label_tasks(labels)
+        self.stdout.write(f'Recounted {updated} labels.')
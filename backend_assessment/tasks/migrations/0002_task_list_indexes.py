@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 04:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'id'], name='task_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'is_completed', 'id'], name='task_owner_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['owner', 'title', 'id'], name='task_owner_title_idx'),
+        ),
+        # the auto-created through table has no Meta to declare this on, it backs
+        # the ?labels= filter which looks tasks up by label
+        migrations.RunSQL(
+            sql='CREATE INDEX "tasks_task_labels_label_task_idx" ON "tasks_task_labels" ("label_id", "task_id");',
+            reverse_sql='DROP INDEX "tasks_task_labels_label_task_idx";',
+        ),
+    ]
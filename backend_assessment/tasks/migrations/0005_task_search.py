@@ -0,0 +1,91 @@
+from django.db import migrations
+
+# SQLite: an FTS5 index over a view of tasks_task, so the text isn't stored
+# twice. The owner is indexed as a token ("o<id>") to scope a search inside the
+# index. Two and three letter prefixes get index entries of their own, so a
+# short word still being typed doesn't expand to every term it starts.
+# Triggers keep the index in step with every insert, update and delete,
+# including bulk_create(), QuerySet.update() and cascades. SQLite can't rename
+# a table a view reads from, so this view stopped any migration that rebuilds
+# tasks_task, 0007 replaces it with an index that reads tasks_task directly.
+SQLITE_INDEX = [
+    '''
+    CREATE VIEW "tasks_task_search_source" AS
+    SELECT "id", 'o' || "owner_id" AS "owner_key", "title", "description" FROM "tasks_task"
+    ''',
+    '''
+    CREATE VIRTUAL TABLE "tasks_task_fts" USING fts5(
+        "owner_key", "title", "description",
+        content='tasks_task_search_source', content_rowid='id', tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER "tasks_task_fts_insert" AFTER INSERT ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("rowid", "owner_key", "title", "description")
+        VALUES (new."id", 'o' || new."owner_id", new."title", new."description");
+    END
+    ''',
+    '''
+    CREATE TRIGGER "tasks_task_fts_delete" AFTER DELETE ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("tasks_task_fts", "rowid", "owner_key", "title", "description")
+        VALUES ('delete', old."id", 'o' || old."owner_id", old."title", old."description");
+    END
+    ''',
+    # narrow saves that only touch updated_at or is_completed don't reindex
+    '''
+    CREATE TRIGGER "tasks_task_fts_update" AFTER UPDATE OF "owner_id", "title", "description" ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("tasks_task_fts", "rowid", "owner_key", "title", "description")
+        VALUES ('delete', old."id", 'o' || old."owner_id", old."title", old."description");
+        INSERT INTO "tasks_task_fts" ("rowid", "owner_key", "title", "description")
+        VALUES (new."id", 'o' || new."owner_id", new."title", new."description");
+    END
+    ''',
+    # index the tasks that already exist
+    'INSERT INTO "tasks_task_fts" ("tasks_task_fts") VALUES (\'rebuild\')',
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER "tasks_task_fts_update"',
+    'DROP TRIGGER "tasks_task_fts_delete"',
+    'DROP TRIGGER "tasks_task_fts_insert"',
+    'DROP TABLE "tasks_task_fts"',
+    'DROP VIEW "tasks_task_search_source"',
+]
+
+# PostgreSQL: a generated tsvector column, titles weighted above descriptions,
+# with a GIN index. The database recomputes it on every write.
+POSTGRESQL_INDEX = [
+    '''
+    ALTER TABLE "tasks_task" ADD COLUMN "search_vector" tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce("title", '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce("description", '')), 'B')
+    ) STORED
+    ''',
+    'CREATE INDEX "task_search_vector_idx" ON "tasks_task" USING GIN ("search_vector")',
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX "task_search_vector_idx"',
+    'ALTER TABLE "tasks_task" DROP COLUMN "search_vector"',
+]
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 06:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_tasks(apps, schema_editor):
+    Label = apps.get_model('tasks', 'Label')
+    TaskLabel = apps.get_model('tasks', 'Task').labels.through
+    per_label = TaskLabel.objects.filter(label_id=OuterRef('pk')).order_by().values('label_id')
+    Label.objects.update(task_count=Coalesce(Subquery(per_label.annotate(count=Count('*')).values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_task_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from importlib import import_module
+from django.db import migrations
+
+task_search = import_module('tasks.migrations.0005_task_search')
+
+# SQLite: 0005 built the FTS5 index over a view of tasks_task, and SQLite
+# refuses to rename a table a view reads from, so every later migration that
+# rebuilds tasks_task failed. The index now reads tasks_task itself (external
+# content), with owner_id indexed as a token to scope a search inside the
+# index. A rebuild still drops the triggers along with the old table,
+# tasks.search.restore_sqlite_triggers() adds them back after migrate.
+SQLITE_TABLE = '''
+CREATE VIRTUAL TABLE "tasks_task_fts" USING fts5(
+    "owner_id", "title", "description",
+    content='tasks_task', content_rowid='id', tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+'''
+
+SQLITE_TRIGGERS = {
+    'tasks_task_fts_insert': '''
+    CREATE TRIGGER "tasks_task_fts_insert" AFTER INSERT ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("rowid", "owner_id", "title", "description")
+        VALUES (new."id", new."owner_id", new."title", new."description");
+    END
+    ''',
+    'tasks_task_fts_delete': '''
+    CREATE TRIGGER "tasks_task_fts_delete" AFTER DELETE ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("tasks_task_fts", "rowid", "owner_id", "title", "description")
+        VALUES ('delete', old."id", old."owner_id", old."title", old."description");
+    END
+    ''',
+    # narrow saves that only touch updated_at or is_completed don't reindex
+    'tasks_task_fts_update': '''
+    CREATE TRIGGER "tasks_task_fts_update" AFTER UPDATE OF "owner_id", "title", "description" ON "tasks_task" BEGIN
+        INSERT INTO "tasks_task_fts" ("tasks_task_fts", "rowid", "owner_id", "title", "description")
+        VALUES ('delete', old."id", old."owner_id", old."title", old."description");
+        INSERT INTO "tasks_task_fts" ("rowid", "owner_id", "title", "description")
+        VALUES (new."id", new."owner_id", new."title", new."description");
+    END
+    ''',
+}
+
+SQLITE_REBUILD = 'INSERT INTO "tasks_task_fts" ("tasks_task_fts") VALUES (\'rebuild\')'
+
+SQLITE_INDEX = [SQLITE_TABLE, *SQLITE_TRIGGERS.values(), SQLITE_REBUILD]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS "tasks_task_fts_update"',
+    'DROP TRIGGER IF EXISTS "tasks_task_fts_delete"',
+    'DROP TRIGGER IF EXISTS "tasks_task_fts_insert"',
+    'DROP TABLE "tasks_task_fts"',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_label_task_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            task_search.run({'sqlite': task_search.SQLITE_DROP + SQLITE_INDEX}),
+            task_search.run({'sqlite': SQLITE_DROP + task_search.SQLITE_INDEX}),
+        ),
+    ]
@@ -1,9 +1,15 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 class Label(models.Model):
     name = models.CharField(max_length=100)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    # denormalized number of tasks carrying the label, see count_label_links()
+    task_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ('name', 'owner')
@@ -12,12 +18,125 @@ class Label(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # post_save receivers write the change log and version stamps, see
+        # tasks/signals.py, they commit or roll back with the row
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+class TaskQuerySet(models.QuerySet):
+    def with_labels(self, expanded=False):
+        """Prefetch labels so a whole page of tasks costs one extra query"""
+        fields = ('id', 'name') if expanded else ('id',)
+        labels = Label.objects.only(*fields).order_by('id')
+        return self.prefetch_related(models.Prefetch('labels', queryset=labels))
+
+    def delete(self):
+        # the through rows cascade without m2m_changed, uncount them in one statement first
+        with transaction.atomic(savepoint=False):
+            count_label_links(Task.labels.through.objects.filter(task__in=self.values('pk')), -1)
+            return super().delete()
+
 class Task(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     is_completed = models.BooleanField(default=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     labels = models.ManyToManyField(Label, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        # match the task list filters and keyset orderings, see tasks/filters.py
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='task_owner_id_idx'),
+            models.Index(fields=['owner', 'is_completed', 'id'], name='task_owner_completed_idx'),
+            models.Index(fields=['owner', 'title', 'id'], name='task_owner_title_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            count_label_links(Task.labels.through.objects.filter(task_id=self.pk), -1)
+            return super().delete(*args, **kwargs)
+
+def label_link_counts(links):
+    """Subquery counting the rows of links, Task.labels.through rows, per outer label"""
+    return Subquery(
+        links.filter(label_id=OuterRef('pk')).order_by().values('label_id').annotate(count=Count('*')).values('count')
+    )
+
+def count_label_links(links, sign):
+    """
+    Add (sign=1) the through rows in links to Label.task_count, or take them
+    away (sign=-1), with one UPDATE. Call it after inserting or before deleting them.
+    """
+    return Label.objects.filter(pk__in=links.values('label_id')).update(
+        task_count=F('task_count') + Value(sign) * label_link_counts(links),
+    )
+
+def recount_label_tasks(labels):
+    """Recount Label.task_count for a queryset of labels from the through table"""
+    return labels.update(task_count=Coalesce(label_link_counts(Task.labels.through.objects.all()), 0))
+
+class CollectionVersion(models.Model):
+    """
+    Per-user counter bumped on every write to a collection, so list ETags can
+    be checked with one indexed lookup instead of serializing the list
+    """
+    TASKS = 'tasks'
+    LABELS = 'labels'
+    COLLECTION_CHOICES = [(TASKS, 'Tasks'), (LABELS, 'Labels')]
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    collection = models.CharField(max_length=20, choices=COLLECTION_CHOICES)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('owner', 'collection')
+
+    def __str__(self):
+        return f'{self.owner_id}/{self.collection}@{self.version}'
+
+    @classmethod
+    def collection_for(cls, model):
+        return {Task: cls.TASKS, Label: cls.LABELS}[model]
+
+    @classmethod
+    def bump(cls, owner_id, collection):
+        updated = cls.objects.filter(owner_id=owner_id, collection=collection).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(owner_id=owner_id, collection=collection, defaults={'version': 1})
+
+class Change(models.Model):
+    """
+    Append-only log of writes to a user's tasks and labels. The id doubles as
+    the sync position, so /sync/ reads everything after a token with one
+    range scan on (owner, id).
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    collection = models.CharField(max_length=20, choices=CollectionVersion.COLLECTION_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'id'], name='change_owner_id_idx')]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f'{self.collection}/{self.object_id} {self.action}'
@@ -0,0 +1,176 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the ordering key instead of using OFFSET,
+    so fetching page 1000 costs the same single indexed range scan as page 1.
+    Ties on the ordering field are broken on id, which keeps every position
+    unique. Cursors are opaque to clients and only ever point at a row boundary.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # fields clients may order by, prefix with '-' for descending
+    ordering_fields = ('id',)
+    default_ordering = 'id'
+    # what a cursor's position may hold for each key
+    key_types = {'id': int}
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views"""
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.cursor = self.decode_cursor(request)
+
+        reverse, position, inclusive = self.cursor or (False, None, False)
+        queryset = self.seek(queryset, reverse, position, inclusive)
+        # one row past the page tells us whether there is another page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        reverse, position, _ = self.cursor or (False, None, False)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        return self.page
+
+    def seek(self, queryset, reverse, position, inclusive):
+        """Order the queryset by the keyset and skip everything up to position"""
+        keys = self.get_keys()
+        field = keys[0]
+        backwards = self.ordering.startswith('-') != reverse
+        prefix, lookup = ('-', 'lt') if backwards else ('', 'gt')
+
+        queryset = queryset.order_by(*(prefix + key for key in keys))
+        if position is None:
+            return queryset
+
+        condition = Q(**{f'id__{lookup}{"e" if inclusive else ""}': position[-1]})
+        if len(keys) > 1:
+            condition = Q(**{f'{field}__{lookup}': position[0]}) | Q(Q(**{field: position[0]}), condition)
+        return queryset.filter(condition)
+
+    def get_keys(self):
+        field = self.ordering.lstrip('-')
+        return (field,) if field == 'id' else (field, 'id')
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({self.ordering_query_param: [
+                f'Ordering must be one of {", ".join(self.ordering_fields)}, optionally prefixed with "-".'
+            ]})
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # empty page before the start, resume forward from the boundary
+            return self.encode_cursor(False, self.cursor[1], inclusive=True)
+        return self.encode_cursor(False, self._position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # empty page past the end, step back over the boundary
+            return self.encode_cursor(True, self.cursor[1], inclusive=True)
+        return self.encode_cursor(True, self._position(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse = bool(payload['r'])
+            inclusive = bool(payload.get('i'))
+            position = payload['p']
+            # a cursor only makes sense for the ordering it was issued under
+            if payload['o'] != self.ordering or len(position) != len(self.get_keys()):
+                raise ValueError
+            if not isinstance(position, list) or not all(map(self.valid_key, self.get_keys(), position)):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, AttributeError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position, inclusive
+
+    def valid_key(self, key, value):
+        # bool is an int to isinstance(), and json.loads() reads NaN
+        if isinstance(value, bool) or not isinstance(value, self.key_types[key]):
+            return False
+        if isinstance(value, int):
+            return -2 ** 63 <= value < 2 ** 63
+        return not isinstance(value, float) or math.isfinite(value)
+
+    def encode_cursor(self, reverse, position, inclusive=False):
+        payload = {'o': self.ordering, 'r': int(reverse), 'p': position}
+        if inclusive:
+            payload['i'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _position(self, instance):
+        if isinstance(instance, dict):
+            return [instance[key] for key in self.get_keys()]
+        return [getattr(instance, key) for key in self.get_keys()]
+
+
+class TaskPagination(KeysetPagination):
+    ordering_fields = ('id', 'title')
+    key_types = {'id': int, 'title': str}
+
+
+class SearchPagination(KeysetPagination):
+    # best matches first, see tasks/search.py
+    ordering_fields = ('rank',)
+    default_ordering = 'rank'
+    # a whole number on SQLite, ts_rank() on PostgreSQL
+    key_types = {'id': int, 'rank': (int, float)}
@@ -0,0 +1,177 @@
+"""
+Request timings. PerformanceMiddleware measures each request's wall time, its
+database queries (count and time, through an execute wrapper installed on
+every connection as it is opened), the time spent rendering the response and
+the response size. The timings go out in a Server-Timing header, and the
+last PERFORMANCE_SAMPLES requests per route name and method are kept in this
+process for the p50/p95/p99 summary at /api/performance/.
+
+Under ASGI a request's queries run on the connections of whichever thread
+sync_to_async picks, so the timer isn't tied to a connection: the wrapper
+reports to the timer of the current request, kept in a context variable.
+
+Queries slower than PERFORMANCE_SLOW_QUERY_MS are logged with their SQL on
+the tasks.performance logger, which also logs one line per request at DEBUG.
+"""
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FIELDS = ('total_ms', 'db_ms', 'queries', 'render_ms', 'size_bytes')
+PERCENTILES = (50, 95, 99)
+
+_samples = {}
+_lock = Lock()
+# the timer of the request being handled, sync_to_async copies it into the
+# threads that run sync views and async ORM queries under ASGI
+_current_timer = ContextVar('performance_timer', default=None)
+
+class RequestTimer:
+    """Timings of one request, time_query() hands it the queries the request runs"""
+
+    def __init__(self, request):
+        self.path = request.path
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db += duration
+            if duration * 1000 >= settings.PERFORMANCE_SLOW_QUERY_MS:
+                logger.warning('slow query (%.1f ms) on %s: %s; params=%r', duration * 1000, self.path, sql, params)
+
+    @contextmanager
+    def current(self):
+        token = _current_timer.set(self)
+        try:
+            yield
+        finally:
+            _current_timer.reset(token)
+
+    def rendered(self, response):
+        # post-render callback of template responses, see process_template_response()
+        if self.render_started is not None:
+            self.render += time.perf_counter() - self.render_started
+            self.render_started = None
+
+    def server_timing(self, total):
+        return (
+            f'total;dur={total * 1000:.1f}, '
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f'render;dur={self.render * 1000:.1f}'
+        )
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection, times the query for the current request if there is one"""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+def watch_connection(connection):
+    """Install time_query on a new connection, each thread has its own connections"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+@contextmanager
+def measure_render(request):
+    """Count the block as render time of request, for views that render responses themselves"""
+    timer = getattr(request, 'performance', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.render += time.perf_counter() - start
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = request.performance = RequestTimer(request)
+        start = time.perf_counter()
+        with timer.current():
+            response = self.get_response(request)
+        return self.finish(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timer = request.performance = RequestTimer(request)
+        start = time.perf_counter()
+        with timer.current():
+            response = await self.get_response(request)
+        return self.finish(request, response, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns, time that separately
+        timer = request.performance
+        timer.render_started = time.perf_counter()
+        response.add_post_render_callback(timer.rendered)
+        return response
+
+    def finish(self, request, response, total):
+        timer = request.performance
+        response['Server-Timing'] = timer.server_timing(total)
+        # streamed bodies aren't known yet
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        route = match.url_name if match is not None else None
+        logger.debug(
+            '%s %s %s %s %.1fms db=%.1fms/%d render=%.1fms size=%s', request.method, request.path, route,
+            response.status_code, total * 1000, timer.db * 1000, timer.queries, timer.render * 1000, size,
+        )
+        if route:
+            record(route, request.method, (total * 1000, timer.db * 1000, timer.queries, timer.render * 1000, size))
+        return response
+
+def record(route, method, sample):
+    with _lock:
+        samples = _samples.get((route, method))
+        if samples is None:
+            samples = _samples[(route, method)] = deque(maxlen=settings.PERFORMANCE_SAMPLES)
+        samples.append(sample)
+
+def percentiles(values):
+    """Nearest-rank p50/p95/p99, None without values"""
+    if not values:
+        return None
+    values = sorted(values)
+    return {f'p{p}': values[max(math.ceil(p / 100 * len(values)), 1) - 1] for p in PERCENTILES}
+
+def stats():
+    """Percentiles of the recent requests of every route and method seen by this process"""
+    with _lock:
+        samples = {key: list(values) for key, values in _samples.items()}
+    routes = []
+    for (route, method), rows in sorted(samples.items()):
+        summary = {'route': route, 'method': method, 'count': len(rows)}
+        for name, values in zip(SAMPLE_FIELDS, zip(*rows)):
+            summary[name] = percentiles([value for value in values if value is not None])
+        routes.append(summary)
+    return routes
+
+def reset():
+    with _lock:
+        _samples.clear()
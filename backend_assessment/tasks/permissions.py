@@ -0,0 +1,11 @@
+from django.contrib.auth.models import User
+from rest_framework.permissions import BasePermission
+
+class IsStaff(BasePermission):
+    """Staff accounts only. Token users carry no is_staff, so it is read from the User row."""
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user and request.user.is_authenticated
+            and User.objects.filter(pk=request.user.id, is_staff=True).exists()
+        )
@@ -0,0 +1,86 @@
+"""
+Set-based relabelling for /labels/<id>/tasks/. Tasks are picked by an id list
+or by the task list filters. The label is added with one INSERT ... SELECT
+into the through table, or removed with one DELETE ... WHERE task_id IN
+(SELECT ...). Ownership is part of the SELECT, so someone else's task ids
+match nothing.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from rest_framework import serializers
+from .filters import TaskFilterSerializer, apply_filters
+from .models import Label, Task
+from .signals import notify
+
+MAX_SELECTED_IDS = 1000
+# keeps the touch of updated_at under SQLite's bound parameter limit
+TOUCH_BATCH_SIZE = 1000
+
+TaskLabel = Task.labels.through
+
+class TaskSelectionSerializer(serializers.Serializer):
+    """Body of /labels/<id>/tasks/, either task ids or task list filters"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_SELECTED_IDS, required=False,
+    )
+    filter = TaskFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError('Expected either ids or filter.')
+        return attrs
+
+def add_label(label, data):
+    """Link label to every selected task that doesn't have it yet, returns their ids"""
+    rows = selected_tasks(label.owner_id, data).annotate(label_ref=Value(label.pk)).values('pk', 'label_ref')
+    select, params = rows.query.sql_with_params()
+    # rows that already exist are skipped by the unique (task, label) constraint,
+    # OR IGNORE on SQLite and ON CONFLICT DO NOTHING on PostgreSQL
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    on_conflict = connection.ops.on_conflict_suffix_sql(TaskLabel._meta.fields, OnConflict.IGNORE, None, None)
+    sql = (
+        f'{insert} {table()} ({column("task")}, {column("label")}) {select} {on_conflict} '
+        f'RETURNING {column("task")}'
+    )
+    return relabelled(label, sql, params, 1)
+
+def remove_label(label, data):
+    """Unlink label from every selected task that has it, returns their ids"""
+    select, params = selected_tasks(label.owner_id, data).values('pk').query.sql_with_params()
+    sql = (
+        f'DELETE FROM {table()} WHERE {column("label")} = %s AND {column("task")} IN ({select}) '
+        f'RETURNING {column("task")}'
+    )
+    return relabelled(label, sql, (label.pk, *params), -1)
+
+def selected_tasks(owner_id, data):
+    serializer = TaskSelectionSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    selection = serializer.validated_data
+
+    tasks = Task.objects.filter(owner_id=owner_id)
+    if 'ids' in selection:
+        return tasks.filter(pk__in=selection['ids'])
+    return apply_filters(tasks, selection['filter'])
+
+def relabelled(label, sql, params, sign):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            pks = sorted(pk for pk, in cursor.fetchall())
+        if pks:
+            # the through table bypasses m2m_changed, so do what its receivers would
+            Label.objects.filter(pk=label.pk).update(task_count=F('task_count') + sign * len(pks))
+            now = timezone.now()
+            for start in range(0, len(pks), TOUCH_BATCH_SIZE):
+                Task.objects.filter(pk__in=pks[start:start + TOUCH_BATCH_SIZE]).update(updated_at=now)
+            notify(Task, label.owner_id, updated=pks)
+    return pks
+
+def table():
+    return connection.ops.quote_name(TaskLabel._meta.db_table)
+
+def column(name):
+    return connection.ops.quote_name(TaskLabel._meta.get_field(name).column)
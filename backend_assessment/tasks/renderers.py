@@ -0,0 +1,78 @@
+"""
+JSON renderer and parser for the API, drop-in replacements for DRF's that
+encode and decode with orjson when it is installed (`pip install orjson`)
+and with the stdlib json module otherwise.
+
+Output is the JSON JSONRenderer writes with this project's DRF settings:
+compact, UTF-8, datetimes through DRF's encoder, and U+2028/U+2029 escaped.
+Anything orjson can't take (an indent from the browsable API or Accept:
+application/json; indent=4, integers over 64 bits, non-string keys) goes
+through the stdlib path. Only floats are spelled differently: exponents
+come out shorter (1e-7 for 1e-07, the same number to any parser), and NaN
+and Infinity come out as null where JSONRenderer raises a ValueError.
+
+orjson reads integers past 64 bits as floats, so bodies that may hold one
+are parsed with the stdlib, which keeps them exact. So are bodies orjson
+rejects, the stdlib takes a few it doesn't (2e400 as Infinity).
+"""
+import re
+from io import BytesIO
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# datetimes go to DRF's encoder, which writes UTC as Z like the stdlib path
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+# digits enough for an integer outside -2**63 to 2**64 - 1, strings and long fractions included
+BIG_INTEGER = re.compile(rb'-\d{19}|\d{20}')
+
+_default = JSONEncoder().default
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes of data, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass
+    return JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode(data).encode()
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # as JSONRenderer does, so the output stays a strict javascript subset
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(LINE_SEPARATORS[0], b'\\u2028').replace(LINE_SEPARATORS[1], b'\\u2029')
+        return ret
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if not BIG_INTEGER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        # the stdlib's answer, a 400 for anything that isn't JSON to it either
+        return super().parse(BytesIO(body), media_type, parser_context)
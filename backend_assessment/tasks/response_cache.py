@@ -0,0 +1,93 @@
+"""
+Per-user cache of the /labels/ and /tasks/ list responses. Entries are keyed
+by user, collection, the user's CollectionVersion of that collection and the
+representation asked for (renderer and full URL), and live in the
+RESPONSE_CACHE_ALIAS cache, whose backend decides eviction.
+
+The version is read from the database, the same indexed lookup condition()
+makes for the list ETag, so a hit costs one query. Every write bumps it in
+the transaction of the write, which makes all earlier entries unreachable
+in every server process as soon as it commits, and never before. The
+version's updated_at is part of the key too, so a version a rolled back
+transaction used doesn't find the lists it cached when it is bumped again.
+"""
+import hashlib
+from functools import partial, wraps
+from threading import Lock
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+from .conditional import collection_state, representation
+
+_metrics = dict.fromkeys(('hits', 'misses', 'stores'), 0)
+_lock = Lock()
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+def count(name):
+    with _lock:
+        _metrics[name] += 1
+
+def metrics():
+    """Hit and miss counts of this process"""
+    with _lock:
+        counts = dict(_metrics)
+    lookups = counts['hits'] + counts['misses']
+    counts['hit_ratio'] = counts['hits'] / lookups if lookups else None
+    return counts
+
+def reset_metrics():
+    with _lock:
+        _metrics.update(dict.fromkeys(_metrics, 0))
+
+def entry_key(request, collection, state):
+    # next/previous links are absolute, so the host is part of the key too
+    version, updated_at = state
+    renderer, _ = representation(request)
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'responses:{request.user.id}:{collection}:{version}:{updated_at.isoformat()}:{renderer}:{url}'
+
+def cached_list(collection):
+    """Serve GETs of the decorated list view from the cache, place it above condition()"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            state = collection_state(request, collection)
+            # a user who never wrote has no version, and nothing tells their lists from those of an
+            # earlier user with the same id
+            key = entry_key(request, collection, state) if state[1] is not None else None
+            cache = get_cache()
+            entry = cache.get(key) if key is not None else None
+            if entry is not None:
+                count('hits')
+                return cached_response(request, *entry)
+
+            count('misses')
+            response = view(request, *args, **kwargs)
+            if key is not None and isinstance(response, Response) and response.status_code == 200:
+                cache.set(key, (response.data, response.get('ETag'), response.get('Last-Modified')))
+                count('stores')
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+def cached_response(request, data, etag, last_modified):
+    # answers If-None-Match and If-Modified-Since the way condition() would
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified and parse_http_date_safe(last_modified),
+    )
+    if response is None:
+        response = Response(data)
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = last_modified
+    response['X-Cache'] = 'HIT'
+    return response
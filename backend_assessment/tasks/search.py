@@ -0,0 +1,97 @@
+"""
+Ranked full-text search over task titles and descriptions for /tasks/search/.
+The index comes from migrations 0005 and 0007: FTS5 on SQLite, a tsvector
+column with a GIN index on PostgreSQL. Both are kept in sync by the database
+itself, SQLite through triggers that restore_sqlite_triggers() puts back when
+a migration rebuilds tasks_task.
+
+Queries are split into words and every word has to match in the title or the
+description. The last word matches as a prefix, it may still be being typed.
+Results carry a rank, lower is a better match, so they page in ascending
+(rank, id) order like any other keyset. A rank only depends on its own row,
+so other owners' writes to the shared index don't move results between pages.
+"""
+import re
+from importlib import import_module
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import BooleanField, FloatField, IntegerField
+from django.db.models.expressions import RawSQL
+from rest_framework import serializers
+from .models import Task
+
+MAX_SEARCH_TERMS = 8
+
+SQLITE_TABLE = 'tasks_task_fts'
+SQLITE_MIGRATION = ('tasks', '0007_task_search_content')
+# what a word found in each column adds to a task's score
+SQLITE_WEIGHTS = {'title': 10, 'description': 1}
+
+class TaskSearchSerializer(serializers.Serializer):
+    """Query parameters accepted by the task search"""
+    q = serializers.CharField(max_length=200)
+
+    def validate_q(self, value):
+        # only word characters reach the query syntax of either backend
+        terms = list(dict.fromkeys(re.findall(r'\w+', value.lower())))
+        if not terms:
+            raise serializers.ValidationError('Search for at least one word.')
+        if len(terms) > MAX_SEARCH_TERMS:
+            raise serializers.ValidationError(f'Search for at most {MAX_SEARCH_TERMS} words.')
+        return terms
+
+def search_tasks(owner_id, query_params):
+    """owner_id's tasks matching ?q=, annotated with their rank, invalid params raise a 400"""
+    serializer = TaskSearchSerializer(data=query_params.dict())
+    serializer.is_valid(raise_exception=True)
+    terms = serializer.validated_data['q']
+
+    tasks = Task.objects.filter(owner_id=owner_id)
+    if connection.vendor == 'postgresql':
+        return postgresql_search(tasks, terms)
+    return sqlite_search(tasks, owner_id, terms)
+
+def sqlite_search(tasks, owner_id, terms):
+    # the owner token narrows the match inside the index, before any row is read
+    owner = f'owner_id : "{owner_id}"'
+    words = [*(f'"{term}"' for term in terms[:-1]), f'"{terms[-1]}" *']
+    match = f'{owner} AND {{title description}} : ({" AND ".join(words)})'
+    # bm25() weighs words by how common they are in the whole index, which
+    # every owner writes to, so its ranks shift under a client paging through
+    # results. Scoring which words each row has in which column holds still.
+    found = f'{Task._meta.db_table}.id IN (SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s)'
+    hits, params = [], []
+    for column, weight in SQLITE_WEIGHTS.items():
+        for word in words:
+            hits.append(f'{weight} * ({found})')
+            params.append(f'{owner} AND {column} : ({word})')
+    return tasks.filter(
+        RawSQL(found, (match,), output_field=BooleanField()),
+    ).annotate(rank=RawSQL(f'-({" + ".join(hits)})', params, output_field=IntegerField()))
+
+def postgresql_search(tasks, terms):
+    query = ' & '.join([*terms[:-1], f'{terms[-1]}:*'])
+    vector = f'{Task._meta.db_table}.search_vector'
+    return tasks.filter(
+        RawSQL(f"{vector} @@ to_tsquery('simple', %s)", (query,), output_field=BooleanField()),
+    ).annotate(
+        # negated so that lower is better, ts_rank() only reads the row's own vector
+        rank=RawSQL(f"-ts_rank({vector}, to_tsquery('simple', %s))", (query,), output_field=FloatField()),
+    )
+
+def restore_sqlite_triggers(using=connection):
+    """
+    Recreate the index triggers a migration dropped along with the old
+    tasks_task, then reindex the rows written while they were missing
+    """
+    if SQLITE_MIGRATION not in MigrationRecorder(using).applied_migrations():
+        return
+    index = import_module(f'{SQLITE_MIGRATION[0]}.migrations.{SQLITE_MIGRATION[1]}')
+    with using.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                       [Task._meta.db_table])
+        missing = set(index.SQLITE_TRIGGERS) - {name for name, in cursor.fetchall()}
+        for name in missing:
+            cursor.execute(index.SQLITE_TRIGGERS[name])
+        if missing:
+            cursor.execute(index.SQLITE_REBUILD)
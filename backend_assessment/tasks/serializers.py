@@ -1,12 +1,192 @@
+from django.db import connection
 from rest_framework import serializers
+from rest_framework.utils import model_meta
 from .models import Task, Label
 
-class LabelSerializer(serializers.ModelSerializer):
+def apply_changes(instance, validated_data):
+    """Set the values that differ from the instance and return their field names"""
+    changed = []
+    for name, value in validated_data.items():
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+    return changed
+
+def changed_update_fields(changed):
+    # auto_now is only written when updated_at is listed
+    return changed + ['updated_at']
+
+class ChangedFieldsMixin:
+    """
+    PUT and PATCH write only the columns whose value changed, in one narrow
+    UPDATE, and many-to-many fields go through set(), which only adds and
+    removes the rows that differ. Nothing is written when nothing changed.
+    """
+    def update(self, instance, validated_data):
+        relations = model_meta.get_field_info(instance).relations
+        many_to_many = {
+            name: validated_data.pop(name) for name, relation in relations.items()
+            if relation.to_many and name in validated_data
+        }
+        changed = apply_changes(instance, validated_data)
+        if changed:
+            instance.save(update_fields=changed_update_fields(changed))
+        for name, value in many_to_many.items():
+            getattr(instance, name).set(value)
+        return instance
+
+class LabelSerializer(ChangedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Label
-        fields = '__all__'
+        # task_count is only served by /tasks/stats/, label ETags don't follow it
+        fields = ('id', 'name', 'updated_at', 'owner')
+        # the owner is always the requesting user, views pass it to save()
+        read_only_fields = ('owner',)
+
+    def validate(self, attrs):
+        # a read-only owner drops DRF's unique_together validator, check it by id instead
+        owner_id = self.instance.owner_id if self.instance else self.context['request'].user.id
+        names = Label.objects.filter(owner_id=owner_id, name=attrs.get('name', getattr(self.instance, 'name', None)))
+        if self.instance is not None:
+            names = names.exclude(pk=self.instance.pk)
+        if names.exists():
+            raise serializers.ValidationError('The fields name, owner must make a unique set.', code='unique')
+        return attrs
+
+class OwnedLabelsField(serializers.ManyRelatedField):
+    """
+    Label ids of a task. The whole list is resolved with one query against the
+    task owner's labels, instead of a query per id against everyone's.
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('child_relation', serializers.PrimaryKeyRelatedField(queryset=Label.objects.all()))
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = []
+        for item in data:
+            # what PrimaryKeyRelatedField takes, int() would also pass True as 1 and 1.9 as 1
+            if isinstance(item, str) and item.isascii() and item.isdigit():
+                item = int(item)
+            if isinstance(item, bool) or not isinstance(item, int):
+                self.child_relation.fail('incorrect_type', data_type=type(item).__name__)
+            pks.append(item)
+
+        # an id the column can't hold can't exist, and the database driver would raise on it
+        low, high = connection.ops.integer_field_range(Label._meta.pk.get_internal_type())
+        labels = Label.objects.filter(owner_id=self.get_owner_id()).only('id').in_bulk(
+            [pk for pk in pks if low <= pk <= high],
+        )
+        missing = [pk for pk in pks if pk not in labels]
+        if missing:
+            # someone else's label doesn't exist as far as this user is concerned
+            message = self.child_relation.error_messages['does_not_exist']
+            raise serializers.ValidationError(
+                [message.format(pk_value=pk) for pk in missing], code='does_not_exist',
+            )
+        return [labels[pk] for pk in pks]
+
+    def get_owner_id(self):
+        if self.parent.instance is not None:
+            return self.parent.instance.owner_id
+        assert 'request' in self.context, (
+            'OwnedLabelsField needs the request in the serializer context to validate new tasks.'
+        )
+        return self.context['request'].user.id
+
+class TaskSerializer(ChangedFieldsMixin, serializers.ModelSerializer):
+    labels = OwnedLabelsField(required=False)
 
-class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
-        fields = '__all__'
+        # declared fields would otherwise come first, keep the model's order
+        fields = ('id', 'title', 'description', 'is_completed', 'updated_at', 'owner', 'labels')
+        read_only_fields = ('owner',)
+
+    def create(self, validated_data):
+        labels = validated_data.pop('labels', None)
+        task = super().create(validated_data)
+        if labels:
+            # a new task has no labels to diff against, add() is one bulk insert
+            task.labels.add(*labels)
+        return task
+
+class LabelSummarySerializer(LabelSerializer):
+    class Meta(LabelSerializer.Meta):
+        fields = ('id', 'name')
+
+class ExpandedTaskSerializer(TaskSerializer):
+    """Read-only task shape with label objects embedded instead of ids"""
+    labels = LabelSummarySerializer(many=True, read_only=True)
+
+class BulkTaskSerializer(serializers.ModelSerializer):
+    """One item of a bulk task write, labels are checked for the whole batch at once"""
+    labels = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    class Meta:
+        model = Task
+        fields = ('title', 'description', 'is_completed', 'labels')
+
+class BulkTaskUpdateSerializer(BulkTaskSerializer):
+    id = serializers.IntegerField(min_value=1)
+
+    class Meta(BulkTaskSerializer.Meta):
+        fields = ('id',) + BulkTaskSerializer.Meta.fields
+
+    def validate(self, attrs):
+        # partial validation skips required fields, but every item must name its task
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['This field is required.']})
+        return attrs
+
+# Read fast path for list responses. DRF builds every row field by field
+# through Field objects, which dominates CPU time on long lists, so list pages
+# are built straight from .values() rows instead. The output matches
+# TaskSerializer, ExpandedTaskSerializer and LabelSerializer exactly, see
+# tests/test_serializers.py.
+
+TASK_VALUES = ('id', 'title', 'description', 'is_completed', 'updated_at', 'owner')
+LABEL_VALUES = ('id', 'name', 'updated_at', 'owner')
+
+_datetime_field = serializers.DateTimeField()
+
+def represent_labels(rows):
+    """LabelSerializer(many=True).data for rows from .values(*LABEL_VALUES)"""
+    to_datetime = _datetime_field.to_representation
+    return [{**row, 'updated_at': to_datetime(row['updated_at'])} for row in rows]
+
+def represent_tasks(rows, expand=False):
+    """TaskSerializer(many=True).data for rows from .values(*TASK_VALUES), labels take one query"""
+    pairs = task_label_pairs(rows, expand) if rows else ()
+    return attach_labels(rows, pairs, expand)
+
+async def arepresent_tasks(rows, expand=False):
+    """represent_tasks() for async views"""
+    pairs = [pair async for pair in task_label_pairs(rows, expand)] if rows else ()
+    return attach_labels(rows, pairs, expand)
+
+def task_label_pairs(rows, expand):
+    through = Task.labels.through.objects.filter(task_id__in=[row['id'] for row in rows]).order_by('task_id', 'label_id')
+    if expand:
+        return through.values_list('task_id', 'label_id', 'label__name')
+    return through.values_list('task_id', 'label_id')
+
+def attach_labels(rows, pairs, expand):
+    labels = {row['id']: [] for row in rows}
+    if expand:
+        for task_id, label_id, name in pairs:
+            labels[task_id].append({'id': label_id, 'name': name})
+    else:
+        for task_id, label_id in pairs:
+            labels[task_id].append(label_id)
+
+    to_datetime = _datetime_field.to_representation
+    return [
+        {**row, 'updated_at': to_datetime(row['updated_at']), 'labels': labels[row['id']]}
+        for row in rows
+    ]
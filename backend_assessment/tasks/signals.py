@@ -0,0 +1,201 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, post_migrate
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from . import authentication, events, performance, search, statistics
+from .models import Task, Label, CollectionVersion, Change, count_label_links
+
+# Sent whenever a user's tasks or labels change, with sender set to the model
+# and created/updated/deleted lists of primary keys. Bulk writes that skip
+# the model signals send it themselves, see tasks/bulk.py.
+collection_changed = Signal()
+
+_pending_changes = ContextVar('pending_changes', default=None)
+_departing_owners = ContextVar('departing_owners', default=frozenset())
+
+def notify(model, owner_id, created=(), updated=(), deleted=()):
+    """Send collection_changed now, or queue it when inside batched_changes()"""
+    if owner_id in _departing_owners.get():
+        # the owner is being deleted along with everything they had
+        return
+    pending = _pending_changes.get()
+    if pending is None:
+        collection_changed.send(
+            sender=model, owner_id=owner_id,
+            created=list(created), updated=list(updated), deleted=list(deleted),
+        )
+        return
+    # dicts keep the order the changes happened in while dropping repeats
+    changes = pending.setdefault((model, owner_id), ({}, {}, {}))
+    for bucket, pks in zip(changes, (created, updated, deleted)):
+        bucket.update(dict.fromkeys(pks))
+
+@contextmanager
+def batched_changes():
+    """
+    Coalesce the notifications raised inside the block into one per model and
+    owner, sent when the block exits cleanly. Use it inside the transaction
+    doing the writes so receivers still run before the commit.
+    """
+    if _pending_changes.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _pending_changes.set(pending)
+    try:
+        yield
+    finally:
+        _pending_changes.reset(token)
+    for (model, owner_id), changes in pending.items():
+        notify(model, owner_id, *changes)
+
+def touch_tasks(pks):
+    now = timezone.now()
+    Task.objects.filter(pk__in=pks).update(updated_at=now)
+    return now
+
+# home page counters
+
+def count_created(sender, created, **kwargs):
+    if created:
+        # only count rows that actually made it into the database
+        transaction.on_commit(partial(statistics.adjust, sender, 1))
+
+def count_deleted(sender, **kwargs):
+    transaction.on_commit(partial(statistics.adjust, sender, -1))
+
+for model in (Task, Label, User):
+    post_save.connect(count_created, sender=model, dispatch_uid=f'count_created_{model._meta.label_lower}')
+    post_delete.connect(count_deleted, sender=model, dispatch_uid=f'count_deleted_{model._meta.label_lower}')
+
+# translate model signals into collection_changed
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Label)
+def record_saved(sender, instance, created, **kwargs):
+    if created:
+        notify(sender, instance.owner_id, created=[instance.pk])
+    else:
+        notify(sender, instance.owner_id, updated=[instance.pk])
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Label)
+def record_deleted(sender, instance, **kwargs):
+    notify(sender, instance.owner_id, deleted=[instance.pk])
+
+@receiver(pre_delete, sender=Label)
+def record_unlabelled(sender, instance, **kwargs):
+    # the through rows go with the label without an m2m_changed signal
+    pks = list(Task.objects.filter(labels=instance).values_list('pk', flat=True))
+    if pks:
+        touch_tasks(pks)
+        notify(Task, instance.owner_id, updated=pks)
+
+@receiver(m2m_changed, sender=Task.labels.through)
+def record_relabelled(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if reverse:
+        # instance is a label and pk_set holds task ids
+        if action == 'pre_clear':
+            # a cleared label no longer knows which tasks it had after the fact
+            instance._cleared_task_pks = list(instance.task_set.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pks = instance.__dict__.pop('_cleared_task_pks', [])
+        elif action in ('post_add', 'post_remove'):
+            pks = list(pk_set)
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        pks = [instance.pk]
+    else:
+        return
+
+    if pks:
+        now = touch_tasks(pks)
+        if not reverse:
+            instance.updated_at = now
+        notify(Task, instance.owner_id, updated=pks)
+
+# denormalized Label.task_count, deletes of tasks are counted in Task.delete()
+# and TaskQuerySet.delete(), the through rows of a deleted label go with it
+
+@receiver(m2m_changed, sender=Task.labels.through)
+def count_label_tasks(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    # rows are counted once they exist and uncounted while they still do
+    links = sender.objects.filter(**{'label_id' if reverse else 'task_id': instance.pk})
+    if action != 'pre_clear':
+        if not pk_set:
+            return
+        links = links.filter(**{'task_id__in' if reverse else 'label_id__in': pk_set})
+    count_label_links(links, 1 if action == 'post_add' else -1)
+
+@receiver(pre_delete, sender=User)
+def forget_departing_owner(sender, instance, **kwargs):
+    _departing_owners.set(_departing_owners.get() | {instance.pk})
+
+@receiver(post_delete, sender=User)
+def clear_departing_owner(sender, instance, **kwargs):
+    _departing_owners.set(_departing_owners.get() - {instance.pk})
+
+# cached account state for CachedStatelessJWTAuthentication
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    # deactivating a user or changing their password takes effect right away in this process
+    authentication.forget_user_state(instance.pk)
+
+# collection version stamps for conditional requests and cached lists
+
+@receiver(collection_changed)
+def bump_collection_version(sender, owner_id, **kwargs):
+    if sender is Label:
+        CollectionVersion.bump(owner_id, CollectionVersion.LABELS)
+    # label changes count for tasks too, expanded task responses embed label names
+    CollectionVersion.bump(owner_id, CollectionVersion.TASKS)
+
+# change log for incremental sync
+
+@receiver(collection_changed)
+def record_changes(sender, owner_id, created, updated, deleted, **kwargs):
+    if connection.vendor == 'postgresql':
+        # ids come from a shared sequence, holding a per-owner lock until commit
+        # keeps a user's changes committing in id order so /sync/ never skips one
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [owner_id])
+    collection = CollectionVersion.collection_for(sender)
+    Change.objects.bulk_create([
+        Change(owner_id=owner_id, collection=collection, object_id=pk, action=action)
+        for action, pks in ((Change.CREATED, created), (Change.UPDATED, updated), (Change.DELETED, deleted))
+        for pk in pks
+    ])
+
+# server-sent events
+
+@receiver(collection_changed)
+def publish_changes(sender, owner_id, **kwargs):
+    # streams read the change log, the entries are only visible to them once committed
+    transaction.on_commit(partial(events.get_broker().publish, owner_id))
+
+# request timings
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    performance.watch_connection(connection)
+
+# search index
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # rebuilding tasks_task on SQLite drops the triggers that keep the index in sync
+    if sender.name == 'tasks' and connections[using].vendor == 'sqlite':
+        search.restore_sqlite_triggers(connections[using])
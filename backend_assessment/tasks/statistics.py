@@ -0,0 +1,43 @@
+"""
+Site-wide counters for the home endpoint. Counts live in the cache and are
+nudged by signals as rows are created or deleted, so reading them never
+touches the big tables. Each counter expires after
+HOME_STATISTICS_TIMEOUT seconds and is recounted on the next read, which
+bounds how far it can drift (e.g. when several processes keep their own
+local memory cache).
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from .models import Task, Label
+
+COUNTED_MODELS = {
+    'total_tasks': Task,
+    'total_labels': Label,
+    'total_users': User,
+}
+
+def cache_key(model):
+    return f'statistics:{model._meta.label_lower}'
+
+def get_statistics():
+    """Return the home counters, recounting only the ones that expired"""
+    keys = {name: cache_key(model) for name, model in COUNTED_MODELS.items()}
+    cached = cache.get_many(keys.values())
+
+    statistics = {}
+    for name, model in COUNTED_MODELS.items():
+        count = cached.get(keys[name])
+        if count is None:
+            count = model.objects.count()
+            cache.add(keys[name], count, settings.HOME_STATISTICS_TIMEOUT)
+        statistics[name] = count
+    return statistics
+
+def adjust(model, delta):
+    """Shift a cached counter without recounting"""
+    try:
+        cache.incr(cache_key(model), delta)
+    except ValueError:
+        # not cached right now, the next read recounts from the table
+        pass
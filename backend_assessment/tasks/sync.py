@@ -0,0 +1,79 @@
+"""
+Delta feed for offline clients. A token is a signed position in the Change
+log; /sync/?since=<token> returns the final state of every task and label
+touched after it, deletions as tombstones, and a token to continue from.
+Entries are written in the transaction of the write they log (Task.save(),
+Label.save() and every bulk path are atomic), so the log never lists a
+write that rolled back nor misses one that committed.
+"""
+from django.conf import settings
+from django.core import signing
+from rest_framework.exceptions import APIException, ValidationError
+from .models import Task, Label, Change, CollectionVersion
+from .serializers import TaskSerializer, LabelSerializer
+
+SALT = 'tasks.sync'
+
+class TokenExpired(APIException):
+    status_code = 410
+    default_detail = 'Sync token expired, fetch the full lists again.'
+    default_code = 'token_expired'
+
+def make_token(owner_id, position):
+    return signing.dumps({'u': owner_id, 'p': position}, salt=SALT)
+
+def read_token(owner_id, token):
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=settings.SYNC_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        # changes this old may have been pruned, see the prune_changes command
+        raise TokenExpired()
+    except signing.BadSignature:
+        raise ValidationError({'since': ['Invalid sync token.']})
+    if payload.get('u') != owner_id:
+        raise ValidationError({'since': ['Invalid sync token.']})
+    return payload['p']
+
+def current_token(owner_id):
+    latest = Change.objects.filter(owner_id=owner_id).order_by('-id').values_list('id', flat=True).first()
+    return make_token(owner_id, latest or 0)
+
+def changes_since(owner_id, token):
+    """Collapse the log after token into upserts and tombstones"""
+    position = read_token(owner_id, token)
+    entries = list(
+        Change.objects.filter(owner_id=owner_id, id__gt=position)
+        .order_by('id')
+        .values_list('id', 'collection', 'object_id', 'action')[:settings.SYNC_PAGE_SIZE + 1]
+    )
+    has_more = len(entries) > settings.SYNC_PAGE_SIZE
+    entries = entries[:settings.SYNC_PAGE_SIZE]
+
+    # the last action on an object wins
+    final = {}
+    for _, collection, object_id, action in entries:
+        final[collection, object_id] = action
+
+    touched = {CollectionVersion.TASKS: [], CollectionVersion.LABELS: []}
+    deleted = {CollectionVersion.TASKS: [], CollectionVersion.LABELS: []}
+    for (collection, object_id), action in final.items():
+        (deleted if action == Change.DELETED else touched)[collection].append(object_id)
+
+    tasks = Task.objects.filter(owner_id=owner_id, pk__in=touched[CollectionVersion.TASKS]).with_labels().order_by('id')
+    labels = Label.objects.filter(owner_id=owner_id, pk__in=touched[CollectionVersion.LABELS]).order_by('id')
+    tasks, labels = list(tasks), list(labels)
+
+    # rows deleted after this page but before we read them are tombstones too
+    for collection, rows in ((CollectionVersion.TASKS, tasks), (CollectionVersion.LABELS, labels)):
+        found = {row.pk for row in rows}
+        deleted[collection].extend(pk for pk in touched[collection] if pk not in found)
+
+    if entries:
+        position = entries[-1][0]
+    return {
+        'token': make_token(owner_id, position),
+        'has_more': has_more,
+        'tasks': TaskSerializer(tasks, many=True).data,
+        'labels': LabelSerializer(labels, many=True).data,
+        'deleted': {collection: sorted(pks) for collection, pks in deleted.items()},
+    }
@@ -3,13 +3,31 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from .views import label_list, label_detail, task_list, task_detail
+from . import async_views
+from .views import (
+    label_list, label_detail, label_tasks, task_list, task_search, task_stats, task_detail, task_bulk,
+    task_export, sync_changes, performance_stats, batch_requests,
+)
 
 urlpatterns = [
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('labels/', label_list, name='label-list'),
     path('labels/<int:pk>/', label_detail, name='label-detail'),
+    path('labels/<int:pk>/tasks/', label_tasks, name='label-tasks'),
     path('tasks/', task_list, name='task-list'),
+    path('tasks/search/', task_search, name='task-search'),
+    path('tasks/stats/', task_stats, name='task-stats'),
     path('tasks/<int:pk>/', task_detail, name='task-detail'),
+    path('tasks/bulk/', task_bulk, name='task-bulk'),
+    path('tasks/export/', task_export, name='task-export'),
+    path('sync/', sync_changes, name='sync'),
+    path('events/', async_views.task_events, name='events'),
+    path('performance/', performance_stats, name='performance'),
+    path('batch/', batch_requests, name='batch'),
+    # the same routes served by async views, see tasks/async_views.py
+    path('async/labels/', async_views.label_list, name='async-label-list'),
+    path('async/labels/<int:pk>/', async_views.label_detail, name='async-label-detail'),
+    path('async/tasks/', async_views.task_list, name='async-task-list'),
+    path('async/tasks/<int:pk>/', async_views.task_detail, name='async-task-detail'),
 ]
@@ -2,99 +2,221 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from .models import Task, Label
-from .serializers import TaskSerializer, LabelSerializer
-from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.views.decorators.http import condition
+from . import batch, bulk, conditional, dashboard, export, performance, relabel, response_cache, search, statistics, sync
+from .filters import filter_tasks
+from .models import Task, Label, CollectionVersion
+from .pagination import KeysetPagination, SearchPagination, TaskPagination
+from .permissions import IsStaff
+from .signals import batched_changes
+from .serializers import (
+    TaskSerializer, LabelSerializer, ExpandedTaskSerializer,
+    TASK_VALUES, LABEL_VALUES, represent_tasks, represent_labels,
+)
+
+def expands_labels(request):
+    """True when the client asked for ?expand=labels"""
+    return 'labels' in request.query_params.get('expand', '').split(',')
 
 @api_view(['GET'])
 def home(request):
-    task_count = Task.objects.count()
-    label_count = Label.objects.count()
-    total_users = User.objects.count()
-
+    # counters come from the cache, see tasks/statistics.py
     data = {
         "message": "Welcome to the Task and Label API",
-        "statistics": {
-            "total_tasks": task_count,
-            "total_labels": label_count,
-            "total_users": total_users
-        }
+        "statistics": statistics.get_statistics()
     }
 
     return Response(data)
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@response_cache.cached_list(CollectionVersion.LABELS)
+@condition(**conditional.label_list_conditions)
 def label_list(request):
     """GET or POST to the /labels/ route"""
     if request.method == 'GET':
-        labels = Label.objects.filter(owner=request.user)
-        serializer = LabelSerializer(labels, many=True)
-        return Response(serializer.data)
+        labels = Label.objects.filter(owner_id=request.user.id).values(*LABEL_VALUES)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(labels, request)
+        # plain rows skip the per-field serializer work, same output as LabelSerializer
+        return paginator.get_paginated_response(represent_labels(page))
     elif request.method == 'POST':
-        serializer = LabelSerializer(data=request.data)
+        serializer = LabelSerializer(data=request.data, context={'request': request})
         # validating data from the body
         if serializer.is_valid():
-            serializer.save(owner=request.user)
+            # the row and everything its signals write (label counts, version
+            # stamps, the change log) commit together, as in tasks/bulk.py. No
+            # savepoint, a batch rolls back as a whole when a request in it fails
+            with transaction.atomic(savepoint=False), batched_changes():
+                serializer.save(owner_id=request.user.id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET', 'PUT', 'DELETE'])
+@api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@condition(**conditional.label_detail_conditions)
 def label_detail(request, pk):
-    """GET, PUT, or DELETE to the /labels/<label_id> route"""
+    """GET, PUT, PATCH, or DELETE to the /labels/<label_id> route"""
     try:
         # resources can only be accessed by their creator
-        label = Label.objects.get(pk=pk, owner=request.user)
+        label = Label.objects.get(pk=pk, owner_id=request.user.id)
     except Label.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
         serializer = LabelSerializer(label)
         return Response(serializer.data)
-    elif request.method == 'PUT':
-        serializer = LabelSerializer(label, data=request.data)
+    elif request.method in ('PUT', 'PATCH'):
+        # PATCH validates only the fields it was sent
+        serializer = LabelSerializer(label, data=request.data, partial=request.method == 'PATCH',
+                                     context={'request': request})
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            with transaction.atomic(savepoint=False), batched_changes():
+                serializer.save()
+            # lets the client chain its next If-Match without another GET
+            return Response(serializer.data, headers={'ETag': conditional.object_etag(label)})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
-        label.delete()
+        with transaction.atomic(savepoint=False), batched_changes():
+            label.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def label_tasks(request, pk):
+    """POST or DELETE to the /labels/<label_id>/tasks/ route, adds or removes the label on many tasks"""
+    try:
+        label = Label.objects.only('id', 'owner_id').get(pk=pk, owner_id=request.user.id)
+    except Label.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    # one statement on the through table whatever the number of tasks
+    if request.method == 'POST':
+        return Response({'added': relabel.add_label(label, request.data)})
+    elif request.method == 'DELETE':
+        return Response({'removed': relabel.remove_label(label, request.data)})
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@response_cache.cached_list(CollectionVersion.TASKS)
+@condition(**conditional.task_list_conditions)
 def task_list(request):
     """GET or POST to the /tasks/ route"""
     if request.method == 'GET':
-        tasks = Task.objects.filter(owner=request.user)
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = filter_tasks(Task.objects.filter(owner_id=request.user.id), request.query_params)
+        paginator = TaskPagination()
+        page = paginator.paginate_queryset(tasks.values(*TASK_VALUES), request)
+        # plain rows skip the per-field serializer work, same output as TaskSerializer
+        return paginator.get_paginated_response(represent_tasks(page, expand=expands_labels(request)))
     elif request.method == 'POST':
-        serializer = TaskSerializer(data=request.data)
+        serializer = TaskSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save(owner=request.user)
+            with transaction.atomic(savepoint=False), batched_changes():
+                serializer.save(owner_id=request.user.id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET', 'PUT', 'DELETE'])
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@response_cache.cached_list(CollectionVersion.TASKS)
+def task_search(request):
+    """GET to the /tasks/search/ route, ranked full-text search with ?q="""
+    tasks = search.search_tasks(request.user.id, request.query_params)
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(tasks.values(*TASK_VALUES, 'rank'), request)
+    return paginator.get_paginated_response(represent_tasks(page, expand=expands_labels(request)))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@response_cache.cached_list(CollectionVersion.TASKS)
+def task_stats(request):
+    """GET to the /tasks/stats/ route, task totals and per-label task counts"""
+    return Response(dashboard.owner_stats(request.user.id))
+
+@api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@condition(**conditional.task_detail_conditions)
 def task_detail(request, pk):
-    """GET, PUT, or DELETE to the /tasks/<task_id> route"""
+    """GET, PUT, PATCH, or DELETE to the /tasks/<task_id> route"""
+    expand = request.method == 'GET' and expands_labels(request)
     try:
-        task = Task.objects.get(pk=pk, owner=request.user)
+        task = Task.objects.with_labels(expanded=expand).get(pk=pk, owner_id=request.user.id)
     except Task.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        serializer = TaskSerializer(task)
+        serializer_class = ExpandedTaskSerializer if expand else TaskSerializer
+        serializer = serializer_class(task)
         return Response(serializer.data)
-    elif request.method == 'PUT':
-        serializer = TaskSerializer(task, data=request.data)
+    elif request.method in ('PUT', 'PATCH'):
+        serializer = TaskSerializer(task, data=request.data, partial=request.method == 'PATCH',
+                                    context={'request': request})
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            with transaction.atomic(savepoint=False), batched_changes():
+                serializer.save()
+            return Response(serializer.data, headers={'ETag': conditional.object_etag(task)})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     elif request.method == 'DELETE':
-        task.delete()
+        with transaction.atomic(savepoint=False), batched_changes():
+            task.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def task_bulk(request):
+    """POST, PATCH, or DELETE a batch of tasks to the /tasks/bulk/ route"""
+    # the whole batch is validated before anything is written, errors come back per item
+    if request.method == 'POST':
+        data = bulk.create_tasks(request.user.id, request.data)
+        return Response(data, status=status.HTTP_201_CREATED)
+    elif request.method == 'PATCH':
+        data = bulk.update_tasks(request.user.id, request.data)
+        return Response(data)
+    elif request.method == 'DELETE':
+        data = bulk.delete_tasks(request.user.id, request.data)
+        return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def task_export(request):
+    """GET to the /tasks/export/ route, streams every task as JSON or NDJSON"""
+    # not ?format=, DRF uses that one to pick a renderer
+    output = request.query_params.get('output', 'json')
+    if output not in export.CONTENT_TYPES:
+        return Response({'output': [f'Expected one of {", ".join(export.CONTENT_TYPES)}.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    # the ASGI handler buffers sync iterators, requests it serves get an async one
+    asynchronous = isinstance(request._request, ASGIRequest)
+    return export.export_response(request.user.id, output, expand=expands_labels(request), asynchronous=asynchronous)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """GET to the /sync/ route, task and label changes since a token"""
+    since = request.query_params.get('since')
+    if not since:
+        # bootstrap: take a token first, then download the lists, then sync from it
+        return Response({'token': sync.current_token(request.user.id)})
+    return Response(sync.changes_since(request.user.id, since))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_requests(request):
+    """POST to the /batch/ route, runs several API requests in one round trip"""
+    responses, succeeded = batch.run_batch(request)
+    # a failed sub-request rolled the whole batch back
+    return Response(
+        {'responses': responses},
+        status=status.HTTP_200_OK if succeeded else status.HTTP_400_BAD_REQUEST,
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsStaff])
+def performance_stats(request):
+    """GET to the /performance/ route, request timings per route of this server process"""
+    return Response({
+        'routes': performance.stats(),
+        'response_cache': response_cache.metrics(),
+    })
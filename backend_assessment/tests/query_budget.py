@@ -0,0 +1,82 @@
+"""
+Query budgets for the API routes. assertQueryBudget() sends one request and
+fails with the SQL it ran when it took more queries than allowed.
+assertQueryBudgets() sends the same kind of request for a small and a
+large owner, so a count that grows with the number of rows fails even when
+both stay under the budget.
+
+Every request is measured cold: the caches and the cached account states
+are cleared first, so a budget covers the worst case rather than a hit.
+"""
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks import authentication
+
+def format_queries(queries):
+    return '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(queries, start=1))
+
+def read_stream(response):
+    """The body of a streamed response, async iterators like the /events/ stream included"""
+    if response.is_async:
+        async def collect():
+            return b''.join([chunk async for chunk in response])
+        return async_to_sync(collect)()
+    return b''.join(response.streaming_content)
+
+class QueryBudgetTestCase(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def send(self, method, url, data=None):
+        call = getattr(self.client, method.lower())
+        response = call(url) if data is None else call(url, data, format='json')
+        if response.streaming:
+            # streamed responses keep querying while the body is read
+            read_stream(response)
+        return response
+
+    def assertQueryBudget(self, budget, method, url, data=None):
+        """Send the request and return its queries, failing when there are more than budget"""
+        for cache in caches.all():
+            cache.clear()
+        authentication.clear_user_states()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.send(method, url, data)
+
+        self.assertLess(response.status_code, 400, f'{method} {url} answered {response.status_code}')
+        if len(context) > budget:
+            self.fail(
+                f'{method} {url} ran {len(context)} queries, the budget is {budget}:\n'
+                f'{format_queries(context.captured_queries)}'
+            )
+        return context.captured_queries
+
+    def assertQueryBudgets(self, budget, method, request, owners):
+        """
+        Send request(owner) as each owner, smallest first. Every request must fit
+        the budget and all of them must run the same number of queries.
+        """
+        counts = []
+        for owner in owners:
+            self.authenticate(owner.user)
+            url, data = request(owner)
+            queries = self.assertQueryBudget(budget, method, url, data)
+            counts.append((owner, queries))
+
+        (small, small_queries), *others = counts
+        for large, large_queries in others:
+            if len(large_queries) != len(small_queries):
+                self.fail(
+                    f'{method} {url} ran {len(small_queries)} queries for {small.size} rows '
+                    f'and {len(large_queries)} for {large.size}:\n{format_queries(large_queries)}'
+                )
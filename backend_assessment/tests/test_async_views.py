@@ -0,0 +1,171 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks.models import Label, Task
+from tasks.serializers import ExpandedTaskSerializer, LabelSerializer, TaskSerializer
+
+class AsyncViewParityTest(APITestCase):
+    """/api/async/ must answer like the sync routes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.labels = [Label.objects.create(name=f'Label {i}', owner=self.user) for i in range(3)]
+        self.tasks = [
+            Task.objects.create(title='Write report', description='Quarterly numbers', owner=self.user),
+            Task.objects.create(title='Buy groceries', is_completed=True, owner=self.user),
+            Task.objects.create(title='Answer email', owner=self.user),
+        ]
+        self.tasks[0].labels.set(self.labels[:2])
+        self.tasks[1].labels.set(self.labels[2:])
+
+    def get_both(self, name, query='', **kwargs):
+        sync_response = self.client.get(reverse(name, kwargs=kwargs) + query)
+        async_response = self.client.get(reverse(f'async-{name}', kwargs=kwargs) + query)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        return sync_response.json(), async_response.json()
+
+    # LISTS
+    def test_lists_match(self):
+        for name, query in (('label-list', ''), ('task-list', ''), ('task-list', '?expand=labels'),
+                            ('task-list', '?is_completed=false&ordering=-title'), ('task-list', '?search=EMAIL')):
+            sync_data, async_data = self.get_both(name, query)
+            self.assertEqual(async_data['results'], sync_data['results'], query)
+
+    # PAGINATION
+    def test_pages_cover_every_task_once(self):
+        url = reverse('async-task-list') + '?page_size=2&ordering=title'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            titles += [task['title'] for task in response.json()['results']]
+            url = response.json()['next']
+
+        self.assertEqual(titles, ['Answer email', 'Buy groceries', 'Write report'])
+
+    # DETAILS
+    def test_details_match(self):
+        for query in ('', '?expand=labels'):
+            sync_data, async_data = self.get_both('task-detail', query, pk=self.tasks[0].pk)
+            self.assertEqual(async_data, sync_data)
+        sync_data, async_data = self.get_both('label-detail', pk=self.labels[0].pk)
+        self.assertEqual(async_data, sync_data)
+
+        response = self.client.get(reverse('async-task-detail', kwargs={'pk': self.tasks[0].pk}) + '?expand=labels')
+        self.assertEqual(response.json(), ExpandedTaskSerializer(Task.objects.get(pk=self.tasks[0].pk)).data)
+
+    # CREATE
+    def test_create(self):
+        data = {'title': 'New task', 'description': 'Async', 'labels': [self.labels[1].id, self.labels[0].id]}
+        response = self.client.post(reverse('async-task-list'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        task = Task.objects.get(pk=response.json()['id'])
+        self.assertEqual(task.owner, self.user)
+        self.assertEqual(response.json(), TaskSerializer(task).data)
+
+        response = self.client.post(reverse('async-label-list'), {'name': 'New label'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), LabelSerializer(Label.objects.get(name='New label')).data)
+
+    # INVALID DATA
+    def test_create_invalid(self):
+        response = self.client.post(reverse('async-label-list'), {'name': 'Label 0'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('async-task-list'), {'title': '', 'labels': [999]}, format='json')
+        sync_response = self.client.post(reverse('task-list'), {'title': '', 'labels': [999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), sync_response.json())
+
+    # UPDATE AND DELETE
+    def test_update_and_delete(self):
+        url = reverse('async-task-detail', kwargs={'pk': self.tasks[1].pk})
+        etag = self.client.get(url)['ETag']
+        data = {'title': 'Buy more groceries', 'is_completed': False, 'labels': [self.labels[0].id]}
+
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), TaskSerializer(Task.objects.get(pk=self.tasks[1].pk)).data)
+        self.assertEqual(response.json()['labels'], [self.labels[0].id])
+        # the old tag no longer matches, the returned one does
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        etag = self.client.put(url, data, format='json')['ETag']
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Task.objects.filter(pk=self.tasks[1].pk).exists())
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse('async-label-detail', kwargs={'pk': self.labels[0].pk})
+        response = self.client.put(url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.json(), LabelSerializer(Label.objects.get(pk=self.labels[0].pk)).data)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+
+    # PATCH
+    def test_patch(self):
+        url = reverse('async-task-detail', kwargs={'pk': self.tasks[1].pk})
+
+        response = self.client.patch(url, {'is_completed': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task = Task.objects.get(pk=self.tasks[1].pk)
+        self.assertEqual(response.json(), TaskSerializer(task).data)
+        self.assertEqual((task.title, task.is_completed), (self.tasks[1].title, True))
+        self.assertEqual(response['ETag'], self.client.get(url)['ETag'])
+
+        url = reverse('async-label-detail', kwargs={'pk': self.labels[0].pk})
+        response = self.client.patch(url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.json(), LabelSerializer(Label.objects.get(pk=self.labels[0].pk)).data)
+
+    # CONDITIONAL GET
+    def test_not_modified(self):
+        url = reverse('async-task-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(url, {'title': 'Another task'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # ACCESS
+    def test_access(self):
+        stranger = User.objects.create_user(username='stranger', password='12345')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(stranger).access_token}')
+        response = self.client.get(reverse('async-task-detail', kwargs={'pk': self.tasks[0].pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        for credentials in ({}, {'HTTP_AUTHORIZATION': 'Bearer not-a-token'}):
+            self.client.credentials(**credentials)
+            sync_response = self.client.get(reverse('task-list'))
+            response = self.client.get(reverse('async-task-list'))
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(response.json(), sync_response.json())
+            self.assertEqual(response['WWW-Authenticate'], sync_response['WWW-Authenticate'])
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.patch(reverse('async-task-list'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    # RUNS ON THE EVENT LOOP
+    async def test_async_client(self):
+        response = await self.async_client.get(
+            reverse('async-task-list') + '?expand=labels',
+            headers={'Authorization': f'Bearer {self.token}'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([task['title'] for task in response.json()['results']],
+                         ['Write report', 'Buy groceries', 'Answer email'])
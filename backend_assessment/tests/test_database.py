@@ -0,0 +1,126 @@
+from pathlib import Path
+from unittest import skipUnless
+import django
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, migrations, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from backend_assessment.db.profiles import database_profile
+from tasks import search
+from tasks.models import Label, Task
+
+BASE_DIR = Path('/srv/app')
+
+class DatabaseProfileTest(SimpleTestCase):
+
+    # SQLITE IS THE DEFAULT
+    def test_sqlite_profile(self):
+        database = database_profile({}, BASE_DIR)
+
+        self.assertEqual(database['NAME'], BASE_DIR / 'db.sqlite3')
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        for pragma in ('busy_timeout', 'mmap_size'):
+            self.assertIn(pragma, database['OPTIONS']['init_command'])
+        # WAL is written into the file, the committed database isn't switched to it
+        for pragma in ('journal_mode', 'synchronous'):
+            self.assertNotIn(pragma, database['OPTIONS']['init_command'])
+
+        wal = database_profile({'DATABASE_PROFILE': 'sqlite-wal'}, BASE_DIR)
+        self.assertEqual(wal['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        for pragma in ('journal_mode = WAL', 'busy_timeout', 'synchronous = NORMAL', 'mmap_size'):
+            self.assertIn(pragma, wal['OPTIONS']['init_command'])
+
+        plain = database_profile({'DATABASE_PROFILE': 'sqlite-plain'}, BASE_DIR)
+        self.assertEqual(plain, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'})
+
+    # POSTGRESQL FROM THE ENVIRONMENT
+    def test_postgresql_profile(self):
+        environ = {
+            'DATABASE_PROFILE': 'postgresql', 'DATABASE_NAME': 'tasks', 'DATABASE_USER': 'app',
+            'DATABASE_HOST': 'db', 'DATABASE_CONN_MAX_AGE': '300',
+        }
+        database = database_profile(environ, BASE_DIR)
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((database['NAME'], database['USER'], database['HOST']), ('tasks', 'app', 'db'))
+        self.assertEqual(database['CONN_MAX_AGE'], 300)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', database['OPTIONS'])
+
+    # POOLING REPLACES PERSISTENT CONNECTIONS
+    def test_postgresql_pool(self):
+        environ = {'DATABASE_PROFILE': 'postgresql', 'DATABASE_POOL_MAX_SIZE': '20'}
+        if django.VERSION < (5, 1):
+            with self.assertRaises(ImproperlyConfigured):
+                database_profile(environ, BASE_DIR)
+            return
+
+        database = database_profile(environ, BASE_DIR)
+        self.assertEqual(database['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+
+    # UNKNOWN PROFILE
+    def test_unknown_profile(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_profile({'DATABASE_PROFILE': 'mysql'}, BASE_DIR)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite connection settings')
+class SQLiteConnectionTest(TransactionTestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    # PRAGMAS ARE SET ON EVERY CONNECTION
+    def test_init_command(self):
+        if 'init_command' not in connection.settings_dict['OPTIONS']:
+            self.skipTest('sqlite-plain profile')
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        if 'journal_mode = WAL' in connection.settings_dict['OPTIONS']['init_command']:
+            self.assertEqual(self.pragma('synchronous'), 1)
+
+    # WRITE TRANSACTIONS LOCK WHEN THEY BEGIN
+    def test_transaction_mode(self):
+        mode = connection.settings_dict['OPTIONS'].get('transaction_mode')
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                Label.objects.exists()
+
+        self.assertEqual(context.captured_queries[0]['sql'], f'BEGIN {mode}' if mode else 'BEGIN')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite search index')
+class SearchIndexMigrationTest(TransactionTestCase):
+
+    def titles(self, user, word):
+        return set(search.sqlite_search(Task.objects.filter(owner=user), user.id, [word])
+                   .values_list('title', flat=True))
+
+    # A MIGRATION CAN REBUILD TASKS_TASK
+    def test_alter_task_field(self):
+        user = User.objects.create_user(username='testuser', password='12345')
+        Task.objects.create(title='Before the migration', owner=user)
+        operation = migrations.AlterField('task', 'title', models.CharField(max_length=300))
+        state = MigrationLoader(connection).project_state()
+        altered = state.clone()
+        operation.state_forwards('tasks', altered)
+
+        with connection.schema_editor() as editor:
+            operation.database_forwards('tasks', editor, state, altered)
+        # the rebuild dropped the triggers, post_migrate puts them back
+        Task.objects.create(title='Written in between', owner=user)
+        search.restore_sqlite_triggers()
+        Task.objects.create(title='After the migration', owner=user)
+        self.assertEqual(self.titles(user, 'migration'), {'Before the migration', 'After the migration'})
+        self.assertEqual(self.titles(user, 'between'), {'Written in between'})
+
+        with connection.schema_editor() as editor:
+            operation.database_backwards('tasks', editor, altered, state)
+        search.restore_sqlite_triggers()
+        Task.objects.filter(title='After the migration').update(title='Reverted')
+        self.assertEqual(self.titles(user, 'migration'), {'Before the migration'})
+        self.assertEqual(self.titles(user, 'reverted'), {'Reverted'})
@@ -1,9 +1,19 @@
+import json
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 from django.contrib.auth.models import User
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from tasks.models import Label, Task
+from tasks import authentication, response_cache, sync
+from tasks.models import Change, CollectionVersion, Label, Task
 from tasks.serializers import LabelSerializer, TaskSerializer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
@@ -32,7 +42,7 @@ class LabelListAPITest(APITestCase):
         serializer = LabelSerializer(labels, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     # CREATE LABEL
     def test_create_label(self):
@@ -58,6 +68,24 @@ class LabelListAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(Label.objects.count(), 0)
 
+    # DUPLICATE LABEL NAMES ARE REJECTED PER OWNER
+    def test_create_duplicate_label(self):
+        url = reverse('label-list')
+        Label.objects.create(name='Label 1', owner=self.user)
+
+        response = self.client.post(url, {'name': 'Label 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        stranger = User.objects.create_user(username='stranger', password='12345')
+        Label.objects.create(name='Label 2', owner=stranger)
+        response = self.client.post(url, {'name': 'Label 2'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # renaming a label to its own name is fine
+        label = Label.objects.get(name='Label 2', owner=self.user)
+        response = self.client.put(reverse('label-detail', kwargs={'pk': label.pk}), {'name': 'Label 2'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     # GET LABEL
     def test_get_label_detail(self):
         label = Label.objects.create(name='Label 1', owner=self.user)
@@ -82,6 +110,20 @@ class LabelListAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(label.name, 'Updated Label')
 
+    # PATCH LABEL
+    def test_patch_label(self):
+        label = Label.objects.create(name='Label 1', owner=self.user)
+        Label.objects.create(name='Label 2', owner=self.user)
+        url = reverse('label-detail', kwargs={'pk': label.pk})
+
+        response = self.client.patch(url, {'name': 'Label 2'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, LabelSerializer(Label.objects.get(pk=label.pk)).data)
+        self.assertEqual(response.data['name'], 'Renamed')
+
     # DELETE LABEL
     def test_delete_label(self):
         label = Label.objects.create(name='Label 1', owner=self.user)
@@ -123,7 +165,7 @@ class TaskListAPITest(APITestCase):
         serializer = TaskSerializer(tasks, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     # CREATE TASK
     def test_create_task(self):
@@ -194,6 +236,53 @@ class TaskListAPITest(APITestCase):
         self.assertTrue(task.is_completed)
         self.assertEqual(list(task.labels.all()), [self.label2])
 
+    # PATCH TASK
+    def test_patch_task(self):
+        task = Task.objects.create(title='Task 1', description='Description 1', owner=self.user)
+        task.labels.set([self.label1])
+        url = reverse('task-detail', kwargs={'pk': task.pk})
+
+        response = self.client.patch(url, {'is_completed': True}, format='json')
+
+        task.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, TaskSerializer(task).data)
+        self.assertEqual((task.title, task.description, task.is_completed), ('Task 1', 'Description 1', True))
+        self.assertEqual(list(task.labels.all()), [self.label1])
+
+        response = self.client.patch(url, {'title': ''}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data), ['title'])
+
+    # PATCH WRITES ONLY WHAT CHANGED
+    def test_patch_writes_changed_columns(self):
+        task = Task.objects.create(title='Task 1', description='x' * 1000, owner=self.user)
+        task.labels.set([self.label1])
+        kept = Task.labels.through.objects.get(task=task, label=self.label1).pk
+        url = reverse('task-detail', kwargs={'pk': task.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'is_completed': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"is_completed"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertNotIn('"title"', updates[0])
+
+        # the kept through row is left alone, only the new one is inserted
+        response = self.client.patch(url, {'labels': [self.label1.id, self.label2.id]}, format='json')
+        self.assertEqual(response.data['labels'], [self.label1.id, self.label2.id])
+        self.assertEqual(Task.labels.through.objects.get(task=task, label=self.label1).pk, kept)
+
+        # nothing changed, nothing written
+        updated_at = Task.objects.get(pk=task.pk).updated_at
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'is_completed': True, 'labels': [self.label2.id, self.label1.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE'))])
+        self.assertEqual(Task.objects.get(pk=task.pk).updated_at, updated_at)
+
     # DELETE TASK
     def test_delete_task(self):
         task = Task.objects.create(title='Task 1', description='Description 1', is_completed=False, owner=self.user)
@@ -222,4 +311,1186 @@ class TaskListAPITest(APITestCase):
         self.assertEqual(response_task.status_code, status.HTTP_404_NOT_FOUND)
 
         # reset credentials to the original user
-        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
\ No newline at end of file
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    # STRANGER LABELS
+    def test_stranger_labels_are_rejected(self):
+        stranger_label = Label.objects.create(name='Label 1', owner=self.stranger)
+        url = reverse('task-list')
+        data = {'title': 'New Task', 'labels': [self.label1.id, stranger_label.id, 999]}
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['labels'], [
+            f'Invalid pk "{stranger_label.id}" - object does not exist.',
+            'Invalid pk "999" - object does not exist.',
+        ])
+        self.assertEqual(Task.objects.count(), 0)
+
+        response = self.client.post(url, {'title': 'New Task', 'labels': ['one']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # updates check against the task owner's labels too
+        task = Task.objects.create(title='Task 1', owner=self.user)
+        response = self.client.put(reverse('task-detail', kwargs={'pk': task.pk}), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(task.labels.all()), [])
+
+    # LABEL IDS ARE INTEGERS OR DIGIT STRINGS
+    def test_label_id_types(self):
+        url = reverse('task-list')
+        for label_id in (True, 1.9, float(self.label1.id), None, {'id': self.label1.id}, '1.0', '-1', '\u0661'):
+            response = self.client.post(url, {'title': 'New Task', 'labels': [label_id]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, label_id)
+            self.assertEqual(response.data['labels'][0].code, 'incorrect_type', label_id)
+        self.assertEqual(Task.objects.count(), 0)
+
+        response = self.client.post(url, {'title': 'New Task', 'labels': [self.label1.id, str(self.label2.id)]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['labels'], [self.label1.id, self.label2.id])
+
+        # out of range for the column, but the right type
+        response = self.client.post(url, {'title': 'New Task', 'labels': [2 ** 70]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['labels'][0].code, 'does_not_exist')
+
+class StatelessAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        authentication.clear_user_states()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('label-list')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query for query in context if 'auth_user' in query['sql']]
+
+    # ACCOUNT STATE IS LOADED ONCE
+    def test_account_state_is_cached(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    # CACHED STATE EXPIRES
+    @override_settings(AUTH_USER_STATE_TIMEOUT=0)
+    def test_account_state_expires(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(len(self.user_queries()), 1)
+
+    # DEACTIVATED AND DELETED ACCOUNTS ARE REJECTED
+    def test_inactive_user_is_rejected(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # CHANGED PASSWORDS REVOKE TOKENS WHEN CONFIGURED
+    def test_password_change_revokes_token(self):
+        with patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            refresh = RefreshToken.for_user(self.user)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+            self.user_queries()
+
+            self.user.set_password('54321')
+            self.user.save()
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PaginationAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.tasks = [
+            Task.objects.create(title=f'Task {i}', owner=self.user) for i in range(7)
+        ]
+
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(task['id'] for task in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    # WALK EVERY PAGE FORWARD
+    def test_pages_cover_every_task_once(self):
+        ids = self.collect_pages(reverse('task-list') + '?page_size=3')
+        self.assertEqual(ids, [task.id for task in self.tasks])
+
+    # STEP BACK WITH THE PREVIOUS CURSOR
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get(reverse('task-list') + '?page_size=3')
+        self.assertIsNone(first.data['previous'])
+
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNotNone(back.data['next'])
+
+    # PAGE SIZE IS CAPPED
+    def test_page_size_is_capped(self):
+        url = reverse('label-list') + '?page_size=100000'
+        for i in range(3):
+            Label.objects.create(name=f'Label {i}', owner=self.user)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+    # TAMPERED CURSOR
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('task-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def assert_invalid_positions(self, url, ordering, positions):
+        for position in positions:
+            payload = json.dumps({'o': ordering, 'r': 0, 'p': position}).encode()
+            cursor = urlsafe_b64encode(payload).decode('ascii')
+            response = self.client.get(url, {'ordering': ordering, 'q': 'task', 'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+    # CURSOR POSITIONS OF THE WRONG TYPE, BY ORDERING
+    def test_invalid_id_position(self):
+        self.assert_invalid_positions(reverse('task-list'), 'id', [
+            ['3'], [True], [1.5], [{'a': 1}], [None], [2 ** 70], {'id': 3},
+        ])
+
+    def test_invalid_title_position(self):
+        self.assert_invalid_positions(reverse('task-list'), '-title', [
+            [3, 3], [{'a': 1}, 3], [['Task'], 3], [None, 3], ['Task 3', '3'],
+        ])
+
+    def test_invalid_rank_position(self):
+        self.assert_invalid_positions(reverse('task-search'), 'rank', [
+            ['zz', 3], [{'a': 1}, 3], [False, 3], [float('nan'), 3], [-1, 3.0],
+        ])
+
+    # DEEP PAGES COST THE SAME AS THE FIRST
+    def test_deep_page_query_count(self):
+        for i in range(7):
+            Label.objects.create(name=f'Label {i}', owner=self.user)
+        url = reverse('label-list') + '?page_size=2'
+
+        # account state, collection version, page
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        for _ in range(2):
+            response = self.client.get(response.data['next'])
+        # the account state is cached by now
+        with self.assertNumQueries(2):
+            self.client.get(response.data['next'])
+
+
+class TaskQueryCountTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.labels = [Label.objects.create(name=f'Label {i}', owner=self.user) for i in range(3)]
+
+    def create_tasks(self, count):
+        for i in range(count):
+            task = Task.objects.create(title=f'Task {i}', owner=self.user)
+            task.labels.set(self.labels)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context)
+
+    # LIST QUERIES DO NOT GROW WITH THE PAGE
+    def test_task_list_query_count_is_constant(self):
+        url = reverse('task-list') + '?page_size=50'
+        # the first request also loads the account state
+        self.count_queries(url)
+        self.create_tasks(2)
+        small = self.count_queries(url)
+        self.create_tasks(20)
+        large = self.count_queries(url)
+
+        self.assertEqual(small, large)
+
+    # DETAIL FETCHES LABELS IN ONE QUERY
+    def test_task_detail_query_count(self):
+        self.create_tasks(1)
+        task = Task.objects.get()
+
+        # account state, etag lookup, task, labels
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('task-detail', kwargs={'pk': task.pk}))
+
+        self.assertEqual(response.data['labels'], [label.id for label in self.labels])
+
+    # EXPANDED LABELS DO NOT ADD PER-TASK QUERIES
+    def test_expanded_task_list_query_count_is_constant(self):
+        url = reverse('task-list') + '?expand=labels'
+        # the first request also loads the account state
+        self.count_queries(url)
+        self.create_tasks(2)
+        small = self.count_queries(url)
+        self.create_tasks(20)
+        large = self.count_queries(url)
+
+        self.assertEqual(small, large)
+
+    # TASK WRITES DO NOT GROW WITH THE LABELS
+    def test_task_write_query_count_is_constant(self):
+        labels = self.labels + [Label.objects.create(name=f'More {i}', owner=self.user) for i in range(20)]
+        url = reverse('task-list')
+        # the first request also loads the account state
+        self.client.get(url)
+
+        def count_writes(label_ids):
+            with CaptureQueriesContext(connection) as created:
+                response = self.client.post(url, {'title': 'Task', 'labels': label_ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            detail_url = reverse('task-detail', kwargs={'pk': response.data['id']})
+            with CaptureQueriesContext(connection) as updated:
+                response = self.client.put(detail_url, {'title': 'Task', 'labels': label_ids[::-1]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(created), len(updated)
+
+        self.assertEqual(count_writes([labels[0].id]), count_writes([label.id for label in labels]))
+
+    # EXPANDED LABEL SHAPE
+    def test_expand_labels_embeds_label_objects(self):
+        self.create_tasks(1)
+        task = Task.objects.get()
+        expected = [{'id': label.id, 'name': label.name} for label in self.labels]
+
+        list_response = self.client.get(reverse('task-list') + '?expand=labels')
+        detail_response = self.client.get(
+            reverse('task-detail', kwargs={'pk': task.pk}) + '?expand=labels'
+        )
+        plain_response = self.client.get(reverse('task-detail', kwargs={'pk': task.pk}))
+
+        self.assertEqual(list_response.data['results'][0]['labels'], expected)
+        self.assertEqual(detail_response.data['labels'], expected)
+        self.assertEqual(plain_response.data['labels'], [label.id for label in self.labels])
+
+
+class BulkTaskAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.stranger = User.objects.create_user(username='bobross', password='12345')
+
+        self.label1 = Label.objects.create(name='Label 1', owner=self.user)
+        self.label2 = Label.objects.create(name='Label 2', owner=self.user)
+        self.url = reverse('task-bulk')
+
+    # BULK CREATE
+    def test_bulk_create(self):
+        data = [
+            {'title': f'Task {i}', 'labels': [self.label1.id, self.label2.id]}
+            for i in range(20)
+        ]
+
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([task['title'] for task in response.data], [item['title'] for item in data])
+        self.assertEqual(Task.objects.filter(owner=self.user).count(), 20)
+        self.assertEqual(Task.labels.through.objects.count(), 40)
+        self.assertEqual(response.data[0]['labels'], [self.label1.id, self.label2.id])
+
+    # BULK CREATE QUERIES DO NOT GROW WITH THE BATCH
+    def test_bulk_create_query_count_is_constant(self):
+        def count_queries(size):
+            data = [{'title': f'Task {i}', 'labels': [self.label1.id]} for i in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(context)
+
+        # the first request also loads the account state
+        count_queries(1)
+        self.assertEqual(count_queries(2), count_queries(50))
+
+    # INVALID ITEMS REJECT THE WHOLE BATCH
+    def test_bulk_create_is_atomic(self):
+        foreign = Label.objects.create(name='Theirs', owner=self.stranger)
+        data = [
+            {'title': 'Fine'},
+            {'title': ''},
+            {'title': 'Borrowed label', 'labels': [foreign.id]},
+        ]
+
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('title', response.data[1])
+        self.assertEqual(Task.objects.count(), 0)
+
+        response = self.client.post(self.url, [data[0], data[2]], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('labels', response.data[1])
+        self.assertEqual(Task.objects.count(), 0)
+
+    # BULK UPDATE
+    def test_bulk_update(self):
+        first = Task.objects.create(title='First', owner=self.user)
+        second = Task.objects.create(title='Second', owner=self.user)
+        first.labels.set([self.label1])
+        data = [
+            {'id': first.id, 'is_completed': True, 'labels': [self.label2.id]},
+            {'id': second.id, 'title': 'Second, renamed'},
+        ]
+
+        response = self.client.patch(self.url, data, format='json')
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(first.is_completed)
+        self.assertEqual(first.title, 'First')
+        self.assertEqual(list(first.labels.all()), [self.label2])
+        self.assertEqual(second.title, 'Second, renamed')
+        self.assertFalse(second.is_completed)
+        self.assertEqual(response.data[1]['title'], 'Second, renamed')
+
+    # BULK UPDATE OF SOMEONE ELSE'S TASK
+    def test_bulk_update_foreign_task(self):
+        theirs = Task.objects.create(title='Theirs', owner=self.stranger)
+
+        response = self.client.patch(self.url, [{'id': theirs.id, 'title': 'Mine now'}], format='json')
+
+        theirs.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(theirs.title, 'Theirs')
+
+    # BULK DELETE
+    def test_bulk_delete(self):
+        mine = Task.objects.create(title='Mine', owner=self.user)
+        theirs = Task.objects.create(title='Theirs', owner=self.stranger)
+
+        response = self.client.delete(self.url, [mine.id, theirs.id], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'id': mine.id, 'deleted': True},
+            {'id': theirs.id, 'deleted': False},
+        ])
+        self.assertFalse(Task.objects.filter(pk=mine.pk).exists())
+        self.assertTrue(Task.objects.filter(pk=theirs.pk).exists())
+
+
+class LabelTasksAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.stranger = User.objects.create_user(username='bobross', password='12345')
+
+        self.label = Label.objects.create(name='Urgent', owner=self.user)
+        self.tasks = Task.objects.bulk_create([
+            Task(title=f'Task {i}', is_completed=i % 2 == 0, owner=self.user) for i in range(6)
+        ])
+        self.theirs = Task.objects.create(title='Theirs', owner=self.stranger)
+        self.url = reverse('label-tasks', kwargs={'pk': self.label.pk})
+
+    def labelled(self):
+        return sorted(self.label.task_set.values_list('pk', flat=True))
+
+    # ADD BY IDS
+    def test_add_by_ids(self):
+        self.tasks[0].labels.add(self.label)
+        ids = [self.tasks[0].id, self.tasks[1].id, self.theirs.id]
+        before = Task.objects.get(pk=self.tasks[1].pk).updated_at
+
+        response = self.client.post(self.url, {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # already labelled and foreign tasks are left alone
+        self.assertEqual(response.data, {'added': [self.tasks[1].id]})
+        self.assertEqual(self.labelled(), [self.tasks[0].id, self.tasks[1].id])
+        self.assertGreater(Task.objects.get(pk=self.tasks[1].pk).updated_at, before)
+        self.assertFalse(self.theirs.labels.exists())
+
+    # ADD BY FILTER
+    def test_add_by_filter(self):
+        response = self.client.post(self.url, {'filter': {'is_completed': True}}, format='json')
+
+        completed = [task.id for task in self.tasks if task.is_completed]
+        self.assertEqual(response.data, {'added': completed})
+        self.assertEqual(self.labelled(), completed)
+
+    # REMOVE EVERYWHERE
+    def test_remove_by_filter(self):
+        self.label.task_set.add(*self.tasks)
+        other = Label.objects.create(name='Other', owner=self.user)
+        other.task_set.add(self.tasks[0])
+
+        response = self.client.delete(self.url, {'filter': {}}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'removed': [task.id for task in self.tasks]})
+        self.assertEqual(self.labelled(), [])
+        self.assertEqual(list(self.tasks[0].labels.all()), [other])
+
+        response = self.client.delete(self.url, {'ids': [self.tasks[0].id]}, format='json')
+        self.assertEqual(response.data, {'removed': []})
+
+    # ONE STATEMENT ON THE THROUGH TABLE
+    def test_query_count_is_constant(self):
+        many = Task.objects.bulk_create([Task(title=f'More {i}', owner=self.user) for i in range(50)])
+        # the first request also loads the account state
+        self.client.post(self.url, {'ids': [self.tasks[0].id]}, format='json')
+
+        def count_queries(method, tasks):
+            with CaptureQueriesContext(connection) as context:
+                response = method(self.url, {'ids': [task.id for task in tasks]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context)
+
+        self.assertEqual(count_queries(self.client.post, self.tasks[1:2]), count_queries(self.client.post, many))
+        self.assertEqual(count_queries(self.client.delete, self.tasks[1:2]), count_queries(self.client.delete, many))
+
+    # WRITES SHOW UP IN LISTS AND SYNC
+    def test_changes_are_recorded(self):
+        list_url = reverse('task-list')
+        etag = self.client.get(list_url)['ETag']
+        token = self.client.get(reverse('sync')).data['token']
+
+        self.client.post(self.url, {'ids': [self.tasks[0].id]}, format='json')
+
+        self.assertNotEqual(self.client.get(list_url)['ETag'], etag)
+        changes = self.client.get(reverse('sync'), {'since': token}).data
+        self.assertEqual([task['id'] for task in changes['tasks']], [self.tasks[0].id])
+        self.assertEqual(changes['tasks'][0]['labels'], [self.label.id])
+
+    # INVALID REQUESTS
+    def test_invalid_requests(self):
+        for data in ({}, {'ids': [1], 'filter': {}}, {'ids': []}, {'filter': {'labels': 'x'}}):
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+        theirs = Label.objects.create(name='Theirs', owner=self.stranger)
+        url = reverse('label-tasks', kwargs={'pk': theirs.pk})
+        response = self.client.post(url, {'ids': [self.tasks[0].id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.labelled(), [])
+
+
+class HomeStatisticsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        Task.objects.create(title='Task 1', owner=self.user)
+        Label.objects.create(name='Label 1', owner=self.user)
+        self.url = reverse('home')
+
+    def tearDown(self):
+        cache.clear()
+
+    # COUNTS ARE SERVED FROM THE CACHE
+    def test_home_statistics_are_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics'], {
+            'total_tasks': 1,
+            'total_labels': 1,
+            'total_users': 1,
+        })
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['total_tasks'], 1)
+
+    # WRITES ADJUST THE COUNTERS WITHOUT A RECOUNT
+    def test_home_statistics_follow_writes(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='Task 2', owner=self.user)
+            Label.objects.get().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.user)
+            self.client.post(reverse('task-bulk'), [{'title': 'Task 3'}], format='json')
+            self.client.force_authenticate(None)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['statistics']['total_tasks'], 3)
+        self.assertEqual(response.data['statistics']['total_labels'], 0)
+
+
+class TaskFilterAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.work = Label.objects.create(name='Work', owner=self.user)
+        self.urgent = Label.objects.create(name='Urgent', owner=self.user)
+
+        self.report = Task.objects.create(title='Write report', description='Quarterly numbers', owner=self.user)
+        self.report.labels.set([self.work, self.urgent])
+        self.email = Task.objects.create(title='Answer email', is_completed=True, owner=self.user)
+        self.email.labels.set([self.work])
+        self.groceries = Task.objects.create(title='Buy groceries', description='milk, eggs', owner=self.user)
+
+    def get_titles(self, query):
+        response = self.client.get(reverse('task-list') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [task['title'] for task in response.data['results']]
+
+    # FILTER BY COMPLETION
+    def test_filter_is_completed(self):
+        self.assertEqual(self.get_titles('?is_completed=true'), ['Answer email'])
+        self.assertEqual(self.get_titles('?is_completed=false'), ['Write report', 'Buy groceries'])
+
+    # FILTER BY LABELS
+    def test_filter_labels(self):
+        any_query = f'?labels={self.work.id},{self.urgent.id}'
+        all_query = any_query + '&labels_match=all'
+
+        self.assertEqual(self.get_titles(any_query), ['Write report', 'Answer email'])
+        self.assertEqual(self.get_titles(all_query), ['Write report'])
+
+    # SEARCH TITLE AND DESCRIPTION
+    def test_search(self):
+        self.assertEqual(self.get_titles('?search=EMAIL'), ['Answer email'])
+        self.assertEqual(self.get_titles('?search=eggs'), ['Buy groceries'])
+
+    # ORDERING WITH PAGINATION
+    def test_ordering_pages(self):
+        first = self.client.get(reverse('task-list') + '?ordering=-title&page_size=2')
+        second = self.client.get(first.data['next'])
+
+        titles = [task['title'] for task in first.data['results'] + second.data['results']]
+        self.assertEqual(titles, ['Write report', 'Buy groceries', 'Answer email'])
+
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    # INVALID PARAMETERS
+    def test_invalid_filters(self):
+        for query in ('?ordering=description', '?labels=one', '?labels_match=some', '?is_completed=maybe'):
+            response = self.client.get(reverse('task-list') + query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    # CURSOR FROM ANOTHER ORDERING
+    def test_cursor_is_bound_to_ordering(self):
+        first = self.client.get(reverse('task-list') + '?ordering=title&page_size=1')
+        cursor = parse_qs(urlparse(first.data['next']).query)['cursor'][0]
+
+        response = self.client.get(reverse('task-list'), {'ordering': 'id', 'cursor': cursor})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TaskSearchAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.report = Task.objects.create(title='Write report', description='Quarterly numbers', owner=self.user)
+        self.numbers = Task.objects.create(title='Check numbers', description='For the report', owner=self.user)
+        self.groceries = Task.objects.create(title='Buy groceries', description='Milk, eggs, café', owner=self.user)
+
+        self.stranger = User.objects.create_user(username='stranger', password='12345')
+        Task.objects.create(title='Stranger report', owner=self.stranger)
+
+    def get_titles(self, query):
+        response = self.client.get(reverse('task-search') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [task['title'] for task in response.data['results']]
+
+    # EVERY WORD MATCHES, TITLES RANK FIRST
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.get_titles('?q=report'), ['Write report', 'Check numbers'])
+        self.assertEqual(self.get_titles('?q=numbers'), ['Check numbers', 'Write report'])
+        self.assertEqual(self.get_titles('?q=REPORT, quarterly'), ['Write report'])
+        self.assertEqual(self.get_titles('?q=cafe'), ['Buy groceries'])
+
+    # ONLY THE LAST WORD MATCHES AS A PREFIX
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.get_titles('?q=report quart'), ['Write report'])
+        self.assertEqual(self.get_titles('?q=quart report'), [])
+
+    # RESULTS HAVE THE TASK SHAPE AND A RANK
+    def test_search_result_shape(self):
+        self.report.labels.set([Label.objects.create(name='Work', owner=self.user)])
+        response = self.client.get(reverse('task-search') + '?q=quarterly&expand=labels')
+
+        result, = response.data['results']
+        self.assertEqual(result['labels'], [{'id': self.report.labels.get().id, 'name': 'Work'}])
+        self.assertEqual(set(result) - set(TaskSerializer(self.report).data), {'rank'})
+
+    # THE INDEX FOLLOWS WRITES
+    def test_index_follows_writes(self):
+        self.client.patch(reverse('task-detail', kwargs={'pk': self.groceries.id}), {'title': 'Buy bread'}, format='json')
+        self.assertEqual(self.get_titles('?q=bread'), ['Buy bread'])
+        self.assertEqual(self.get_titles('?q=groceries'), [])
+
+        Task.objects.filter(pk=self.report.id).update(description='Yearly totals')
+        self.assertEqual(self.get_titles('?q=quarterly'), [])
+
+        self.numbers.delete()
+        self.assertEqual(self.get_titles('?q=numbers'), [])
+
+    # ONLY YOUR OWN TASKS
+    def test_search_is_scoped_to_owner(self):
+        self.assertNotIn('Stranger report', self.get_titles('?q=stranger'))
+        self.assertEqual(len(self.get_titles('?q=report')), 2)
+
+    # RANKED PAGES
+    def test_search_pages(self):
+        Task.objects.bulk_create([Task(title=f'Report {i}', owner=self.user) for i in range(5)])
+        expected = self.get_titles('?q=report&page_size=50')
+
+        titles, url = [], reverse('task-search') + '?q=report&page_size=2'
+        while url:
+            response = self.client.get(url)
+            titles += [task['title'] for task in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(titles, expected)
+        self.assertEqual(len(titles), 7)
+
+    # OTHER OWNERS' WRITES DON'T MOVE YOUR RESULTS BETWEEN PAGES
+    def test_search_pages_while_others_write(self):
+        Task.objects.bulk_create([
+            Task(title=f'Report {i}', description='report ' * i + 'filler words ' * (10 - i), owner=self.user)
+            for i in range(10)
+        ])
+        expected = self.get_titles('?q=report&page_size=50')
+
+        titles, url, page = [], reverse('task-search') + '?q=report&page_size=3', 0
+        while url:
+            response = self.client.get(url)
+            titles += [task['title'] for task in response.data['results']]
+            url = response.data['next']
+            # the index is shared by every owner
+            page += 1
+            Task.objects.bulk_create([
+                Task(title='report ' * page, description='report ' * (20 * page), owner=self.stranger)
+                for _ in range(10 * page)
+            ])
+
+        self.assertEqual(titles, expected)
+        self.assertEqual(len(titles), 12)
+
+    # INVALID QUERIES
+    def test_invalid_search(self):
+        for query in ('', '?q=', '?q=%20-!', '?q=' + '+'.join('abcdefghi'), '?q=report&ordering=title'):
+            response = self.client.get(reverse('task-search') + query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+
+class TaskStatsAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.work = Label.objects.create(name='Work', owner=self.user)
+        self.home = Label.objects.create(name='Home', owner=self.user)
+        self.idle = Label.objects.create(name='Idle', owner=self.user)
+
+        stranger = User.objects.create_user(username='stranger', password='12345')
+        Task.objects.create(title='Stranger task', owner=stranger).labels.set([
+            Label.objects.create(name='Work', owner=stranger),
+        ])
+
+    def get_stats(self):
+        response = self.client.get(reverse('task-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def assertStats(self, total, completed, work, home):
+        expected = {
+            'tasks': {'total': total, 'completed': completed, 'open': total - completed},
+            'labels': [
+                {'id': self.work.id, 'name': 'Work', 'tasks': work},
+                {'id': self.home.id, 'name': 'Home', 'tasks': home},
+                {'id': self.idle.id, 'name': 'Idle', 'tasks': 0},
+            ],
+        }
+        self.assertEqual(self.get_stats(), expected)
+        # the counters agree with counting the through table
+        with override_settings(TASK_STATS_LABEL_COUNTERS=False):
+            response_cache.get_cache().clear()
+            self.assertEqual(self.get_stats(), expected)
+
+    # EMPTY ACCOUNT
+    def test_empty_stats(self):
+        self.assertStats(0, 0, 0, 0)
+
+    # COUNTERS FOLLOW SINGLE WRITES
+    def test_stats_follow_task_writes(self):
+        url = reverse('task-list')
+        first = self.client.post(url, {'title': 'First', 'labels': [self.work.id, self.home.id]}, format='json')
+        self.client.post(url, {'title': 'Second', 'is_completed': True, 'labels': [self.work.id]}, format='json')
+        self.assertStats(2, 1, 2, 1)
+
+        detail = reverse('task-detail', kwargs={'pk': first.data['id']})
+        self.client.patch(detail, {'labels': [self.home.id]}, format='json')
+        self.assertStats(2, 1, 1, 1)
+
+        self.client.delete(detail)
+        self.assertStats(1, 1, 1, 0)
+
+    # COUNTERS FOLLOW BULK WRITES AND RELABELLING
+    def test_stats_follow_bulk_writes(self):
+        url = reverse('task-bulk')
+        created = self.client.post(url, [
+            {'title': f'Task {i}', 'labels': [self.work.id, self.home.id]} for i in range(4)
+        ], format='json')
+        ids = [task['id'] for task in created.data]
+        self.assertStats(4, 0, 4, 4)
+
+        self.client.patch(url, [
+            {'id': pk, 'is_completed': True, 'labels': [self.home.id]} for pk in ids[:2]
+        ], format='json')
+        self.assertStats(4, 2, 2, 4)
+
+        self.client.delete(reverse('label-tasks', kwargs={'pk': self.home.id}), {'ids': ids[1:]}, format='json')
+        self.client.post(reverse('label-tasks', kwargs={'pk': self.work.id}), {'filter': {}}, format='json')
+        self.assertStats(4, 2, 4, 1)
+
+        self.client.delete(url, ids[:3], format='json')
+        self.assertStats(1, 0, 1, 0)
+
+    # TWO QUERIES WHATEVER THE NUMBER OF LABELS
+    def test_stats_queries(self):
+        Label.objects.bulk_create([Label(name=f'Label {i}', owner=self.user) for i in range(20)])
+        authentication.clear_user_states()
+        with CaptureQueriesContext(connection) as context:
+            data = self.get_stats()
+
+        self.assertEqual(len(data['labels']), 23)
+        # the account state, the collection version, then the task totals and the labels
+        self.assertEqual(len(context), 4)
+
+
+class ConditionalRequestTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.label = Label.objects.create(name='Label 1', owner=self.user)
+        self.task = Task.objects.create(title='Task 1', owner=self.user)
+        self.task.labels.set([self.label])
+
+    # UNCHANGED LIST IS NOT MODIFIED
+    def test_list_not_modified(self):
+        url = reverse('task-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # the collection version, then the response cache
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # collection version only
+        response_cache.get_cache().clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url + '?page_size=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # WRITES CHANGE THE LIST TAG
+    def test_list_etag_changes_on_write(self):
+        task_url = reverse('task-list')
+        label_url = reverse('label-list')
+        task_etag = self.client.get(task_url)['ETag']
+        label_etag = self.client.get(label_url)['ETag']
+
+        self.client.post(task_url, {'title': 'Task 2', 'owner': self.user.id}, format='json')
+
+        self.assertEqual(self.client.get(task_url, HTTP_IF_NONE_MATCH=task_etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(label_url, HTTP_IF_NONE_MATCH=label_etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        task_etag = self.client.get(task_url)['ETag']
+        self.label.name = 'Renamed'
+        self.label.save()
+
+        self.assertEqual(self.client.get(task_url, HTTP_IF_NONE_MATCH=task_etag).status_code, status.HTTP_200_OK)
+
+    # RELABELLING CHANGES THE DETAIL TAG
+    def test_detail_etag_changes_on_relabel(self):
+        url = reverse('task-detail', kwargs={'pk': self.task.pk})
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.task.labels.clear()
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    # IF-MATCH PROTECTS AGAINST LOST UPDATES
+    def test_if_match(self):
+        url = reverse('task-detail', kwargs={'pk': self.task.pk})
+        etag = self.client.get(url)['ETag']
+        data = {'title': 'Mine', 'owner': self.user.id, 'labels': []}
+
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # someone holding the old tag loses
+        data['title'] = 'Theirs'
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.title, 'Mine')
+
+        response = self.client.delete(url, HTTP_IF_MATCH=self.client.get(url)['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    # BULK WRITES CHANGE THE LIST TAG
+    def test_bulk_writes_change_list_etag(self):
+        url = reverse('task-list')
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(reverse('task-bulk'), [{'id': self.task.id, 'is_completed': True}], format='json')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+
+class WriteTransactionTest(APITransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.label = Label.objects.create(name='Work', owner=self.user)
+        self.task = Task.objects.create(title='Task', owner=self.user)
+
+    def state(self):
+        return (
+            list(Task.objects.values_list('title', 'updated_at')), list(Label.objects.values_list('name', 'task_count')),
+            list(CollectionVersion.objects.values_list('version', flat=True)), Change.objects.count(),
+            list(Task.labels.through.objects.values_list('task_id', 'label_id')),
+        )
+
+    # A WRITE ROLLS BACK WITH EVERYTHING ITS SIGNALS WROTE
+    def test_write_and_side_effects_commit_together(self):
+        writes = [
+            ('post', 'task-list', {'title': 'New', 'labels': [self.label.id]}),
+            ('put', 'task-detail', {'title': 'Renamed', 'labels': [self.label.id]}),
+            ('patch', 'label-detail', {'name': 'Home'}),
+            ('post', 'label-list', {'name': 'Errands'}),
+            ('delete', 'label-detail', None),
+            ('delete', 'task-detail', None),
+        ]
+        before = self.state()
+        # the change log is the last thing written
+        failing = patch.object(Change.objects, 'bulk_create', side_effect=DatabaseError('change log is down'))
+        for prefix in ('', 'async-'):
+            for method, route, data in writes:
+                args = [self.label.pk if route.startswith('label') else self.task.pk] if 'detail' in route else []
+                with failing, self.assertRaises(DatabaseError):
+                    getattr(self.client, method)(reverse(prefix + route, args=args), data, format='json')
+                self.assertEqual(self.state(), before, (prefix + route, method))
+
+        # and commits with them otherwise
+        response = self.client.put(reverse('task-detail', args=[self.task.pk]), writes[1][2], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Label.objects.get().task_count, 1)
+        self.assertEqual(Change.objects.count(), before[3] + 1)
+
+
+class SyncAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('sync')
+
+        self.label = Label.objects.create(name='Label 1', owner=self.user)
+        self.kept = Task.objects.create(title='Kept', owner=self.user)
+        self.removed = Task.objects.create(title='Removed', owner=self.user)
+
+    def sync(self, token):
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    # CHANGES SINCE A TOKEN
+    def test_sync_returns_changes_and_tombstones(self):
+        token = self.client.get(self.url).data['token']
+
+        removed_id = self.removed.id
+        self.kept.labels.add(self.label)
+        self.removed.delete()
+        created = Task.objects.create(title='Created', owner=self.user)
+
+        data = self.sync(token)
+
+        self.assertEqual([task['title'] for task in data['tasks']], ['Kept', 'Created'])
+        self.assertEqual(data['tasks'][0]['labels'], [self.label.id])
+        self.assertEqual(data['labels'], [])
+        self.assertEqual(data['deleted'], {'tasks': [removed_id], 'labels': []})
+        self.assertFalse(data['has_more'])
+
+        # nothing new since the returned token
+        data = self.sync(data['token'])
+        self.assertEqual((data['tasks'], data['deleted']['tasks']), ([], []))
+
+        created.title = 'Renamed'
+        created.save()
+        self.assertEqual([task['title'] for task in self.sync(data['token'])['tasks']], ['Renamed'])
+
+    # LONG FEEDS ARE PAGED
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_sync_pages(self):
+        token = self.client.get(self.url).data['token']
+        for i in range(3):
+            Label.objects.create(name=f'New {i}', owner=self.user)
+
+        first = self.sync(token)
+        second = self.sync(first['token'])
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(len(first['labels']) + len(second['labels']), 3)
+
+    # TOKENS ARE BOUND TO THEIR USER
+    def test_sync_rejects_foreign_and_forged_tokens(self):
+        stranger = User.objects.create_user(username='bobross', password='12345')
+        foreign = sync.make_token(stranger.id, 0)
+
+        self.assertEqual(self.client.get(self.url, {'since': foreign}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'since': 'forged'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    # OLD TOKENS MUST RESYNC
+    def test_sync_token_expires(self):
+        token = self.client.get(self.url).data['token']
+        with override_settings(SYNC_TOKEN_MAX_AGE=-1):
+            response = self.client.get(self.url, {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class TaskExportAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.token = str(refresh.access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.url = reverse('task-export')
+
+        self.label = Label.objects.create(name='Label 1', owner=self.user)
+        for i in range(5):
+            task = Task.objects.create(title=f'Task {i}', owner=self.user)
+            task.labels.set([self.label])
+
+    def get_export(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    # JSON ARRAY EXPORT MATCHES THE SERIALIZER
+    def test_export_json(self):
+        response, content = self.get_export('')
+
+        tasks = Task.objects.filter(owner=self.user).order_by('id')
+        self.assertEqual(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(json.loads(content), json.loads(json.dumps(TaskSerializer(tasks, many=True).data)))
+
+    # NDJSON EXPORT, ONE TASK PER LINE
+    def test_export_ndjson(self):
+        response, content = self.get_export('?output=ndjson&expand=labels')
+
+        lines = content.splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['labels'], [{'id': self.label.id, 'name': 'Label 1'}])
+
+    # EMPTY EXPORT IS STILL VALID JSON
+    def test_export_empty(self):
+        Task.objects.all().delete()
+        _, content = self.get_export('')
+        self.assertEqual(json.loads(content), [])
+
+    # ASGI STREAMS IT CHUNK BY CHUNK INSTEAD OF BUFFERING IT
+    async def test_export_under_asgi(self):
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {self.token}'}
+        response = await client.get(self.url + '?output=ndjson&expand=labels', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+
+        chunks = [chunk async for chunk in response]
+        # five tasks in chunks of two
+        self.assertEqual(len(chunks), 3)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], [f'Task {i}' for i in range(5)])
+        self.assertEqual(json.loads(lines[0])['labels'], [{'id': self.label.id, 'name': 'Label 1'}])
+
+        response = await client.get(self.url, headers=headers)
+        content = b''.join([chunk async for chunk in response])
+        self.assertEqual([task['labels'] for task in json.loads(content)], [[self.label.id]] * 5)
+
+    # UNKNOWN OUTPUT
+    def test_export_invalid_output(self):
+        response = self.client.get(self.url + '?output=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchAPITest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.url = reverse('batch')
+
+    def post_batch(self, *requests):
+        return self.client.post(self.url, {'requests': list(requests)}, format='json')
+
+    # LATER REQUESTS USE THE RESULTS OF EARLIER ONES
+    def test_batch_references(self):
+        response = self.post_batch(
+            {'method': 'POST', 'path': '/api/labels/', 'body': {'name': 'Work'}},
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': 'Report', 'labels': ['$0.id']}},
+            {'method': 'GET', 'path': '/api/tasks/$1.id/?expand=labels'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        label = Label.objects.get(owner=self.user)
+        task = Task.objects.get(owner=self.user)
+        statuses = [item['status'] for item in response.data['responses']]
+        self.assertEqual(statuses, [201, 201, 200])
+        self.assertEqual(response.data['responses'][2]['body']['id'], task.id)
+        self.assertEqual(response.data['responses'][2]['body']['labels'], [{'id': label.id, 'name': 'Work'}])
+
+    # ONE FAILURE ROLLS BACK THE WHOLE BATCH
+    def test_batch_rolls_back(self):
+        list_url = reverse('label-list')
+        self.assertEqual(self.client.get(list_url).data['results'], [])
+
+        response = self.post_batch(
+            {'method': 'POST', 'path': '/api/labels/', 'body': {'name': 'Work'}},
+            {'method': 'GET', 'path': '/api/labels/'},
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {}},
+            {'method': 'GET', 'path': '/api/labels/'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        statuses = [item['status'] for item in response.data['responses']]
+        self.assertEqual(statuses, [201, 200, 400])
+        self.assertFalse(Label.objects.exists())
+        # the list cached inside the batch showed the rolled back label
+        self.assertEqual(self.client.get(list_url).data['results'], [])
+        # and the next write takes the version the batch had, not its cached list
+        self.client.post(list_url, {'name': 'Home'}, format='json')
+        self.assertEqual([label['name'] for label in self.client.get(list_url).data['results']], ['Home'])
+
+    # BAD REFERENCES AND ROUTES THAT CAN'T BE BATCHED
+    def test_batch_invalid_sub_requests(self):
+        for sub_request in [
+            {'method': 'GET', 'path': '/api/tasks/$3.id/'},
+            {'method': 'GET', 'path': '/api/batch/'},
+            {'method': 'GET', 'path': '/api/tasks/export/'},
+            {'method': 'GET', 'path': '/api/async/tasks/'},
+        ]:
+            response = self.post_batch({'method': 'GET', 'path': '/api/labels/'}, sub_request)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['responses'][1]['status'], 400)
+
+        response = self.post_batch({'method': 'GET', 'path': '/api/labels/'}, {'method': 'GET', 'path': '/api/nope/'})
+        self.assertEqual(response.data['responses'][1]['status'], 404)
+
+        response = self.post_batch(
+            {'method': 'POST', 'path': '/api/labels/', 'body': {'name': 'Work'}},
+            {'method': 'GET', 'path': '/api/labels/$0.missing/'},
+        )
+        self.assertEqual(response.data['responses'][1]['body']['detail'], '$0.missing is not in the response of request 0.')
+
+    # CONDITIONAL HEADERS ARE FORWARDED, ETAGS RETURNED
+    def test_batch_conditional_headers(self):
+        task = Task.objects.create(title='Report', owner=self.user)
+        path = f'/api/tasks/{task.id}/'
+        etag = self.client.get(path)['ETag']
+
+        response = self.post_batch({'method': 'GET', 'path': path})
+        self.assertEqual(response.data['responses'][0]['headers']['ETag'], etag)
+
+        response = self.post_batch(
+            {'method': 'PATCH', 'path': path, 'body': {'title': 'Done'}, 'headers': {'if-match': etag}},
+            {'method': 'PATCH', 'path': path, 'body': {'title': 'Lost'}, 'headers': {'If-Match': etag}},
+        )
+        statuses = [item['status'] for item in response.data['responses']]
+        self.assertEqual(statuses, [200, 412])
+        self.assertEqual(Task.objects.get(pk=task.pk).title, 'Report')
+
+        response = self.post_batch({'method': 'GET', 'path': path, 'headers': {'Authorization': 'Bearer x'}})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # ONE AUTHENTICATION FOR THE WHOLE BATCH
+    def test_batch_authenticates_once(self):
+        with patch.object(
+            authentication.CachedStatelessJWTAuthentication, 'authenticate',
+            autospec=True, side_effect=authentication.CachedStatelessJWTAuthentication.authenticate,
+        ) as authenticate:
+            response = self.post_batch(*[{'method': 'GET', 'path': '/api/labels/'}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(authenticate.call_count, 1)
+
+        self.client.credentials()
+        self.assertEqual(self.post_batch({'method': 'GET', 'path': '/api/labels/'}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # BATCH SIZE
+    def test_batch_size(self):
+        self.assertEqual(self.post_batch().status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post_batch(*[{'method': 'GET', 'path': '/api/labels/'}] * 26)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,181 @@
+import asyncio
+import json
+from unittest.mock import Mock, patch
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks import events, sync
+from tasks.models import Label, Task
+from tasks.serializers import LabelSerializer, TaskSerializer
+from tests.query_budget import read_stream
+
+def parse_events(content):
+    """The events of an event stream as dicts of their fields, comments left out"""
+    parsed = []
+    for block in content.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'data' in fields:
+            fields['data'] = json.loads(fields['data'])
+        if fields:
+            parsed.append(fields)
+    return parsed
+
+# streams end once they have sent what the change log holds
+@override_settings(EVENTS_STREAM_TIMEOUT=0)
+class EventStreamTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.url = reverse('events')
+        self.since = sync.current_token(self.user.id)
+
+        self.label = Label.objects.create(name='Work', owner=self.user)
+        self.task = Task.objects.create(title='Report', owner=self.user)
+        self.task.labels.set([self.label])
+        doomed = Task.objects.create(title='Doomed', owner=self.user)
+        self.doomed = doomed.pk
+        doomed.delete()
+
+        stranger = User.objects.create_user(username='stranger', password='12345')
+        Task.objects.create(title='Stranger task', owner=stranger)
+
+    def get_events(self, query='', **headers):
+        response = self.client.get(self.url + query, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return parse_events(read_stream(response).decode())
+
+    # REPLAY FROM A SYNC TOKEN
+    def test_events_since(self):
+        retry, *replayed = self.get_events(f'?since={self.since}')
+
+        self.assertEqual(retry, {'retry': str(events.RETRY_MS)})
+        # the deleted task's created event has no row to send anymore
+        self.assertEqual([event['event'] for event in replayed],
+                         ['label.created', 'task.created', 'task.updated', 'task.deleted'])
+        task = json.loads(json.dumps(TaskSerializer(Task.objects.get(pk=self.task.pk)).data))
+        self.assertEqual(replayed[0]['data'], json.loads(json.dumps(LabelSerializer(self.label).data)))
+        self.assertEqual(replayed[1]['data'], task)
+        self.assertEqual(replayed[2]['data'], task)
+        self.assertEqual(replayed[3]['data'], {'id': self.doomed})
+        # a batch of events is signed once, at its end
+        self.assertEqual(['id' in event for event in replayed], [False, False, False, True])
+
+    # RECONNECTS RESUME AFTER LAST-EVENT-ID
+    def test_events_resume(self):
+        last_event_id = self.get_events(f'?since={self.since}')[-1]['id']
+        pk = self.task.pk
+        self.task.delete()
+
+        _, resumed = self.get_events(HTTP_LAST_EVENT_ID=last_event_id)
+        self.assertEqual((resumed['event'], resumed['data']), ('task.deleted', {'id': pk}))
+        # ids are sync tokens too
+        response = self.client.get(reverse('sync'), {'since': resumed['id']})
+        self.assertEqual(response.data['deleted'], {'tasks': [], 'labels': []})
+
+    # NEW STREAMS START AT THE LATEST CHANGE
+    def test_events_from_now(self):
+        self.assertEqual(self.get_events(), [{'retry': str(events.RETRY_MS)}])
+
+    # BAD IDS AND CREDENTIALS
+    def test_events_invalid(self):
+        foreign = sync.current_token(User.objects.get(username='stranger').id)
+        for event_id in ('forged', foreign):
+            response = self.client.get(self.url, HTTP_LAST_EVENT_ID=event_id)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # EventSource asks for text/event-stream, errors still come back
+        response = self.client.get(self.url, HTTP_LAST_EVENT_ID='forged', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(parse_events(response.content.decode()),
+                         [{'event': 'error', 'data': {'Last-Event-ID': ['Invalid event id.']}}])
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # COMMITS WAKE THE OWNER'S STREAMS
+    def test_events_published_on_commit(self):
+        wake = Mock()
+        broker = events.get_broker()
+        broker.subscribe(self.user.id, wake)
+        self.addCleanup(broker.unsubscribe, self.user.id, wake)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='Stranger task', owner=User.objects.get(username='stranger'))
+        wake.assert_not_called()
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='New', owner=self.user)
+        wake.assert_called_once_with()
+
+    # PUSH AND HEARTBEATS WITHOUT A THREAD PER STREAM
+    @override_settings(EVENTS_STREAM_TIMEOUT=10, EVENTS_HEARTBEAT=10)
+    async def test_events_pushed(self):
+        stream = events.stream_events(self.user.id)
+        self.assertEqual(await anext(stream), f'retry: {events.RETRY_MS}\n\n')
+
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        self.assertFalse(pending.done())
+        await sync_to_async(Task.objects.create)(title='Pushed', owner=self.user)
+        # on_commit callbacks don't run inside test transactions
+        events.get_broker().publish(self.user.id)
+        pushed = parse_events(await asyncio.wait_for(pending, 5))
+        self.assertEqual([(event['event'], event['data']['title']) for event in pushed], [('task.created', 'Pushed')])
+
+        with override_settings(EVENTS_HEARTBEAT=0.01):
+            self.assertEqual(await asyncio.wait_for(anext(stream), 5), ': heartbeat\n\n')
+        await stream.aclose()
+        self.assertNotIn(self.user.id, events.get_broker()._streams)
+
+    # THE ASGI APPLICATION SERVES STREAMS WITHOUT DJANGO'S PER-REQUEST THREAD
+    async def test_asgi_routes_streams(self):
+        from backend_assessment.asgi import application
+
+        async def status_of(path):
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'testserver')],
+            }
+            requested, sent = [], []
+
+            async def receive():
+                if not requested:
+                    requested.append(True)
+                    return {'type': 'http.request', 'body': b''}
+                # the client stays connected
+                await asyncio.Event().wait()
+
+            async def send(message):
+                sent.append(message)
+
+            await application(scope, receive, send)
+            return sent[0]['status']
+
+        handle = events.EventStreamHandler.handle
+        with patch.object(events.EventStreamHandler, 'handle', autospec=True, side_effect=handle) as handle:
+            self.assertEqual(await status_of(self.url), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(handle.call_count, 1)
+            self.assertEqual(await status_of(reverse('async-task-list')), status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(handle.call_count, 1)
+
+    # BROKER FOR SEVERAL PROCESSES
+    def test_polling_broker(self):
+        broker = events.PollingBroker()
+        wake = Mock()
+        with patch.object(events.PollingBroker, 'run'):
+            broker.subscribe(self.user.id, wake)
+
+        broker.poll()
+        self.assertEqual(wake.call_count, 1)
+        broker.poll()
+        self.assertEqual(wake.call_count, 1)
+        Task.objects.create(title='Elsewhere', owner=self.user)
+        broker.poll()
+        self.assertEqual(wake.call_count, 2)
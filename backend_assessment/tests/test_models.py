@@ -1,6 +1,10 @@
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth.models import User
-from tasks.models import Label, Task
+from tasks.models import Change, CollectionVersion, Label, Task, recount_label_tasks
 
 class LabelModelTest(TestCase):
 
@@ -94,4 +98,126 @@ class LabelTaskModelTest(TestCase):
 
     def test_unique_label_constraint(self):
         with self.assertRaises(Exception):
-            Label.objects.create(name='Test Label 10', owner=self.user)
\ No newline at end of file
+            Label.objects.create(name='Test Label 10', owner=self.user)
+
+class CollectionVersionModelTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def version(self, collection):
+        return CollectionVersion.objects.get(owner=self.user, collection=collection).version
+
+    def test_writes_bump_versions(self):
+        label = Label.objects.create(name='Test Label', owner=self.user)
+        self.assertEqual(self.version(CollectionVersion.LABELS), 1)
+
+        task = Task.objects.create(title='Test Task', owner=self.user)
+        tasks_version = self.version(CollectionVersion.TASKS)
+        task.labels.add(label)
+        self.assertEqual(self.version(CollectionVersion.TASKS), tasks_version + 1)
+        self.assertEqual(self.version(CollectionVersion.LABELS), 1)
+
+    def test_deleting_label_touches_its_tasks(self):
+        label = Label.objects.create(name='Test Label', owner=self.user)
+        task = Task.objects.create(title='Test Task', owner=self.user)
+        task.labels.add(label)
+        before = Task.objects.get(pk=task.pk).updated_at
+
+        label.delete()
+
+        self.assertGreater(Task.objects.get(pk=task.pk).updated_at, before)
+
+    def test_deleting_owner(self):
+        user = User.objects.create_user(username='leaving', password='12345')
+        label = Label.objects.create(name='Test Label', owner=user)
+        task = Task.objects.create(title='Test Task', owner=user)
+        task.labels.add(label)
+
+        user.delete()
+
+        # the deferred foreign keys are checked when the test tears down
+        self.assertFalse(CollectionVersion.objects.filter(owner_id=user.pk).exists())
+
+class LabelTaskCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    def setUp(self):
+        self.work = Label.objects.create(name='Work', owner=self.user)
+        self.home = Label.objects.create(name='Home', owner=self.user)
+        self.tasks = [Task.objects.create(title=f'Task {i}', owner=self.user) for i in range(3)]
+
+    def assertCounts(self, work, home):
+        counts = dict(Label.objects.values_list('name', 'task_count'))
+        self.assertEqual(counts, {'Work': work, 'Home': home})
+        # the counters always match a recount
+        recount_label_tasks(Label.objects.all())
+        self.assertEqual(dict(Label.objects.values_list('name', 'task_count')), counts)
+
+    def test_task_side_writes(self):
+        first, second, _ = self.tasks
+        first.labels.add(self.work, self.home)
+        second.labels.set([self.work])
+        self.assertCounts(2, 1)
+
+        # removing a label the task doesn't have changes nothing
+        second.labels.remove(self.work, self.home)
+        self.assertCounts(1, 1)
+
+        first.labels.clear()
+        self.assertCounts(0, 0)
+
+    def test_label_side_writes(self):
+        self.work.task_set.add(*self.tasks)
+        self.work.task_set.add(self.tasks[0])
+        self.assertCounts(3, 0)
+
+        self.work.task_set.remove(self.tasks[0])
+        self.assertCounts(2, 0)
+
+        self.work.task_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_deleted_tasks_are_uncounted(self):
+        for task in self.tasks:
+            task.labels.set([self.work, self.home])
+
+        self.tasks[0].delete()
+        self.assertCounts(2, 2)
+
+        Task.objects.filter(pk=self.tasks[1].pk).delete()
+        self.assertCounts(1, 1)
+
+    def test_recount_command(self):
+        Task.labels.through.objects.bulk_create([
+            Task.labels.through(task=task, label=self.work) for task in self.tasks
+        ])
+        self.assertEqual(Label.objects.get(pk=self.work.pk).task_count, 0)
+
+        call_command('recount_labels', owner=self.user.pk, stdout=StringIO())
+        self.assertCounts(3, 0)
+
+class ChangeLogTransactionTest(TransactionTestCase):
+
+    # A SAVE COMMITS WITH ITS CHANGE LOG ENTRY, OUTSIDE THE API TOO
+    def test_save_and_change_log_commit_together(self):
+        user = User.objects.create_user(username='testuser', password='12345')
+        label = Label.objects.create(name='Work', owner=user)
+        task = Task.objects.create(title='Task', owner=user)
+        changes = Change.objects.count()
+
+        failing = patch.object(Change.objects, 'bulk_create', side_effect=DatabaseError('change log is down'))
+        for save in (lambda: Task.objects.create(title='New', owner=user), lambda: Label(name='Home', owner=user).save(),
+                     lambda: Task(pk=task.pk, title='Renamed', owner=user).save(update_fields=['title'])):
+            with failing, self.assertRaises(DatabaseError):
+                save()
+        self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['Task'])
+        self.assertEqual(list(Label.objects.values_list('pk', flat=True)), [label.pk])
+
+        task.title = 'Renamed'
+        task.save(update_fields=['title'])
+        self.assertEqual(Change.objects.count(), changes + 1)
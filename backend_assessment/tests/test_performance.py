@@ -0,0 +1,95 @@
+import re
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks import performance
+from tasks.models import Task
+
+class PerformanceMiddlewareTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        Task.objects.bulk_create([Task(title=f'Task {i}', owner=self.user) for i in range(5)])
+        performance.reset()
+
+    def server_timing(self, response):
+        return dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+
+    # SERVER-TIMING HEADER
+    def test_server_timing_header(self):
+        for url in (reverse('task-list'), reverse('async-task-list')):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+
+            timing = self.server_timing(response)
+            self.assertEqual(set(timing), {'total', 'db', 'render'})
+            self.assertIn(f'desc="{len(context)} queries"', response['Server-Timing'])
+            # the header rounds to 0.1 ms, a few tasks render faster than that with orjson
+            render_ms = performance._samples[(response.wsgi_request.resolver_match.view_name, 'GET')][-1][3]
+            self.assertGreater(render_ms, 0)
+            self.assertEqual(float(timing['render']), round(render_ms, 1))
+            self.assertGreaterEqual(float(timing['total']), float(timing['db']))
+
+    # QUERIES ON OTHER THREADS ARE COUNTED UNDER ASGI
+    async def test_server_timing_under_asgi(self):
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {self.token}'}
+        # the sync view runs in a sync_to_async thread, the async view's ORM calls in another
+        for url in (reverse('task-list'), reverse('async-task-list')):
+            slow = override_settings(PERFORMANCE_SLOW_QUERY_MS=0)
+            with slow, self.assertLogs('tasks.performance', 'WARNING') as logs:
+                response = await client.get(url, headers=headers)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+            self.assertGreater(queries, 0)
+            self.assertGreater(float(self.server_timing(response)['db']), 0)
+            self.assertEqual(performance._samples[(response.resolver_match.view_name, 'GET')][-1][2], queries)
+            self.assertIn(url, logs.output[0])
+
+    # PERCENTILES PER ROUTE
+    def test_stats(self):
+        for _ in range(3):
+            self.client.get(reverse('task-list'))
+        self.client.post(reverse('task-list'), {'title': 'New'}, format='json')
+        self.client.get(reverse('label-list'))
+
+        response = self.client.get(reverse('performance'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('performance'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        routes = {(route['route'], route['method']): route for route in response.data['routes']}
+        self.assertEqual(routes[('task-list', 'GET')]['count'], 3)
+        self.assertEqual(routes[('task-list', 'POST')]['count'], 1)
+        self.assertEqual(routes[('label-list', 'GET')]['count'], 1)
+        summary = routes[('task-list', 'GET')]
+        self.assertEqual(set(summary['total_ms']), {'p50', 'p95', 'p99'})
+        self.assertLessEqual(summary['total_ms']['p50'], summary['total_ms']['p99'])
+        self.assertGreater(summary['size_bytes']['p50'], 0)
+        self.assertIn('hit_ratio', response.data['response_cache'])
+
+    # SLOW QUERIES ARE LOGGED
+    def test_slow_queries_are_logged(self):
+        with override_settings(PERFORMANCE_SLOW_QUERY_MS=0), self.assertLogs('tasks.performance', 'WARNING') as logs:
+            self.client.get(reverse('task-list'))
+
+        self.assertTrue(logs.output)
+        self.assertIn('tasks_task', ''.join(logs.output))
+        self.assertIn('/api/tasks/', logs.output[0])
+
+    # NEAREST-RANK PERCENTILES
+    def test_percentiles(self):
+        self.assertEqual(performance.percentiles(list(range(1, 101))), {'p50': 50, 'p95': 95, 'p99': 99})
+        self.assertEqual(performance.percentiles([7]), {'p50': 7, 'p95': 7, 'p99': 7})
+        self.assertIsNone(performance.percentiles([]))
@@ -0,0 +1,240 @@
+from types import SimpleNamespace
+from unittest import TestLoader
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks import sync
+from tasks.models import Label, Task, recount_label_tasks
+from tasks.signals import notify
+from tests.query_budget import QueryBudgetTestCase
+
+# enough for every write below to both add and remove labels
+SMALL = 3
+# more than a page of tasks and labels
+LARGE = 60
+
+# the most queries each route and method may run, for any number of rows
+BUDGETS = {
+    ('home', 'GET'): 4,
+    ('token_obtain_pair', 'POST'): 1,
+    ('token_refresh', 'POST'): 0,
+    ('label-list', 'GET'): 3,
+    ('label-list', 'POST'): 6,
+    ('label-detail', 'GET'): 3,
+    ('label-detail', 'PUT'): 8,
+    ('label-detail', 'PATCH'): 8,
+    ('label-detail', 'DELETE'): 12,
+    ('label-tasks', 'POST'): 9,
+    ('label-tasks', 'DELETE'): 9,
+    ('task-list', 'GET'): 4,
+    ('task-list', 'POST'): 10,
+    ('task-search', 'GET'): 4,
+    ('task-stats', 'GET'): 4,
+    ('task-detail', 'GET'): 5,
+    ('task-detail', 'PUT'): 17,
+    ('task-detail', 'PATCH'): 16,
+    ('task-detail', 'DELETE'): 9,
+    ('task-bulk', 'POST'): 11,
+    ('task-bulk', 'PATCH'): 14,
+    ('task-bulk', 'DELETE'): 10,
+    ('task-export', 'GET'): 3,
+    ('sync', 'GET'): 5,
+    ('events', 'GET'): 5,
+    ('performance', 'GET'): 2,
+    ('batch', 'POST'): 35,
+    ('async-label-list', 'GET'): 3,
+    ('async-label-list', 'POST'): 6,
+    ('async-label-detail', 'GET'): 3,
+    ('async-label-detail', 'PUT'): 8,
+    ('async-label-detail', 'PATCH'): 8,
+    ('async-label-detail', 'DELETE'): 12,
+    ('async-task-list', 'GET'): 4,
+    ('async-task-list', 'POST'): 11,
+    ('async-task-detail', 'GET'): 5,
+    ('async-task-detail', 'PUT'): 16,
+    ('async-task-detail', 'PATCH'): 15,
+    ('async-task-detail', 'DELETE'): 8,
+}
+# methods every route answers without a budget of its own: HEAD runs GET, OPTIONS reads no rows
+UNBUDGETED_METHODS = {'HEAD', 'OPTIONS'}
+
+class QueryBudgetTest(QueryBudgetTestCase):
+    # every (route, method) a test of this class sent, and the tests that passed
+    exercised = set()
+    passed = set()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        # only a passing run of the whole class sends every request
+        if cls.passed == set(TestLoader().getTestCaseNames(cls)):
+            missing = set(BUDGETS) - cls.exercised
+            assert not missing, f'budgets no test sends a request for: {sorted(missing)}'
+
+    def setUp(self):
+        super().setUp()
+        self.owners = [self.make_owner('small', SMALL), self.make_owner('large', LARGE)]
+
+    def tearDown(self):
+        if self._outcome.success:
+            self.passed.add(self._testMethodName)
+        super().tearDown()
+
+    def make_owner(self, username, size):
+        """
+        A staff user with size labels and size tasks. Task i carries labels i
+        and i - 1, the spare label has no tasks.
+        """
+        user = User.objects.create_user(username=username, password='12345', is_staff=True)
+        token = sync.current_token(user.id)
+        labels = Label.objects.bulk_create([Label(name=f'Label {i}', owner=user) for i in range(size)])
+        tasks = Task.objects.bulk_create([Task(title=f'Task {i}', owner=user) for i in range(size)])
+        spare = Label.objects.create(name='Spare', owner=user)
+        Task.labels.through.objects.bulk_create([
+            Task.labels.through(task_id=task.pk, label_id=label.pk)
+            for i, task in enumerate(tasks)
+            for label in (labels[i], labels[i - 1])
+        ])
+        # bulk_create skips the signals, count the links and log the rows for /sync/ like tasks/bulk.py does
+        recount_label_tasks(Label.objects.filter(owner=user))
+        notify(Label, user.id, created=[label.pk for label in labels])
+        notify(Task, user.id, created=[task.pk for task in tasks])
+        return SimpleNamespace(
+            user=user, size=size, token=token, spare=spare.pk,
+            labels=[label.pk for label in labels], tasks=[task.pk for task in tasks],
+        )
+
+    def check(self, route, method, request):
+        self.exercised.add((route, method))
+        self.assertQueryBudgets(BUDGETS[(route, method)], method, request, self.owners)
+
+    # EVERY ROUTE AND METHOD HAS A BUDGET
+    def test_every_route_has_a_budget(self):
+        from backend_assessment.urls import urlpatterns as root_patterns
+        from tasks.urls import urlpatterns
+        allowed = set()
+        for pattern in urlpatterns + root_patterns:
+            if not getattr(pattern, 'name', None):
+                continue
+            kwargs = {'pk': 1} if 'pk' in pattern.pattern.converters else {}
+            # every view names its methods in Allow, whether or not it lets the request in
+            response = self.client.options(reverse(pattern.name, kwargs=kwargs))
+            methods = {method.strip() for method in response['Allow'].split(',')} - UNBUDGETED_METHODS
+            allowed.update((pattern.name, method) for method in methods)
+
+        self.assertEqual(allowed, set(BUDGETS))
+
+    # HOME AND TOKENS
+    def test_home_and_tokens(self):
+        self.check('home', 'GET', lambda owner: (reverse('home'), None))
+        self.check('token_obtain_pair', 'POST', lambda owner: (
+            reverse('token_obtain_pair'), {'username': owner.user.username, 'password': '12345'},
+        ))
+        self.check('token_refresh', 'POST', lambda owner: (
+            reverse('token_refresh'), {'refresh': str(RefreshToken.for_user(owner.user))},
+        ))
+
+    # LABELS
+    def test_labels(self):
+        self.check('label-list', 'GET', lambda owner: (reverse('label-list'), None))
+        self.check('label-list', 'POST', lambda owner: (reverse('label-list'), {'name': 'New label'}))
+        detail = lambda owner: reverse('label-detail', kwargs={'pk': owner.labels[0]})
+        self.check('label-detail', 'GET', lambda owner: (detail(owner), None))
+        self.check('label-detail', 'PUT', lambda owner: (detail(owner), {'name': 'Renamed'}))
+        self.check('label-detail', 'PATCH', lambda owner: (detail(owner), {'name': 'Patched'}))
+        self.check('label-detail', 'DELETE', lambda owner: (
+            reverse('label-detail', kwargs={'pk': owner.labels[-1]}), None,
+        ))
+
+    # RELABELLING
+    def test_label_tasks(self):
+        url = lambda owner: reverse('label-tasks', kwargs={'pk': owner.spare})
+        self.check('label-tasks', 'POST', lambda owner: (url(owner), {'ids': owner.tasks}))
+        self.check('label-tasks', 'DELETE', lambda owner: (url(owner), {'filter': {}}))
+
+    # TASK LISTS
+    def test_task_list(self):
+        url = reverse('task-list')
+        for query in ('', '?expand=labels', '?is_completed=false&labels={labels}', '?search=Task&ordering=title'):
+            self.check('task-list', 'GET', lambda owner: (
+                url + query.format(labels=','.join(map(str, owner.labels[:3]))), None,
+            ))
+        self.check('task-list', 'POST', lambda owner: (url, {'title': 'New task', 'labels': owner.labels}))
+
+    # TASK SEARCH
+    def test_task_search(self):
+        url = reverse('task-search')
+        for query in ('?q=task', '?q=task&expand=labels'):
+            self.check('task-search', 'GET', lambda owner: (url + query, None))
+
+    # TASK DETAILS
+    def test_task_detail(self):
+        detail = lambda owner: reverse('task-detail', kwargs={'pk': owner.tasks[0]})
+        self.check('task-detail', 'GET', lambda owner: (detail(owner), None))
+        self.check('task-detail', 'GET', lambda owner: (detail(owner) + '?expand=labels', None))
+        self.check('task-detail', 'PUT', lambda owner: (detail(owner), {
+            'title': 'Renamed', 'description': 'New', 'is_completed': True, 'labels': owner.labels[1:],
+        }))
+        self.check('task-detail', 'PATCH', lambda owner: (detail(owner), {'labels': owner.labels[:1]}))
+        self.check('task-detail', 'DELETE', lambda owner: (
+            reverse('task-detail', kwargs={'pk': owner.tasks[-1]}), None,
+        ))
+
+    # BULK WRITES
+    def test_task_bulk(self):
+        url = reverse('task-bulk')
+        self.check('task-bulk', 'POST', lambda owner: (url, [
+            {'title': f'Bulk {i}', 'labels': owner.labels[:2]} for i in range(owner.size)
+        ]))
+        self.check('task-bulk', 'PATCH', lambda owner: (url, [
+            {'id': pk, 'is_completed': True, 'labels': owner.labels[:1]} for pk in owner.tasks
+        ]))
+        self.check('task-bulk', 'DELETE', lambda owner: (url, owner.tasks))
+
+    # EVENT STREAMS, REPLAYING THE CHANGE LOG SINCE THE OWNER WAS MADE
+    @override_settings(EVENTS_STREAM_TIMEOUT=0)
+    def test_events(self):
+        self.check('events', 'GET', lambda owner: (f'{reverse("events")}?since={owner.token}', None))
+
+    # EXPORT, STATS, SYNC AND TIMINGS
+    def test_reads(self):
+        self.check('task-stats', 'GET', lambda owner: (reverse('task-stats'), None))
+        self.check('task-export', 'GET', lambda owner: (reverse('task-export') + '?expand=labels', None))
+        self.check('sync', 'GET', lambda owner: (reverse('sync'), None))
+        self.check('sync', 'GET', lambda owner: (f'{reverse("sync")}?since={owner.token}', None))
+        self.check('performance', 'GET', lambda owner: (reverse('performance'), None))
+
+    # BATCHES, THE SUM OF THEIR SUB-REQUESTS
+    def test_batch(self):
+        self.check('batch', 'POST', lambda owner: (reverse('batch'), {'requests': [
+            {'method': 'POST', 'path': reverse('label-list'), 'body': {'name': 'New label'}},
+            {'method': 'POST', 'path': reverse('task-list'), 'body': {'title': 'New task', 'labels': ['$0.id']}},
+            {'method': 'PATCH', 'path': '/api/tasks/$1.id/', 'body': {'labels': owner.labels}},
+            {'method': 'GET', 'path': reverse('task-list') + '?expand=labels'},
+        ]}))
+
+    # ASYNC ROUTES
+    def test_async_routes(self):
+        self.check('async-label-list', 'GET', lambda owner: (reverse('async-label-list'), None))
+        label = lambda owner: reverse('async-label-detail', kwargs={'pk': owner.labels[0]})
+        self.check('async-label-detail', 'GET', lambda owner: (label(owner), None))
+        self.check('async-label-list', 'POST', lambda owner: (reverse('async-label-list'), {'name': 'New label'}))
+        self.check('async-label-detail', 'PUT', lambda owner: (label(owner), {'name': 'Renamed'}))
+        self.check('async-label-detail', 'PATCH', lambda owner: (label(owner), {'name': 'Patched'}))
+        self.check('async-task-list', 'GET', lambda owner: (reverse('async-task-list') + '?expand=labels', None))
+        self.check('async-task-list', 'POST', lambda owner: (
+            reverse('async-task-list'), {'title': 'New task', 'labels': owner.labels},
+        ))
+        task = lambda owner: reverse('async-task-detail', kwargs={'pk': owner.tasks[0]})
+        self.check('async-task-detail', 'GET', lambda owner: (task(owner) + '?expand=labels', None))
+        self.check('async-task-detail', 'PUT', lambda owner: (task(owner), {
+            'title': 'Renamed', 'description': 'New', 'is_completed': True, 'labels': owner.labels[1:],
+        }))
+        self.check('async-task-detail', 'PATCH', lambda owner: (task(owner), {'labels': owner.labels[:1]}))
+        self.check('async-task-detail', 'DELETE', lambda owner: (
+            reverse('async-task-detail', kwargs={'pk': owner.tasks[-1]}), None,
+        ))
+        self.check('async-label-detail', 'DELETE', lambda owner: (
+            reverse('async-label-detail', kwargs={'pk': owner.labels[-1]}), None,
+        ))
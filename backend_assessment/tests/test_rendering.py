@@ -0,0 +1,216 @@
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import RefreshToken
+from tasks import compression, renderers, sync
+from tasks.models import Label, Task
+from tests.query_budget import read_stream
+
+class RendererTest(SimpleTestCase):
+    data = {
+        'id': 1, 'title': 'Café \u2028 \u2029 "quoted" </script>', 'done': False, 'score': 1.5,
+        'at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc), 'day': datetime(2024, 5, 1).date(),
+        'price': Decimal('9.90'), 'labels': [{'id': 2, 'name': None}], 'empty': {},
+    }
+
+    def render(self, renderer, data, accepted_media_type='application/json'):
+        return renderer.render(data, accepted_media_type, {})
+
+    # SAME BYTES AS DRF'S RENDERER
+    def test_renderer_matches_drf(self):
+        for data in (self.data, [self.data] * 3, [], 'text', None, {'big': 2 ** 70}):
+            self.assertEqual(self.render(renderers.FastJSONRenderer(), data), self.render(JSONRenderer(), data))
+        # an indent is left to DRF
+        self.assertEqual(
+            self.render(renderers.FastJSONRenderer(), self.data, 'application/json; indent=2'),
+            self.render(JSONRenderer(), self.data, 'application/json; indent=2'),
+        )
+
+    # FLOATS AND BIG INTEGERS
+    @skipUnless(renderers.orjson, 'orjson is not installed')
+    def test_numbers_match_drf(self):
+        numbers = [0.1, 1 / 3, -0.0, 1e-7, 1e20, 5e-324, 2 ** 63 - 1, 2 ** 64 - 1, -2 ** 63]
+        fast, drf = self.render(renderers.FastJSONRenderer(), numbers), self.render(JSONRenderer(), numbers)
+        # the same numbers, exponents are spelled shorter
+        self.assertEqual(json.loads(fast), json.loads(drf))
+        self.assertIn(b'1e-7', fast)
+        for number in (2 ** 64, 2 ** 70, -2 ** 100):
+            self.assertEqual(self.render(renderers.FastJSONRenderer(), [number]),
+                             self.render(JSONRenderer(), [number]))
+        # not JSON, JSONRenderer refuses them
+        for number in (float('nan'), float('inf'), float('-inf')):
+            with self.assertRaises(ValueError):
+                self.render(JSONRenderer(), [number])
+            self.assertEqual(self.render(renderers.FastJSONRenderer(), [number]), b'[null]')
+
+        for body in (drf, b'[-9223372036854775809, 18446744073709551616, 1e-7]', b'{"id": 1, "n": 2e400}'):
+            parsed = renderers.FastJSONParser().parse(io.BytesIO(body))
+            self.assertEqual(parsed, JSONParser().parse(io.BytesIO(body)))
+            self.assertEqual(list(map(type, parsed)), list(map(type, JSONParser().parse(io.BytesIO(body)))))
+
+    # STDLIB FALLBACK
+    def test_without_orjson(self):
+        with patch.object(renderers, 'orjson', None):
+            self.assertEqual(self.render(renderers.FastJSONRenderer(), self.data),
+                             self.render(JSONRenderer(), self.data))
+            # dumps() leaves the line separators to JSONRenderer
+            self.assertEqual(renderers.dumps(self.data), json.dumps(self.data, cls=JSONEncoder, ensure_ascii=False,
+                                                                    separators=(',', ':')).encode())
+            self.assertEqual(renderers.FastJSONParser().parse(io.BytesIO(b'{"a": [1]}')), {'a': [1]})
+
+    # PARSER
+    def test_parser(self):
+        body = json.dumps(self.data, default=str).encode()
+        self.assertEqual(renderers.FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for invalid in (b'{"a": ', b'NaN', b''):
+            with self.assertRaises(ParseError):
+                renderers.FastJSONParser().parse(io.BytesIO(invalid))
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.since = sync.current_token(self.user.id)
+        self.label = Label.objects.create(name='Work', owner=self.user)
+        for i in range(30):
+            description = 'Write the quarterly report ' * 3
+            task = Task.objects.create(title=f'Task {i}', description=description, owner=self.user)
+            task.labels.set([self.label])
+
+    def get(self, url, accept_encoding=None, **extra):
+        if accept_encoding is not None:
+            extra['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        return self.client.get(url, **extra)
+
+    # NEGOTIATION
+    def test_choose_coding(self):
+        with patch.object(compression, 'brotli', object()):
+            self.assertEqual(compression.choose_coding('gzip, deflate, br'), 'br')
+            self.assertEqual(compression.choose_coding('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(compression.choose_coding('*'), 'br')
+            self.assertEqual(compression.choose_coding('*, br;q=0'), 'gzip')
+        with patch.object(compression, 'brotli', None):
+            self.assertEqual(compression.choose_coding('gzip, deflate, br'), 'gzip')
+            self.assertIsNone(compression.choose_coding('br'))
+        self.assertIsNone(compression.choose_coding(''))
+        self.assertIsNone(compression.choose_coding('identity, gzip;q=0, *;q=0'))
+        self.assertIsNone(compression.choose_coding('gzip;q=oops'))
+
+    # GZIP
+    @patch.object(compression, 'brotli', None)
+    def test_gzip(self):
+        url = reverse('task-list') + '?page_size=30'
+        plain = self.get(url)
+        compressed = self.get(url, 'gzip, br')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(int(compressed['Content-Length']), len(compressed.content))
+        self.assertLess(len(compressed.content), len(plain.content) / 3)
+        for response in (plain, compressed):
+            self.assertIn('Accept-Encoding', response['Vary'])
+        # a compressed body is another representation, with a tag of its own
+        self.assertEqual(compressed['ETag'], plain['ETag'][:-1] + '-gzip"')
+        for etag in (plain['ETag'], compressed['ETag']):
+            response = self.get(url, 'gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+    # BROTLI
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        url = reverse('async-task-list') + '?page_size=30'
+        plain = self.get(url)
+        compressed = self.get(url, 'gzip, br')
+
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(compressed.content), plain.content)
+
+    # IF-MATCH TAKES THE ETAG OF A COMPRESSED RESPONSE
+    @patch.object(compression, 'brotli', None)
+    def test_etag_of_compressed_detail(self):
+        task = Task.objects.create(title='Long', description='word ' * 500, owner=self.user)
+        url = reverse('task-detail', args=[task.pk])
+        response = self.get(url, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        etag = response['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+
+        data = {'title': 'Renamed', 'description': 'short'}
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Content-Encoding', response)
+        # the tag now names a state that is gone
+        response = self.client.put(url, data, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        # inside a batch too
+        Task.objects.filter(pk=task.pk).update(description='word ' * 500)
+        etag = self.get(url, 'gzip')['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        request = {'method': 'DELETE', 'path': url, 'headers': {'If-Match': etag}}
+        response = self.client.post(reverse('batch'), {'requests': [request]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['responses'][0]['status'], status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Task.objects.filter(pk=task.pk).exists())
+
+    # SMALL AND EXCLUDED RESPONSES
+    def test_not_compressed(self):
+        small = self.get(reverse('label-list'), 'gzip, br')
+        self.assertLess(len(small.content), 1024)
+        self.assertNotIn('Content-Encoding', small)
+
+        # only the task and label API
+        token = self.client.post(reverse('token_obtain_pair'), {'username': 'testuser', 'password': '12345'},
+                                 HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', token)
+
+        # the stream reads the setting as it goes
+        with override_settings(EVENTS_STREAM_TIMEOUT=0):
+            events = self.get(reverse('events') + f'?since={self.since}', 'gzip, br')
+            self.assertEqual(events['Content-Type'], 'text/event-stream')
+            self.assertNotIn('Content-Encoding', events)
+            self.assertIn(b'event: task.created', read_stream(events))
+
+    # STREAMED EXPORTS COMPRESS AS THEY STREAM
+    @patch.object(compression, 'brotli', None)
+    def test_export_compressed(self):
+        url = reverse('task-export') + '?output=ndjson'
+        plain = read_stream(self.get(url))
+        response = self.get(url, 'gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(read_stream(response)), plain)
+
+    # AND UNDER ASGI, WHERE THE EXPORT IS AN ASYNC STREAM
+    @patch.object(compression, 'brotli', None)
+    async def test_async_export_compressed(self):
+        url = reverse('task-export') + '?output=ndjson'
+        headers = {'Authorization': f'Bearer {self.token}'}
+        plain = await AsyncClient().get(url, headers=headers)
+        response = await AsyncClient().get(url, headers={**headers, 'Accept-Encoding': 'gzip'})
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = b''.join([chunk async for chunk in response])
+        self.assertEqual(gzip.decompress(content), b''.join([chunk async for chunk in plain]))
@@ -0,0 +1,139 @@
+import tempfile
+import time
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.test import SimpleTestCase
+from backend_assessment.cache import LRUFileBasedCache
+from tasks import response_cache
+from tasks.models import CollectionVersion, Label, Task
+
+class ResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.label = Label.objects.create(name='Label 1', owner=self.user)
+        self.task = Task.objects.create(title='Task 1', owner=self.user)
+        self.task.labels.set([self.label])
+        response_cache.reset_metrics()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def assertCached(self, url, cached):
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT' if cached else 'MISS')
+
+    # REPEATED READS ARE HITS
+    def test_repeated_reads_are_hits(self):
+        url = reverse('task-list')
+        first = self.get(url)
+        # the collection version only
+        with self.assertNumQueries(1):
+            second = self.get(url)
+
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(response_cache.metrics()['hits'], 1)
+        self.assertEqual(response_cache.metrics()['misses'], 1)
+
+    # EVERY REPRESENTATION IS ITS OWN ENTRY
+    def test_query_parameters_are_part_of_the_key(self):
+        url = reverse('task-list')
+        self.get(url)
+
+        expanded = self.get(url + '?expand=labels')
+        self.assertEqual(expanded['X-Cache'], 'MISS')
+        self.assertEqual(expanded.data['results'][0]['labels'], [{'id': self.label.id, 'name': 'Label 1'}])
+        self.assertCached(url + '?expand=labels', True)
+
+    # WRITES INVALIDATE THE OWNER'S LISTS
+    def test_writes_invalidate(self):
+        url = reverse('task-list')
+        writes = [
+            lambda: self.client.post(url, {'title': 'Task 2'}, format='json'),
+            lambda: Task.objects.filter(pk=self.task.pk).get().save(),
+            lambda: self.task.labels.remove(self.label),
+            lambda: self.label.task_set.add(self.task),
+            lambda: self.client.post(reverse('task-bulk'), [{'title': 'Task 3'}], format='json'),
+            lambda: self.client.delete(reverse('task-detail', kwargs={'pk': self.task.pk})),
+        ]
+        for write in writes:
+            self.get(url)
+            self.assertCached(url, True)
+            write()
+            self.assertCached(url, False)
+
+    # WRITES IN OTHER PROCESSES INVALIDATE TOO
+    def test_version_bumped_elsewhere_invalidates(self):
+        url = reverse('task-list')
+        self.get(url)
+        self.assertCached(url, True)
+
+        # all another server process's write leaves behind, the rows and the version in the database
+        Task.objects.filter(pk=self.task.pk).update(title='Renamed')
+        CollectionVersion.bump(self.user.id, CollectionVersion.TASKS)
+
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed')
+
+    # LABEL CHANGES INVALIDATE EXPANDED TASK LISTS
+    def test_label_rename_invalidates_tasks(self):
+        url = reverse('task-list') + '?expand=labels'
+        self.get(url)
+
+        self.client.put(reverse('label-detail', kwargs={'pk': self.label.pk}), {'name': 'Renamed'}, format='json')
+
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['labels'][0]['name'], 'Renamed')
+
+    # OTHER USERS' WRITES DON'T
+    def test_other_users_writes_keep_entries(self):
+        url = reverse('label-list')
+        self.get(url)
+
+        stranger = User.objects.create_user(username='stranger', password='12345')
+        Label.objects.create(name='Label 1', owner=stranger)
+
+        self.assertCached(url, True)
+
+    # CONDITIONAL REQUESTS ON HITS
+    def test_hits_answer_conditional_requests(self):
+        url = reverse('label-list')
+        etag = self.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+
+class LRUFileBasedCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = LRUFileBasedCache(directory.name, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}})
+
+    # THE LEAST RECENTLY USED ENTRIES GO FIRST
+    def test_culls_least_recently_used(self):
+        for key in ('a', 'b', 'c', 'd'):
+            self.cache.set(key, key)
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get('a'), 'a')
+        time.sleep(0.01)
+
+        self.cache.set('e', 'e')
+
+        self.assertEqual([key for key in 'abcde' if self.cache.get(key) is not None], ['a', 'd', 'e'])
+        self.assertEqual(self.cache.get('b', 'missing'), 'missing')
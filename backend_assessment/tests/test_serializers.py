@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from tasks.models import Label, Task
+from tasks.serializers import (
+    ExpandedTaskSerializer, LabelSerializer, TaskSerializer,
+    LABEL_VALUES, TASK_VALUES, represent_labels, represent_tasks,
+)
+
+class FastPathParityTest(TestCase):
+    """The .values() fast path must render exactly what the serializers do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.labels = [
+            Label.objects.create(name=name, owner=cls.user)
+            for name in ('Work', 'Ürgent ✓', 'a' * 100)
+        ]
+        cls.tasks = [
+            Task.objects.create(title='Plain', owner=cls.user),
+            Task.objects.create(title='Done', description='Finished', is_completed=True, owner=cls.user),
+            Task.objects.create(title='Ünïcode ✓', description='line\nbreak "quoted"', owner=cls.user),
+            Task.objects.create(title='t' * 200, description='d' * 5000, owner=cls.user),
+        ]
+        cls.tasks[0].labels.set(cls.labels)
+        # added out of id order, output is still sorted by id
+        cls.tasks[2].labels.add(cls.labels[2])
+        cls.tasks[2].labels.add(cls.labels[0])
+
+    def assertSameRepresentation(self, fast, slow):
+        self.assertEqual(fast, slow)
+        # key order matters for clients diffing raw JSON
+        self.assertEqual([list(row) for row in fast], [list(row) for row in slow])
+
+    def task_queryset(self):
+        return Task.objects.filter(owner=self.user).order_by('id')
+
+    def test_task_parity(self):
+        fast = represent_tasks(list(self.task_queryset().values(*TASK_VALUES)))
+        slow = TaskSerializer(self.task_queryset().with_labels(), many=True).data
+        self.assertSameRepresentation(fast, slow)
+
+    def test_expanded_task_parity(self):
+        fast = represent_tasks(list(self.task_queryset().values(*TASK_VALUES)), expand=True)
+        slow = ExpandedTaskSerializer(self.task_queryset().with_labels(expanded=True), many=True).data
+        self.assertSameRepresentation(fast, slow)
+
+    def test_label_parity(self):
+        labels = Label.objects.filter(owner=self.user).order_by('id')
+        fast = represent_labels(list(labels.values(*LABEL_VALUES)))
+        slow = LabelSerializer(labels, many=True).data
+        self.assertSameRepresentation(fast, slow)
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_datetime_parity_outside_utc(self):
+        fast = represent_tasks(list(self.task_queryset().values(*TASK_VALUES)))
+        slow = TaskSerializer(self.task_queryset().with_labels(), many=True).data
+        self.assertEqual([row['updated_at'] for row in fast], [row['updated_at'] for row in slow])
+
+    def test_empty_page(self):
+        self.assertEqual(represent_tasks([]), [])
+        self.assertEqual(represent_labels([]), [])
+
+    def test_label_query_count(self):
+        rows = list(self.task_queryset().values(*TASK_VALUES))
+        with self.assertNumQueries(1):
+            represent_tasks(rows, expand=True)